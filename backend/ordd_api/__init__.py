@@ -1,2 +1,3 @@
 __version__ = "0.25.0"
 MAIL_SUBJECT_PREFIX = "Open Data for Resilience Index"
+default_app_config = 'ordd_api.apps.OrddApiConfig'
@@ -1,12 +1,18 @@
+import os
+from django.conf.urls import url
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+from django.http import FileResponse, Http404
+from django.urls import reverse
+from django.utils.html import format_html
 
 from .models import (
     Profile, OptIn,
     KeyCategory, KeyDatasetName,
     KeyLevel, KeyDataset, KeyTag, KeyTagGroup,
-    Dataset, Url)
+    Dataset, Url, RequestProfile)
+from .profiling import profiling_dir
 
 
 # Define an inline admin descriptor for Employee model
@@ -35,3 +41,46 @@ admin.site.register(KeyDataset)
 
 admin.site.register(Url)
 admin.site.register(Dataset)
+
+
+class RequestProfileAdmin(admin.ModelAdmin):
+    list_display = ('create_time', 'method', 'path', 'query', 'status',
+                    'duration', 'kind', 'trigger', 'user', 'size',
+                    'download')
+    list_filter = ('kind', 'trigger')
+    search_fields = ('path', )
+    readonly_fields = [field.name for field in RequestProfile._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def download(self, obj):
+        return format_html('<a href="{}">{}</a>', reverse(
+            'admin:ordd_api_requestprofile_download', args=[obj.pk]),
+            obj.filename)
+
+    def get_urls(self):
+        return [
+            url(r'^(\d+)/download/$',
+                self.admin_site.admin_view(self.download_view),
+                name='ordd_api_requestprofile_download'),
+        ] + super().get_urls()
+
+    def download_view(self, request, pk):
+        profile = RequestProfile.objects.filter(pk=pk).first()
+        if profile is None or not self.has_change_permission(request,
+                                                             profile):
+            raise Http404()
+        try:
+            fileobj = open(os.path.join(profiling_dir(), profile.filename),
+                           'rb')
+        except OSError:
+            raise Http404()
+        response = FileResponse(fileobj,
+                                content_type='application/octet-stream')
+        response['Content-Disposition'] = (
+            'attachment; filename=%s' % profile.filename)
+        return response
+
+
+admin.site.register(RequestProfile, RequestProfileAdmin)
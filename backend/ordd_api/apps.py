@@ -0,0 +1,10 @@
+from django.apps import AppConfig
+
+
+class OrddApiConfig(AppConfig):
+    name = 'ordd_api'
+
+    def ready(self):
+        # connect signal receivers used to invalidate caches
+        from . import (roles, authentication, catalogue,  # noqa
+                       scoring_cache, country_details, profiling)
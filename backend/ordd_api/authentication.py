@@ -0,0 +1,73 @@
+# authentication.py
+import copy
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .lib.ttl_cache import TTLCache
+from .lib.versioned import SharedVersion
+from .roles import last_login_only
+
+# bumped by the signals below, the other processes drop their entries when
+# they see it changed, so a revoked token or a deactivated user is refused
+# everywhere within ORDD_AUTH_CHECK_INTERVAL seconds
+auth_version = SharedVersion(
+    'ordd_api:auth_version',
+    getattr(settings, 'ORDD_AUTH_CHECK_INTERVAL', 1))
+
+token_cache = TTLCache('auth_token',
+                       getattr(settings, 'ORDD_TOKEN_CACHE_SIZE', 1024),
+                       getattr(settings, 'ORDD_TOKEN_CACHE_TTL', 60),
+                       auth_version)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """Token authentication which keeps resolved tokens in memory, saving
+the token and user query on every authenticated request."""
+
+    def authenticate_credentials(self, key):
+        user, token = token_cache.get_or_build(
+            key, lambda: super(CachedTokenAuthentication,
+                               self).authenticate_credentials(key))
+
+        # each request gets its own instance, so attributes set while
+        # serving it are not shared with other requests
+        user = copy.copy(user)
+        user._state = copy.copy(user._state)
+        return (user, token)
+
+
+def request_user(request):
+    """User of the django 'request' as authenticated by the API views, for
+the middlewares which need it before the view; None if the credentials
+are refused."""
+    api_request = Request(request, authenticators=[
+        authentication()
+        for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        return api_request.user
+    except APIException:
+        return None
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def token_changed(sender, instance, **kwargs):
+    token_cache.delete(instance.key)
+    auth_version.bump_on_commit(kwargs.get('using'))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def token_user_changed(sender, instance, **kwargs):
+    if last_login_only(kwargs):
+        return
+    # deactivation, password or profile changes are seen by next request
+    token_cache.delete_if(lambda key, value: value[0].pk == instance.pk)
+    auth_version.bump_on_commit(kwargs.get('using'))
@@ -0,0 +1,71 @@
+# bootstrap.py
+import json
+from django.db.models import Prefetch
+
+from .catalogue import catalogue_version
+from .lib.payload import Payload
+from .lib.versioned import VersionedValue
+from .models import (Region, Country, KeyCategory, KeyDatasetName,
+                     KeyTagGroup, KeyTag, KeyLevel, KeyDataset)
+
+# version of the payload layout, increase it on incompatible changes
+BOOTSTRAP_FORMAT = 1
+
+
+def catalogue_data():
+    """Return the whole reference catalogue.
+
+Levels, categories and dataset names are referred by id, as in the
+keydataset/... urls, regions, tag groups and tags by name."""
+    tags = KeyTag.objects.order_by('pk')
+    keydatasets = KeyDataset.objects.select_related(
+        'tag_available').prefetch_related(
+            Prefetch('applicability', queryset=tags)).order_by('pk')
+    tag_groups = KeyTagGroup.objects.prefetch_related(
+        Prefetch('tags', queryset=tags)).order_by('pk')
+
+    return {
+        'format': BOOTSTRAP_FORMAT,
+        'regions': list(Region.objects.order_by('pk').values_list(
+            'name', flat=True)),
+        'countries': [
+            {'iso2': iso2, 'name': name, 'region': region}
+            for iso2, name, region in Country.objects.order_by(
+                'name').values_list('iso2', 'name', 'region__name')],
+        'levels': list(KeyLevel.objects.order_by('pk').values(
+            'id', 'name')),
+        'categories': list(KeyCategory.objects.order_by('pk').values(
+            'id', 'code', 'name', 'weight')),
+        'datasets': list(KeyDatasetName.objects.order_by('pk').values(
+            'id', 'name', 'category')),
+        'tag_groups': [
+            {'name': group.name,
+             'tags': [tag.name for tag in group.tags.all()]}
+            for group in tag_groups],
+        'perils': list(KeyTag.objects.filter(is_peril=True).order_by(
+            'name').values_list('name', flat=True)),
+        'keydatasets': [
+            {'code': keydataset.code,
+             'level': keydataset.level_id,
+             'category': keydataset.category_id,
+             'dataset': keydataset.dataset_id,
+             'description': keydataset.description,
+             'tag_available': (keydataset.tag_available.name
+                               if keydataset.tag_available else None),
+             'applicability': [tag.name for tag in
+                               keydataset.applicability.all()],
+             'resolution': keydataset.resolution,
+             'format': keydataset.format,
+             'comment': keydataset.comment,
+             'weight': keydataset.weight}
+            for keydataset in keydatasets],
+    }
+
+
+def build_bootstrap():
+    content = json.dumps(catalogue_data(), separators=(',', ':'),
+                         ensure_ascii=False)
+    return Payload(content.encode('utf-8'), 'application/json')
+
+
+bootstrap = VersionedValue(catalogue_version, build_bootstrap)
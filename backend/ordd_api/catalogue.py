@@ -0,0 +1,70 @@
+# catalogue.py
+from django.conf import settings
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from rest_framework import status
+from rest_framework.renderers import BrowsableAPIRenderer
+
+from .lib.payload import Payload
+from .lib.versioned import SharedVersion, VersionedValue
+from .metrics import count_lookup
+from .recompute import enqueue_recompute
+from .models import (Region, Country, KeyCategory, KeyDatasetName,
+                     KeyTagGroup, KeyTag, KeyLevel, KeyDataset)
+
+# reference tables, they change only when the load_* commands run
+CATALOGUE_MODELS = (Region, Country, KeyCategory, KeyDatasetName,
+                    KeyTagGroup, KeyTag, KeyLevel, KeyDataset)
+
+catalogue_version = SharedVersion(
+    'ordd_api:catalogue_version',
+    getattr(settings, 'ORDD_CATALOGUE_CHECK_INTERVAL', 1))
+
+
+def catalogue_changed(sender, **kwargs):
+    catalogue_version.bump_on_commit(kwargs.get('using'))
+    # every scoring depends on the catalogue
+    enqueue_recompute(using=kwargs.get('using'))
+
+
+for model in CATALOGUE_MODELS:
+    post_save.connect(catalogue_changed, sender=model,
+                      dispatch_uid='catalogue_save_%s' % model.__name__)
+    post_delete.connect(catalogue_changed, sender=model,
+                        dispatch_uid='catalogue_delete_%s' % model.__name__)
+for through in (Country.thinkhazard_appl.through,
+                KeyDataset.applicability.through):
+    m2m_changed.connect(catalogue_changed, sender=through,
+                        dispatch_uid='catalogue_m2m_%s' % through.__name__)
+
+# rendered responses of the reference views, by path and format
+rendered_catalogue = VersionedValue(catalogue_version, dict)
+RENDERED_CATALOGUE_SIZE = 1024
+
+
+class RenderedCatalogueMixin(object):
+    """Mixin for the read only views of the reference catalogue: a rendered
+response body is kept in memory per path and format and served again
+until the catalogue changes."""
+
+    def get(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if isinstance(renderer, BrowsableAPIRenderer):
+            # rendered per user
+            return super().get(request, *args, **kwargs)
+
+        rendered = rendered_catalogue.get()
+        key = (request.path, renderer.format)
+        payload = rendered.get(key)
+        count_lookup('rendered_catalogue', payload is not None)
+        if payload is None:
+            response = super().get(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            response.accepted_renderer = renderer
+            response.accepted_media_type = request.accepted_media_type
+            response.renderer_context = self.get_renderer_context()
+            payload = Payload(response.rendered_content,
+                              response['Content-Type'])
+            if len(rendered) < RENDERED_CATALOGUE_SIZE:
+                rendered[key] = payload
+        return payload.response(request)
@@ -0,0 +1,142 @@
+# country_details.py
+from django.db.models import F
+from django.db.models.signals import (pre_save, post_save, post_delete,
+                                      m2m_changed)
+from django.dispatch import receiver
+from django.http import Http404
+from django.utils import timezone
+
+from .catalogue import catalogue_version
+from .models import Country, CountryDetails, Dataset
+from .metrics import count_lookup, metrics
+from .recompute import background_enabled, enqueue_recompute
+from .renderers import FastJSONRenderer
+from .scoring_cache import SCORING_SERVE_STALE, scoring_flight
+
+
+def materialized_country_details(country, compute):
+    """Return the rendered unfiltered scoring details of 'country' (iso2)
+from its materialized row and their computation time, 'compute()' builds
+them again when they are missing or stale.
+
+A single process builds them (see 'ordd_api.scoring_cache'), the others
+serve the stale details if any, otherwise wait for them. With
+ORDD_SCORING_BACKGROUND stale details are served as they are, the
+'recompute_scores' command builds them again."""
+    details = _country_details(country)
+    version = catalogue_version.get()
+    valid = _valid(details, version)
+    count_lookup('country_details', valid)
+    if valid or (details.payload is not None and background_enabled()):
+        return details.payload.encode('utf-8'), details.update_time
+
+    revision = details.revision
+
+    def fresh():
+        current = CountryDetails.objects.filter(pk=details.pk).first()
+        if current is not None and _valid(current, version):
+            return current.payload.encode('utf-8'), current.update_time
+        return None
+
+    def stale():
+        if details.payload is None:
+            return None
+        return details.payload.encode('utf-8'), details.update_time
+
+    result, outcome = scoring_flight.run(
+        'country_details:%s:%d:%s' % (country, revision, version),
+        lambda: _store(details, compute, version), fresh,
+        stale if SCORING_SERVE_STALE else None)
+    metrics.inc('ordd_single_flight_total', ('country_details', outcome))
+    return result
+
+
+def refresh_country_details(country, compute):
+    """Build again the details of 'country' (iso2), as
+'materialized_country_details' returns them."""
+    return _store(_country_details(country), compute,
+                  catalogue_version.get())
+
+
+def _country_details(country):
+    details = CountryDetails.objects.filter(country__iso2=country).first()
+    if details is None:
+        country_obj = Country.objects.filter(iso2=country).first()
+        if country_obj is None:
+            raise Http404()
+        details, _ = CountryDetails.objects.get_or_create(
+            country=country_obj)
+    return details
+
+
+def _store(details, compute, version):
+    revision = details.revision
+    payload = FastJSONRenderer().render(compute())
+    now = timezone.now()
+    # stored only if the datasets of the country didn't change in the
+    # meantime, otherwise the next request computes them again
+    CountryDetails.objects.filter(
+        pk=details.pk, revision=revision).update(
+            payload=payload.decode('utf-8'), payload_revision=revision,
+            catalogue_version=version, update_time=now)
+    return payload, now
+
+
+def _valid(details, version):
+    return (details.payload is not None and
+            details.payload_revision == details.revision and
+            details.catalogue_version == version)
+
+
+def invalidate_country_details(countries=None, using=None):
+    """Mark as stale the details of 'countries' (ids), of all the countries
+if None."""
+    queryset = CountryDetails.objects.using(using)
+    if countries is not None:
+        queryset = queryset.filter(country_id__in=countries)
+    queryset.update(revision=F('revision') + 1)
+    enqueue_recompute(countries, using)
+
+
+@receiver(pre_save, sender=Dataset)
+def dataset_moving(sender, instance, raw, **kwargs):
+    # a dataset moved to another country changes both of them
+    if instance.pk is not None and not raw:
+        instance._ordd_previous_country = Dataset.objects.filter(
+            pk=instance.pk).values_list('country_id', flat=True).first()
+
+
+@receiver(post_save, sender=Dataset)
+@receiver(post_delete, sender=Dataset)
+def dataset_changed(sender, instance, **kwargs):
+    countries = {instance.country_id,
+                 getattr(instance, '_ordd_previous_country', None)}
+    countries.discard(None)
+    invalidate_country_details(countries)
+
+
+@receiver(m2m_changed, sender=Dataset.tag.through)
+def dataset_tags_changed(sender, instance, action, reverse, pk_set,
+                         **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_country_details([instance.country_id])
+    elif pk_set is None:
+        invalidate_country_details()
+    else:
+        invalidate_country_details(set(Dataset.objects.filter(
+            pk__in=pk_set).values_list('country_id', flat=True)))
+
+
+@receiver(m2m_changed, sender=Country.thinkhazard_appl.through)
+def country_applicability_changed(sender, instance, action, reverse, pk_set,
+                                  **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        invalidate_country_details([instance.pk])
+    elif pk_set is None:
+        invalidate_country_details()
+    else:
+        invalidate_country_details(pk_set)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""Measure requests per second and latency of GET requests against a
+running instance of the api, e.g. one started with:
+
+  gunicorn -w 4 ordd.wsgi
+
+  ordd_api/helpers/http_bench.py -c 8 -d 10 \\
+      http://localhost:8000/api/country/ http://localhost:8000/api/region/
+
+See also the 'load_test' management command, replaying a mix of the
+frontend requests against gunicorn on a database with synthetic datasets.
+"""
+import argparse
+import bisect
+import http.client
+import itertools
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class Client(threading.Thread):
+    """Send GET requests until 'deadline', the path of each one is returned
+by 'next_path' as (label, path) and the latencies are kept by label."""
+
+    def __init__(self, netloc, deadline, headers, next_path):
+        super().__init__(daemon=True)
+        self.netloc = netloc
+        self.deadline = deadline
+        self.headers = headers
+        self.next_path = next_path
+        self.latencies = {}
+        self.errors = {}
+        self.bytes = 0
+        self.connection = None
+
+    def request(self, path):
+        if self.connection is None:
+            self.connection = http.client.HTTPConnection(self.netloc)
+        self.connection.request('GET', path, headers=self.headers)
+        response = self.connection.getresponse()
+        body = response.read()
+        if response.getheader('Connection', '').lower() == 'close':
+            self.connection.close()
+            self.connection = None
+        return response.status, len(body)
+
+    def run(self):
+        while time.monotonic() < self.deadline:
+            label, path = self.next_path()
+            start = time.monotonic()
+            try:
+                status, size = self.request(path)
+            except (OSError, http.client.HTTPException):
+                self.errors[label] = self.errors.get(label, 0) + 1
+                self.connection = None
+                continue
+            if status >= 400:
+                self.errors[label] = self.errors.get(label, 0) + 1
+                continue
+            self.latencies.setdefault(label, []).append(
+                time.monotonic() - start)
+            self.bytes += size
+
+
+def run_clients(netloc, concurrency, duration, headers, next_paths):
+    """Run 'concurrency' clients for 'duration' seconds, 'next_paths(i)'
+returns the 'next_path' function of the i-th client; return the clients
+and the elapsed time."""
+    deadline = time.monotonic() + duration
+    clients = [Client(netloc, deadline, headers, next_paths(i))
+               for i in range(concurrency)]
+    start = time.monotonic()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    return clients, time.monotonic() - start
+
+
+def summary(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'rps': len(latencies) / elapsed,
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def bench(url, concurrency, duration, headers):
+    split = urlsplit(url)
+    path = split.path + ('?' + split.query if split.query else '')
+    clients, elapsed = run_clients(
+        split.netloc, concurrency, duration, headers,
+        lambda i: lambda: (url, path))
+
+    result = summary([latency for client in clients
+                      for latency in client.latencies.get(url, ())],
+                     sum(client.errors.get(url, 0) for client in clients),
+                     elapsed)
+    result.update(url=url, bytes=sum(client.bytes for client in clients))
+    return result
+
+
+def bench_mix(base_url, mix, concurrency, duration, headers, seed=0):
+    """Replay a mix of requests: 'mix' is a list of (label, weight, paths),
+each request picks a label by weight then one of its paths, relative to
+'base_url'. The choices of each client are reproducible from 'seed'.
+Return the summary of all the requests and the one of each label."""
+    split = urlsplit(base_url)
+    labels = [label for label, _, _ in mix]
+    weights = list(itertools.accumulate(weight for _, weight, _ in mix))
+    paths = {label: [split.path + path for path in label_paths]
+             for label, _, label_paths in mix}
+
+    def next_paths(i):
+        rng = random.Random('%s-%d' % (seed, i))
+
+        def next_path():
+            label = labels[bisect.bisect(weights, rng.random() * weights[-1])]
+            return label, rng.choice(paths[label])
+        return next_path
+
+    clients, elapsed = run_clients(split.netloc, concurrency, duration,
+                                   headers, next_paths)
+    results = {'all': summary(
+        [latency for client in clients
+         for latencies in client.latencies.values()
+         for latency in latencies],
+        sum(sum(client.errors.values()) for client in clients), elapsed)}
+    for label in labels:
+        results[label] = summary(
+            [latency for client in clients
+             for latency in client.latencies.get(label, ())],
+            sum(client.errors.get(label, 0) for client in clients), elapsed)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('url', nargs='+', help='urls to benchmark')
+    parser.add_argument('-c', '--concurrency', type=int, default=4,
+                        help='number of concurrent clients')
+    parser.add_argument('-d', '--duration', type=float, default=10,
+                        help='seconds spent on each url')
+    parser.add_argument('-H', '--header', action='append', default=[],
+                        help='extra request header, "Name: value"')
+    args = parser.parse_args()
+
+    headers = dict(header.split(':', 1) for header in args.header)
+    headers = {name.strip(): value.strip()
+               for name, value in headers.items()}
+
+    print('%-50s %9s %7s %9s %8s %8s %8s' % (
+        'url', 'req/s', 'errors', 'kB/req', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for url in args.url:
+        result = bench(url, args.concurrency, args.duration, headers)
+        print('%-50s %9.1f %7d %9.1f %8.1f %8.1f %8.1f' % (
+            result['url'], result['rps'], result['errors'],
+            (result['bytes'] / result['requests'] / 1024
+             if result['requests'] else 0),
+            result['p50'], result['p95'], result['p99']))
+
+
+if __name__ == '__main__':
+    main()
@@ -119,3 +119,14 @@ class KeyDataset4on4Serializer(serializers.ModelSerializer):
         model = KeyDataset
         fields = ('code', 'level', 'category', 'dataset', 'description',
                   'tag_available', 'applicability')
+
+    @staticmethod
+    def setup_eager_loading(queryset, prefix=''):
+        """Load with 'queryset' the related objects read by the serializer,
+'prefix' is the lookup path from the queried model to the key datasets."""
+        return queryset.select_related(
+            *[prefix + field for field in (
+                'level', 'category', 'dataset', 'tag_available')]
+            ).prefetch_related(
+                *[prefix + field for field in (
+                    'tag_available__tags', 'applicability')])
@@ -1,5 +1,4 @@
 # keydatasets_views.py
-from rest_framework import generics
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.exceptions import NotFound
@@ -8,117 +7,64 @@ from rest_framework.exceptions import NotFound
 # import django_filters.rest_framework
 # from .permissions import IsOwner
 
-from .keydatasets_serializers import (
-    KeyDataset0on4Serializer, KeyDataset1on4Serializer,
-    KeyDataset2on4Serializer, KeyDataset3on4Serializer,
-    KeyDataset4on4Serializer, KeyTagByGroupSerializer,
-)
-from .models import KeyDataset, KeyTag, KeyTagGroup
+from .catalogue import RenderedCatalogueMixin
+from .taxonomy import taxonomy
 
+# key datasets are served from the in memory taxonomy index, rebuilt when
+# the catalogue changes, so these views don't query the database
 
-class KeyDataset0on4ListView(generics.ListAPIView):
-    """This class handles the GET and POSt requests of our rest api."""
-    queryset = (KeyDataset.objects.all().order_by("level")
-                .distinct("level"))
-    serializer_class = KeyDataset0on4Serializer
 
+class KeyDataset0on4ListView(APIView):
+    """This class handles the GET requests of our rest api."""
 
-class KeyDataset1on4ListView(generics.ListAPIView):
-    """This class handles the GET and POSt requests of our rest api."""
-    serializer_class = KeyDataset1on4Serializer
-
-    def get_queryset(self):
-        level = self.kwargs['level']
-
-        filters = {}
-        if level > '0':
-            filters['level'] = level
-
-        return (KeyDataset.objects.filter(**filters).
-                order_by("category").distinct("category"))
-
-
-class KeyDataset2on4ListView(generics.ListAPIView):
-    """This class handles the GET and POSt requests of our rest api."""
-    serializer_class = KeyDataset2on4Serializer
-
-    def get_queryset(self):
-        level = self.kwargs['level']
-        category = self.kwargs['category']
-
-        filters = {}
-        if level > '0':
-            filters['level'] = level
-        if category > '0':
-            filters['category'] = category
-
-        return (KeyDataset.objects.filter(**filters)
-                .order_by("dataset").distinct("dataset"))
+    def get(self, request, format=None):
+        return Response(taxonomy.get().levels())
 
 
-class KeyDataset3on4ListView(generics.ListAPIView):
-    """This class handles the GET and POSt requests of our rest api."""
-    serializer_class = KeyDataset3on4Serializer
+class KeyDataset1on4ListView(APIView):
+    """This class handles the GET requests of our rest api."""
 
-    def get_queryset(self):
-        level = self.kwargs['level']
-        category = self.kwargs['category']
-        dataset = self.kwargs['dataset']
+    def get(self, request, level, format=None):
+        return Response(taxonomy.get().categories(level))
 
-        filters = {}
-        if level > '0':
-            filters['level'] = level
-        if category > '0':
-            filters['category'] = category
-        if dataset > '0':
-            filters['dataset'] = dataset
 
-        qs = KeyDataset.objects.filter(**filters).order_by(
-            "description")
+class KeyDataset2on4ListView(APIView):
+    """This class handles the GET requests of our rest api."""
 
-        return qs
+    def get(self, request, level, category, format=None):
+        return Response(taxonomy.get().datasets(level, category))
 
 
-class KeyDataset4on4ListView(generics.ListAPIView):
-    """This class handles the GET and POSt requests of our rest api."""
-    serializer_class = KeyDataset4on4Serializer
+class KeyDataset3on4ListView(APIView):
+    """This class handles the GET requests of our rest api."""
 
-    def get_queryset(self):
-        level = self.kwargs['level']
-        category = self.kwargs['category']
-        dataset = self.kwargs['dataset']
-        code = self.kwargs['code']
+    def get(self, request, level, category, dataset, format=None):
+        return Response(taxonomy.get().descriptions(level, category,
+                                                    dataset))
 
-        filters = {}
-        if level > '0':
-            filters['level'] = level
-        if category > '0':
-            filters['category'] = category
-        if dataset > '0':
-            filters['dataset'] = dataset
-        filters['code'] = code
 
-        qs = KeyDataset.objects.filter(**filters)
+class KeyDataset4on4ListView(APIView):
+    """This class handles the GET requests of our rest api."""
 
-        if len(qs) != 1:
+    def get(self, request, level, category, dataset, code, format=None):
+        keydataset = taxonomy.get().keydataset(level, category, dataset,
+                                               code)
+        if keydataset is None:
             raise NotFound('key not found')
 
-        return qs
+        return Response([keydataset])
 
 
-class KeyDatasetTagGroup(APIView):
+class KeyDatasetTagGroup(RenderedCatalogueMixin, APIView):
     """This class handles the GET requests of our rest api."""
 
-    def get_queryset(self):
-        return list(KeyTagGroup.objects.values_list('name', flat=True))
-
-    def get(self, request):
-        return Response({'tags': self.get_queryset()})
+    def get(self, request, format=None):
+        return Response({'tags': taxonomy.get().tag_group_names()})
 
 
-class KeyDatasetTag(generics.ListAPIView):
-    """This class handles the GET and POSt requests of our rest api."""
-    serializer_class = KeyTagByGroupSerializer
+class KeyDatasetTag(RenderedCatalogueMixin, APIView):
+    """This class handles the GET requests of our rest api."""
 
-    def get_queryset(self):
-        return KeyTagGroup.objects.filter(name=self.kwargs['group'])
+    def get(self, request, group, format=None):
+        tag_group = taxonomy.get().tag_group(group)
+        return Response([tag_group] if tag_group is not None else [])
@@ -0,0 +1,197 @@
+import codecs
+import gzip
+import json
+import time
+from contextlib import contextmanager
+
+from django.core.management.color import no_style
+from django.db import connections, router
+from django.db.models import Case, Value, When
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def open_text(filename, mode='r'):
+    """Open a utf-8 text file, transparently (de)compressing it when the
+name ends with '.gz'."""
+    if filename.endswith('.gz'):
+        return gzip.open(filename, mode + 't', encoding='utf-8')
+    return codecs.open(filename, mode + 'b', encoding='utf-8')
+
+
+def iter_json_array(stream, chunk_size=READ_CHUNK_SIZE):
+    """Yield the items of the top level JSON array read from 'stream'.
+
+Only the item currently parsed and the unparsed tail of the last read
+chunk are kept in memory, so dumps of any size can be processed."""
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    is_eof = False
+
+    def skip_blanks(buf, pos):
+        while pos < len(buf) and buf[pos] in ' \t\r\n':
+            pos += 1
+        return pos
+
+    def read_more(buf, pos):
+        chunk = stream.read(chunk_size)
+        return buf[pos:] + chunk, 0, chunk == ''
+
+    while True:
+        pos = skip_blanks(buf, pos)
+        if pos < len(buf) or is_eof:
+            break
+        buf, pos, is_eof = read_more(buf, pos)
+
+    if pos >= len(buf):
+        return
+    if buf[pos] != '[':
+        raise ValueError('JSON dump must be an array of objects')
+    pos += 1
+
+    expect_item = True
+    while True:
+        pos = skip_blanks(buf, pos)
+        if pos >= len(buf):
+            if is_eof:
+                raise ValueError('Unexpected end of JSON dump')
+            buf, pos, is_eof = read_more(buf, pos)
+            continue
+
+        if buf[pos] == ']':
+            return
+        if buf[pos] == ',':
+            if expect_item:
+                raise ValueError('Unexpected \',\' in JSON dump')
+            expect_item = True
+            pos += 1
+            continue
+
+        try:
+            item, end = decoder.raw_decode(buf, pos)
+        except ValueError:
+            # the item is split across chunks, read on and retry
+            if is_eof:
+                raise
+            buf, pos, is_eof = read_more(buf, pos)
+            continue
+        following = skip_blanks(buf, end)
+        if not is_eof and (following == len(buf) or
+                           buf[following] not in ',]'):
+            # complete only if followed by a delimiter, a number may go on
+            # in the next chunk
+            buf, pos, is_eof = read_more(buf, pos)
+            continue
+
+        yield item
+        expect_item = False
+        pos = end
+        if pos > chunk_size:
+            buf, pos = buf[pos:], 0
+
+
+@contextmanager
+def suspend_auto_now(*models):
+    """Disable 'auto_now' and 'auto_now_add' of date fields of 'models' so
+bulk inserted rows keep the timestamps read from the source."""
+    suspended = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            auto_now = getattr(field, 'auto_now', False)
+            auto_now_add = getattr(field, 'auto_now_add', False)
+            if auto_now or auto_now_add:
+                suspended.append((field, auto_now, auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in suspended:
+            field.auto_now = auto_now
+            field.auto_now_add = auto_now_add
+
+
+def reset_sequences(models, using):
+    """Realign primary key sequences after rows have been inserted with
+explicit ids."""
+    connection = connections[using]
+    sql_list = connection.ops.sequence_reset_sql(no_style(), models)
+    if sql_list:
+        with connection.cursor() as cursor:
+            for sql in sql_list:
+                cursor.execute(sql)
+
+
+def bulk_insert(model, objs, batch_size=None, using=None):
+    """Insert 'objs' making sure each one gets its primary key back: rows
+are inserted in bulk where the backend returns the new ids, one by one
+otherwise."""
+    if using is None:
+        using = router.db_for_write(model)
+    if (connections[using].features.can_return_ids_from_bulk_insert or
+            all(obj.pk is not None for obj in objs)):
+        return model._base_manager.using(using).bulk_create(
+            objs, batch_size=batch_size)
+
+    # inserted as bulk_create does, without signals
+    manager = model._base_manager.using(using)
+    fields = [field for field in model._meta.concrete_fields
+              if field is not model._meta.auto_field]
+    for obj in objs:
+        obj.pk = manager._insert([obj], fields=fields, return_id=True)
+        obj._state.adding = False
+        obj._state.db = using
+    return objs
+
+
+def bulk_update(model, objs, fields, using=None):
+    """Write 'fields' of 'objs' with one query for each batch of objects the
+backend accepts, the values are selected by primary key."""
+    if not objs:
+        return
+    if using is None:
+        using = router.db_for_write(model)
+    fields = [model._meta.get_field(name) for name in fields]
+    connection = connections[using]
+    # each object takes the parameters of a 'when' for each field
+    batch_size = max(1, connection.ops.bulk_batch_size(
+        ['pk', 'pk'] + fields, objs))
+    manager = model._base_manager.using(using)
+    for start in range(0, len(objs), batch_size):
+        batch = objs[start:start + batch_size]
+        values = {}
+        for field in fields:
+            values[field.attname] = Case(*[
+                When(pk=obj.pk, then=Value(getattr(obj, field.attname),
+                                           output_field=field))
+                for obj in batch], output_field=field)
+        manager.filter(pk__in=[obj.pk for obj in batch]).update(**values)
+
+
+class Throughput(object):
+    """Counter of processed items which reports progress every 'step'
+items through the 'write' callable."""
+
+    def __init__(self, write, step):
+        self.write = write
+        self.step = step
+        self.count = 0
+        self.start = time.time()
+
+    def elapsed(self):
+        return time.time() - self.start
+
+    def rate(self):
+        elapsed = self.elapsed()
+        return self.count / elapsed if elapsed > 0 else 0.0
+
+    def add(self, n=1):
+        prev = self.count
+        self.count += n
+        if self.step and prev // self.step != self.count // self.step:
+            self.write('%d objects processed (%.1f objects/s)' % (
+                self.count, self.rate()))
+
+    def summary(self):
+        return '%d objects in %.2f s (%.1f objects/s)' % (
+            self.count, self.elapsed(), self.rate())
@@ -0,0 +1,69 @@
+"""Line oriented format used by 'export_datasets' and 'import_datasets'.
+
+The first line is a header describing the format and the order of the
+fields, every other line is a json array with the values of one dataset.
+Related objects are referenced by natural key so the dump can be loaded
+in a database with different ids."""
+from django.utils.dateparse import parse_datetime
+
+FORMAT_NAME = 'ordd-datasets'
+FORMAT_VERSION = 1
+
+BOOLEAN_FIELDS = (
+    'is_reviewed', 'is_existing', 'is_digital_form', 'is_avail_online',
+    'is_avail_online_meta', 'is_bulk_avail', 'is_machine_read',
+    'is_pub_available', 'is_avail_for_free', 'is_open_licence',
+    'is_prov_timely')
+
+TEXT_FIELDS = (
+    'notes', 'is_existing_txt', 'is_machine_read_txt', 'is_open_licence_txt',
+    'is_prov_timely_last')
+
+DATETIME_FIELDS = ('review_date', 'create_time', 'modify_time')
+
+FIELDS = (('id', 'owner', 'changed_by', 'country', 'keydataset', 'url',
+           'tag') + BOOLEAN_FIELDS + TEXT_FIELDS + DATETIME_FIELDS)
+
+
+def header():
+    return {'format': FORMAT_NAME, 'version': FORMAT_VERSION,
+            'fields': FIELDS}
+
+
+def check_header(head):
+    if (not isinstance(head, dict) or head.get('format') != FORMAT_NAME or
+            head.get('version') != FORMAT_VERSION):
+        raise ValueError('not a %s version %d dump' % (
+            FORMAT_NAME, FORMAT_VERSION))
+    return head['fields']
+
+
+def dataset_to_record(dataset):
+    """Serialize a dataset, 'country', 'keydataset', 'owner' and
+'changed_by' must be selected and 'url' and 'tag__group' prefetched."""
+    values = {
+        'id': dataset.pk,
+        'owner': dataset.owner.username,
+        'changed_by': (dataset.changed_by.username
+                       if dataset.changed_by_id else None),
+        'country': dataset.country.natural_key(),
+        'keydataset': dataset.keydataset.natural_key(),
+        'url': [url.natural_key() for url in dataset.url.all()],
+        'tag': [tag.natural_key() for tag in dataset.tag.all()],
+    }
+    for field in BOOLEAN_FIELDS + TEXT_FIELDS:
+        values[field] = getattr(dataset, field)
+    for field in DATETIME_FIELDS:
+        value = getattr(dataset, field)
+        values[field] = value.isoformat() if value else None
+
+    return [values[field] for field in FIELDS]
+
+
+def record_to_values(fields, record):
+    """Map a record on field names parsing the datetime values."""
+    values = dict(zip(fields, record))
+    for field in DATETIME_FIELDS:
+        if values.get(field):
+            values[field] = parse_datetime(values[field])
+    return values
@@ -0,0 +1,192 @@
+"""Detection of repeated sql queries (the N+1 pattern), used by the
+NPlusOneMiddleware of 'ordd_api.middleware' and by the tests.
+
+The executed statements are grouped by their normalized form, where
+literals and parameter lists are replaced by placeholders, so the queries
+differing only by the row they fetch fall in the same group; a group
+executed more than a threshold is reported with the python call sites it
+was executed from and optionally with its query plan."""
+import os
+import re
+import sys
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+import django
+from django.db import transaction
+from django.db.backends.utils import CursorWrapper
+
+_string_re = re.compile(r"'(?:[^']|'')*'")
+_number_re = re.compile(r'\b\d+(?:\.\d+)?\b')
+_in_re = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_space_re = re.compile(r'\s+')
+
+# frames of the standard library, of the installed packages and of the
+# cursor wrappers are skipped looking for the call site
+_library_dirs = (os.path.dirname(os.__file__),
+                 os.path.dirname(os.path.dirname(django.__file__)))
+_wrapper_modules = (__name__, 'ordd_api.lib.timing')
+
+
+def normalize(sql):
+    """Shape of the statement 'sql', without literals and with the lists
+of parameters collapsed."""
+    sql = _string_re.sub('?', sql)
+    sql = _number_re.sub('?', sql)
+    sql = _in_re.sub('IN (...)', sql)
+    return _space_re.sub(' ', sql).strip()
+
+
+def call_site():
+    """Innermost frame of the application code executing the query, as
+'ordd_api/views.py:1025 in dataset'."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if (frame.f_globals.get('__name__') not in _wrapper_modules and
+                not filename.startswith(_library_dirs)):
+            return '%s:%d in %s' % (
+                os.path.join(*filename.split(os.sep)[-2:]), frame.f_lineno,
+                frame.f_code.co_name)
+        frame = frame.f_back
+    return '?'
+
+
+class QueryGroup(object):
+    """Executions of the statements with the same normalized form."""
+
+    __slots__ = ('statement', 'alias', 'count', 'duration', 'sql', 'params',
+                 'call_sites', 'plan')
+
+    def __init__(self, statement, alias, sql, params):
+        self.statement = statement
+        self.alias = alias
+        self.count = 0
+        self.duration = 0.0
+        # the first execution, to explain it
+        self.sql = sql
+        self.params = params
+        self.call_sites = Counter()
+        self.plan = None
+
+    def __str__(self):
+        lines = ['%d x %s (%.1f ms)' % (self.count, self.statement,
+                                        self.duration * 1000)]
+        lines.extend('    from %s (%d)' % item
+                     for item in self.call_sites.most_common())
+        if self.plan:
+            lines.extend('    plan: %s' % row for row in self.plan)
+        return '\n'.join(lines)
+
+
+class QueryGroups(object):
+    """Executed statements grouped by normalized form."""
+
+    def __init__(self):
+        self.groups = OrderedDict()
+
+    def add(self, alias, sql, params, duration):
+        statement = normalize(sql)
+        group = self.groups.get((alias, statement))
+        if group is None:
+            group = self.groups[(alias, statement)] = QueryGroup(
+                statement, alias, sql, params)
+        group.count += 1
+        group.duration += duration
+        group.call_sites[call_site()] += 1
+
+    def repeated(self, threshold, ignore=None):
+        """Groups executed more than 'threshold' times, the most executed
+first; 'ignore' is a compiled regular expression of the statements or
+call sites to leave out."""
+        groups = []
+        for group in self.groups.values():
+            if group.count <= threshold:
+                continue
+            if ignore is not None and (
+                    ignore.search(group.statement) or
+                    any(ignore.search(site) for site in group.call_sites)):
+                continue
+            groups.append(group)
+        return sorted(groups, key=lambda group: -group.count)
+
+
+class RepeatedQueries(Exception):
+    """Raised when repeated queries are found and they must fail the
+request, see ORDD_NPLUSONE_RAISE."""
+
+    def __init__(self, groups):
+        self.groups = groups
+        super(RepeatedQueries, self).__init__(
+            'repeated queries:\n' + '\n'.join(str(group) for group in groups))
+
+
+class GroupingCursorWrapper(CursorWrapper):
+    """Cursor adding the queries it executes to 'groups'."""
+
+    def __init__(self, cursor, db, groups):
+        super(GroupingCursorWrapper, self).__init__(cursor, db)
+        self.groups = groups
+
+    def execute(self, sql, params=None):
+        start = time.perf_counter()
+        try:
+            return super(GroupingCursorWrapper, self).execute(sql, params)
+        finally:
+            self.groups.add(self.db.alias, sql, params,
+                            time.perf_counter() - start)
+
+    def executemany(self, sql, param_list):
+        start = time.perf_counter()
+        try:
+            return super(GroupingCursorWrapper, self).executemany(
+                sql, param_list)
+        finally:
+            self.groups.add(self.db.alias, sql, None,
+                            time.perf_counter() - start)
+
+
+@contextmanager
+def group_queries(connections):
+    """Group the queries executed on the database 'connections' while in
+the block, yield the QueryGroups.
+
+The cursors already wrapped (e.g. by 'ordd_api.lib.timing') are wrapped
+again and restored on exit."""
+    groups = QueryGroups()
+    saved = []
+    for connection in connections:
+        for name in ('make_cursor', 'make_debug_cursor'):
+            saved.append((connection, name, connection.__dict__.get(name)))
+            make = getattr(connection, name)
+            setattr(connection, name,
+                    lambda cursor, make=make, connection=connection:
+                    GroupingCursorWrapper(make(cursor), connection, groups))
+    try:
+        yield groups
+    finally:
+        for connection, name, previous in saved:
+            if previous is None:
+                connection.__dict__.pop(name, None)
+            else:
+                setattr(connection, name, previous)
+
+
+def explain(connection, group):
+    """Set the query plan of the first execution of 'group', best effort:
+statements that can't be explained are left without."""
+    if group.params is None or not group.sql.lstrip().upper().startswith(
+            'SELECT'):
+        return
+    prefix = ('EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite'
+              else 'EXPLAIN ')
+    try:
+        # in a savepoint, a failure must not break the transaction
+        with transaction.atomic(using=connection.alias), \
+                connection.cursor() as cursor:
+            cursor.execute(prefix + group.sql, group.params)
+            group.plan = [' '.join(str(value) for value in row)
+                          for row in cursor.fetchall()]
+    except Exception:
+        group.plan = None
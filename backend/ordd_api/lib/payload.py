@@ -0,0 +1,59 @@
+import gzip
+import hashlib
+import re
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+accept_encoding_re = re.compile(
+    r'\s*([^\s;,]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?\s*(?:,|$)')
+
+
+def accepted_encodings(header):
+    """Return the set of content codings accepted by the client, parsing an
+Accept-Encoding 'header' (codings with q=0 are excluded)."""
+    encodings = set()
+    for coding, quality in accept_encoding_re.findall(header):
+        try:
+            if quality and float(quality) <= 0:
+                continue
+        except ValueError:
+            continue
+        encodings.add(coding.lower())
+    return encodings
+
+
+class Payload(object):
+    """Response body rendered once, kept with its gzipped version and their
+strong etags so it can be served to many requests without any work."""
+
+    def __init__(self, content, content_type):
+        self.content = content
+        self.content_type = content_type
+        self.gzipped = gzip.compress(content, 9)
+        digest = hashlib.sha1(content).hexdigest()
+        self.etag = '"%s"' % digest
+        # each representation has its own etag
+        self.gzipped_etag = '"%s-gz"' % digest
+
+    def response(self, request, cache_control='no-cache'):
+        """Return the response to 'request', gzipped if it accepts it and
+not modified if the client already has this representation."""
+        if 'gzip' in accepted_encodings(
+                request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            content, etag = self.gzipped, self.gzipped_etag
+        else:
+            content, etag = self.content, self.etag
+        # weak comparison, compression middlewares make the etag weak
+        etags = [value[2:] if value.startswith('W/') else value for value in
+                 parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))]
+        if etag in etags:
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(content, content_type=self.content_type)
+            if content is self.gzipped:
+                response['Content-Encoding'] = 'gzip'
+        response['ETag'] = etag
+        response['Cache-Control'] = cache_control
+        patch_vary_headers(response, ('Accept-Encoding',))
+        return response
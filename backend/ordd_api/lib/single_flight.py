@@ -0,0 +1,65 @@
+import time
+import uuid
+from django.core.cache import cache
+
+# outcomes of a 'SingleFlight.run'
+COMPUTED = 'computed'
+STALE = 'stale'
+WAITED = 'waited'
+TIMEOUT = 'timeout'
+
+
+class SingleFlight(object):
+    """Let a single process at a time compute the value of a key, the
+others are served the previous value when there is one, otherwise they
+wait for the value computed by the first one.
+
+The lock is an entry of the default django cache taken with 'add', atomic
+with the shared caches (memcached, redis, database); with the file based
+cache two processes may rarely compute the same value, as without this
+layer. A lock is held for at most 'lock_timeout' seconds, so a process
+dying while computing doesn't block the key; waiting processes compute
+the value themselves after 'wait_timeout' seconds."""
+
+    def __init__(self, prefix, lock_timeout, wait_timeout,
+                 poll_interval=0.05):
+        self.prefix = prefix
+        self.lock_timeout = lock_timeout
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+
+    def run(self, key, compute, fresh, stale=None):
+        """Return the value of 'key' and how it has been obtained (one of
+the outcomes of this module).
+
+'compute()' builds the value and stores it where 'fresh()' reads it,
+'fresh()' returns it or None while missing, 'stale()' returns the
+previous value or None."""
+        lock_key = '%s:lock:%s' % (self.prefix, key)
+        token = uuid.uuid4().hex
+        if cache.add(lock_key, token, self.lock_timeout):
+            return self._compute(lock_key, token, compute), COMPUTED
+
+        if stale is not None:
+            value = stale()
+            if value is not None:
+                return value, STALE
+
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            time.sleep(self.poll_interval)
+            value = fresh()
+            if value is not None:
+                return value, WAITED
+            if cache.add(lock_key, token, self.lock_timeout):
+                # the holder gave up or died, its lock expired
+                return self._compute(lock_key, token, compute), COMPUTED
+        return compute(), TIMEOUT
+
+    def _compute(self, lock_key, token, compute):
+        try:
+            return compute()
+        finally:
+            # not if expired and taken by another process meanwhile
+            if cache.get(lock_key) == token:
+                cache.delete(lock_key)
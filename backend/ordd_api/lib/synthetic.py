@@ -0,0 +1,77 @@
+"""Synthetic datasets used to benchmark the scoring and the datasets views
+on populations larger than the real one.
+
+Datasets are spread over all the countries and key datasets already
+loaded (see the reference csv files in 'contents/'), the answers follow
+the order of the questions, as a dataset usually satisfies the first ones
+and fewer of the others."""
+import random
+
+from ..models import Country, KeyDataset, KeyTag, Url, Dataset
+from .bulk_load import bulk_insert
+from .datasets_io import BOOLEAN_FIELDS
+
+# questions of the score, the first one is 'is_reviewed'
+SCORE_FIELDS = BOOLEAN_FIELDS[1:]
+
+SYNTHETIC_URL = 'https://example.org/synthetic/%d'
+
+
+def synthetic_datasets(count, owner, seed=0, batch_size=1000):
+    """Insert 'count' datasets of 'owner' on random countries and key
+datasets, with random answers, tags and urls, 'batch_size' at a time; the
+same 'seed' produces the same population on the same catalogue."""
+    rng = random.Random(seed)
+    countries = list(Country.objects.order_by('pk').values_list(
+        'pk', flat=True))
+    keydatasets = list(KeyDataset.objects.order_by('pk').values_list(
+        'pk', 'tag_available_id'))
+    if not countries or not keydatasets:
+        raise ValueError('countries and key datasets must be loaded')
+    tags = {}
+    for pk, group in KeyTag.objects.order_by('pk').values_list('pk',
+                                                                'group_id'):
+        tags.setdefault(group, []).append(pk)
+
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        datasets = []
+        picked_tags = []
+        for _ in range(size):
+            keydataset, group = rng.choice(keydatasets)
+            # number of questions answered 'yes', in order
+            answered = rng.randint(0, len(SCORE_FIELDS))
+            dataset = Dataset(owner=owner, changed_by=owner,
+                              country_id=rng.choice(countries),
+                              keydataset_id=keydataset,
+                              is_reviewed=rng.random() < 0.5)
+            for i, field in enumerate(SCORE_FIELDS):
+                setattr(dataset, field, i < answered)
+            datasets.append(dataset)
+            available = tags.get(group, [])
+            picked_tags.append(rng.sample(
+                available, min(len(available), rng.randint(0, 2))))
+        # rows per insert are left to the backend limits
+        bulk_insert(Dataset, datasets)
+
+        urls = bulk_insert(Url, [Url(url=SYNTHETIC_URL % dataset.pk)
+                                 for dataset in datasets])
+        Dataset.url.through.objects.bulk_create(
+            [Dataset.url.through(dataset_id=dataset.pk, url_id=url.pk)
+             for dataset, url in zip(datasets, urls)])
+        Dataset.tag.through.objects.bulk_create(
+            [Dataset.tag.through(dataset_id=dataset.pk, keytag_id=tag)
+             for dataset, dataset_tags in zip(datasets, picked_tags)
+             for tag in dataset_tags])
+        created += size
+    return created
+
+
+def remove_synthetic_datasets(owner):
+    """Remove the datasets of 'owner' and their synthetic urls, return the
+number of datasets removed."""
+    Url.objects.filter(url__startswith=SYNTHETIC_URL.split('%')[0],
+                       dataset__owner=owner).delete()
+    _, removed = Dataset.objects.filter(owner=owner).delete()
+    return removed.get(Dataset._meta.label, 0)
@@ -0,0 +1,159 @@
+"""Collection of the time spent by a request in sql queries, serializers and
+rendering, used by the TimingMiddleware and MetricsMiddleware of
+'ordd_api.middleware'.
+
+The timing of the request handled by the current thread is kept in a
+thread local, the database cursors and the serializers add to it only
+while it is set."""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.db.backends.utils import CursorWrapper
+
+_local = threading.local()
+
+
+class RequestTiming(object):
+    """Times, in seconds, accumulated while handling a request."""
+
+    __slots__ = ('start', 'sql_count', 'sql_time', 'serializer_time',
+                 'serializer_depth', 'render_start', 'render_time')
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.render_start = None
+        self.render_time = 0.0
+
+    def rendering(self):
+        self.render_start = time.perf_counter()
+
+    def rendered(self, response=None):
+        if self.render_start is not None:
+            self.render_time += time.perf_counter() - self.render_start
+            self.render_start = None
+
+    def metrics(self):
+        """Return the name, duration in ms and description of each
+metric."""
+        total = time.perf_counter() - self.start
+        return [('total', total * 1000, None),
+                ('sql', self.sql_time * 1000, '%d queries' % self.sql_count),
+                ('serializer', self.serializer_time * 1000, None),
+                ('render', self.render_time * 1000, None)]
+
+    def server_timing(self, metrics):
+        """Value of the Server-Timing header of 'metrics'."""
+        return ', '.join(
+            '%s;dur=%.1f' % (name, duration) +
+            (';desc="%s"' % desc if desc else '')
+            for name, duration, desc in metrics)
+
+    def record(self, request, response, metrics):
+        """Fields of the log line of the request."""
+        record = OrderedDict([
+            ('method', request.method),
+            ('path', request.path),
+            ('status', response.status_code),
+        ])
+        for name, duration, _ in metrics:
+            record['%s_ms' % name] = round(duration, 1)
+        record['sql_count'] = self.sql_count
+        return record
+
+
+def current_timing():
+    return getattr(_local, 'timing', None)
+
+
+class TimedCursorWrapper(CursorWrapper):
+    """Cursor adding the duration of each query to 'timing'."""
+
+    def __init__(self, cursor, db, timing):
+        super(TimedCursorWrapper, self).__init__(cursor, db)
+        self.timing = timing
+
+    def execute(self, sql, params=None):
+        start = time.perf_counter()
+        try:
+            return super(TimedCursorWrapper, self).execute(sql, params)
+        finally:
+            self.timing.sql_count += 1
+            self.timing.sql_time += time.perf_counter() - start
+
+    def executemany(self, sql, param_list):
+        start = time.perf_counter()
+        try:
+            return super(TimedCursorWrapper, self).executemany(sql,
+                                                               param_list)
+        finally:
+            self.timing.sql_count += 1
+            self.timing.sql_time += time.perf_counter() - start
+
+
+def start_timing(connections):
+    """Start the timing of the request of the current thread on the
+database 'connections', return it."""
+    timing = RequestTiming()
+    _local.timing = timing
+    for connection in connections:
+        # wrap the cursors created by this connection, debug ones included
+        # so queries are still logged when DEBUG is on
+        for name in ('make_cursor', 'make_debug_cursor'):
+            make = getattr(connection, name)
+            setattr(connection, name,
+                    lambda cursor, make=make, connection=connection:
+                    TimedCursorWrapper(make(cursor), connection, timing))
+    return timing
+
+
+def stop_timing(connections):
+    _local.timing = None
+    for connection in connections:
+        for name in ('make_cursor', 'make_debug_cursor'):
+            connection.__dict__.pop(name, None)
+
+
+@contextmanager
+def request_timing(connections):
+    """Time the request of the current thread while in the block, sharing
+the timing already started by an outer middleware if any."""
+    timing = current_timing()
+    if timing is not None:
+        yield timing
+        return
+    timing = start_timing(connections)
+    try:
+        yield timing
+    finally:
+        stop_timing(connections)
+
+
+def install_serializer_timing():
+    """Time the serializations of the serializers of rest_framework, the
+outermost one when they are nested."""
+    from rest_framework.serializers import BaseSerializer
+
+    if getattr(BaseSerializer, '_ordd_timed', False):
+        return
+    data = BaseSerializer.data.fget
+
+    def timed_data(self):
+        timing = current_timing()
+        if timing is None or timing.serializer_depth:
+            return data(self)
+        timing.serializer_depth += 1
+        start = time.perf_counter()
+        try:
+            return data(self)
+        finally:
+            timing.serializer_depth -= 1
+            timing.serializer_time += time.perf_counter() - start
+
+    BaseSerializer.data = property(timed_data)
+    BaseSerializer._ordd_timed = True
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+
+# all the caches created by the process, by name
+registry = OrderedDict()
+
+
+class TTLCache(object):
+    """Thread safe in process cache bounded to 'maxsize' entries, each
+entry expires 'ttl' seconds after it has been set and the least recently
+used one is dropped when the cache is full.
+
+With a 'version' (a SharedVersion) the entries set under a previous
+version are dropped too, so the changes made by other processes are seen
+within its check interval."""
+
+    def __init__(self, name, maxsize, ttl, version=None):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        registry[name] = self
+
+    def _current_version(self):
+        return None if self.version is None else self.version.get()
+
+    def get(self, key, default=None):
+        current = self._current_version()
+        with self._lock:
+            try:
+                expire, version, value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            if expire < time.monotonic() or version != current:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, version=None):
+        if version is None:
+            version = self._current_version()
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, version, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_or_build(self, key, build):
+        """Return the entry of 'key', set to 'build()' when missing. The
+version is read before building, a change made meanwhile drops the value
+at the next check."""
+        version = self._current_version()
+        value = self.get(key)
+        if value is None:
+            value = build()
+            self.set(key, value, version)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_if(self, predicate):
+        """Drop the entries for which 'predicate(key, value)' is true."""
+        with self._lock:
+            for key in [key for key, (_, _, value) in self._data.items()
+                        if predicate(key, value)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
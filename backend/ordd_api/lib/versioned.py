@@ -0,0 +1,66 @@
+import threading
+import time
+import uuid
+from django.core.cache import cache
+from django.db import transaction
+
+
+class SharedVersion(object):
+    """Version of a group of tables shared by all the processes through the
+default django cache.
+
+Processes compare it with the version of the values they have built and
+rebuild them when it changes, the shared value is read at most once every
+'check_interval' seconds."""
+
+    def __init__(self, key, check_interval):
+        self.key = key
+        self.check_interval = check_interval
+        self._value = None
+        self._checked = 0
+
+    def get(self):
+        now = time.monotonic()
+        if self._value is None or now - self._checked >= self.check_interval:
+            value = cache.get(self.key)
+            if value is None:
+                cache.add(self.key, uuid.uuid4().hex, None)
+                value = cache.get(self.key)
+            self._value, self._checked = value, now
+        return self._value
+
+    def bump(self):
+        value = uuid.uuid4().hex
+        cache.set(self.key, value, None)
+        self._value, self._checked = value, time.monotonic()
+
+    def bump_on_commit(self, using=None):
+        """Bump the version once the current transaction is committed, many
+changes in the same transaction produce a single bump."""
+        connection = transaction.get_connection(using)
+        if not any(func == self.bump for _, func in
+                   connection.run_on_commit):
+            transaction.on_commit(self.bump, using)
+
+
+class VersionedValue(object):
+    """Value returned by 'build()', kept in memory and built again when
+'version' changes."""
+
+    def __init__(self, version, build):
+        self.version = version
+        self.build = build
+        self._built = (None, None)
+        self._lock = threading.Lock()
+
+    def get(self):
+        version = self.version.get()
+        built_version, value = self._built
+        if built_version == version:
+            return value
+        with self._lock:
+            built_version, value = self._built
+            if built_version != version:
+                value = self.build()
+                self._built = (version, value)
+        return value
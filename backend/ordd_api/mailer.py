@@ -1,10 +1,12 @@
 # Do these imports at the top of the module.
 import os
+import time
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import render_to_string
 from email.mime.image import MIMEImage
 from ordd.settings import ORDD_ADMIN_MAIL
 from django.template import TemplateDoesNotExist
+from .metrics import metrics
 
 
 def mailer_attach_image(msg, filename, imgname):
@@ -45,4 +47,12 @@ def mailer(address, subject, content_html, content_txt, template,
             os.path.dirname(__file__), 'templates',
             'ordd_api', 'mail_templates', 'img', f), f)
 
-    msg.send()
+    start = time.monotonic()
+    try:
+        msg.send()
+    except Exception:
+        metrics.inc('ordd_mail_failures_total', (template, ))
+        raise
+    finally:
+        metrics.observe('ordd_mail_duration_seconds', (template, ),
+                        time.monotonic() - start)
@@ -0,0 +1,178 @@
+import json
+import os
+import platform
+import time
+from collections import OrderedDict
+from multiprocessing import Pool
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from ordd_api.country_details import invalidate_country_details
+from ordd_api.lib.synthetic import (synthetic_datasets,
+                                    remove_synthetic_datasets)
+from ordd_api.models import Country, Dataset, KeyTag
+from ordd_api.parallel_scoring import PARALLEL_SCORINGS, parallel_score
+from ordd_api.scoring_cache import datasets_version, scoring_request
+from ordd_api.views import Score
+
+from .bench_scoring import load_reference
+
+NO_FILTERS = ((), ())
+
+PARALLEL_OWNER = 'synthetic-parallel'
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the world scorings computed by pools of processes'
+            ' against the serial computation on a synthetic population of'
+            ' datasets, checking that the results are the same')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--datasets', type=int, default=20000,
+                            help='synthetic datasets added to the existing'
+                            ' ones')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='seed of the synthetic population')
+        parser.add_argument('--workers', type=str, default='1,2,4,8',
+                            help='comma separated sizes of the pools')
+        parser.add_argument('--chunks', type=int,
+                            help='partitions of the countries (default four'
+                            ' for each cpu)')
+        parser.add_argument('--repeat', type=int, default=3,
+                            help='timed runs of each case, the best counts')
+        parser.add_argument('--load-reference', action='store_true',
+                            help='load countries, key datasets and'
+                            ' thinkhazard data from contents/ when the'
+                            ' catalogue is empty')
+        parser.add_argument('--keep', action='store_true',
+                            help='keep the synthetic datasets, a next run'
+                            ' with the same --datasets reuses them')
+        parser.add_argument('--output', type=str,
+                            help='json file where the results are written')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        try:
+            workers = [int(value) for value in options['workers'].split(',')]
+        except ValueError:
+            raise CommandError('--workers must be a list of integers')
+        if options['repeat'] < 1 or min(workers) < 1:
+            raise CommandError('--repeat and --workers must be at least 1')
+        if options['load_reference']:
+            load_reference(self.stdout)
+        owner, _ = User.objects.get_or_create(username=PARALLEL_OWNER)
+        self.seed(owner, options)
+
+        try:
+            results = self.run(workers, options)
+            report = OrderedDict([
+                ('meta', self.meta(options, workers)),
+                ('results', results),
+            ])
+        finally:
+            if not options['keep']:
+                remove_synthetic_datasets(owner)
+
+        self.report(results, workers)
+        if options['output']:
+            with open(options['output'], 'w') as fileout:
+                json.dump(report, fileout, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                'Results written to %s.' % options['output']))
+
+    def seed(self, owner, options):
+        """Seed the synthetic datasets, committed to be seen by the
+processes of the pools, unless the ones kept by a previous run match."""
+        if Dataset.objects.filter(owner=owner).count() == options['datasets']:
+            return
+        with transaction.atomic():
+            remove_synthetic_datasets(owner)
+            try:
+                synthetic_datasets(options['datasets'], owner,
+                                   seed=options['seed'])
+            except ValueError as ex:
+                raise CommandError('%s, see --load-reference' % ex)
+            # bulk inserts don't send the signals that track changes
+            datasets_version.bump_on_commit()
+            invalidate_country_details()
+
+    def cases(self):
+        peril = KeyTag.objects.filter(is_peril=True).order_by(
+            'name').values_list('name', flat=True).first()
+        cases = [(name, NO_FILTERS) for name in PARALLEL_SCORINGS]
+        if peril is not None:
+            cases += [('%s peril' % name, ((peril,), ()))
+                      for name in PARALLEL_SCORINGS]
+        return cases
+
+    def best(self, func, repeat):
+        """Run 'func' 'repeat' times, return its result and its best time
+in ms."""
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            value = func()
+            elapsed = (time.perf_counter() - start) * 1000
+            best = elapsed if best is None else min(best, elapsed)
+        return value, best
+
+    def run(self, workers, options):
+        results = OrderedDict()
+        for case, filters in self.cases():
+            name = case.split()[0]
+            if self.verbosity > 1:
+                self.stdout.write('  %s' % case)
+            expected, serial = self.best(
+                lambda: getattr(Score, name)(scoring_request(filters)),
+                options['repeat'])
+            result = OrderedDict([('serial_ms', round(serial, 2)),
+                                  ('pools', OrderedDict())])
+            for size in workers:
+                # the processes open their own database connections
+                connections.close_all()
+                with Pool(size) as pool:
+                    value, elapsed = self.best(
+                        lambda: parallel_score(name, filters, pool,
+                                               options['chunks']),
+                        options['repeat'])
+                if value != expected:
+                    raise CommandError('%s with %d workers differs from the'
+                                       ' serial computation' % (case, size))
+                result['pools'][str(size)] = OrderedDict([
+                    ('ms', round(elapsed, 2)),
+                    ('speedup', round(serial / elapsed, 2)),
+                    ('efficiency', round(serial / elapsed / size, 2)),
+                ])
+            results[case] = result
+        return results
+
+    def meta(self, options, workers):
+        return OrderedDict([
+            ('date', timezone.now().isoformat()),
+            ('python', platform.python_version()),
+            ('django', django.get_version()),
+            ('database', connection.vendor),
+            ('cpus', os.cpu_count()),
+            ('workers', workers),
+            ('chunks', options['chunks']),
+            ('repeat', options['repeat']),
+            ('seed', options['seed']),
+            ('synthetic_datasets', options['datasets']),
+            ('datasets', Dataset.objects.count()),
+            ('countries', Country.objects.filter(
+                dataset__isnull=False).distinct().count()),
+        ])
+
+    def report(self, results, workers):
+        self.stdout.write('%-32s %10s %10s %8s %10s' % (
+            'case', 'workers', 'ms', 'speedup', 'efficiency'))
+        for case, result in results.items():
+            self.stdout.write('%-32s %10s %10.1f' % (
+                case, 'serial', result['serial_ms']))
+            for size in workers:
+                pool = result['pools'][str(size)]
+                self.stdout.write('%-32s %10d %10.1f %8.2f %10.2f' % (
+                    '', size, pool['ms'], pool['speedup'],
+                    pool['efficiency']))
@@ -0,0 +1,92 @@
+import gzip
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+from ordd_api.middleware import brotli
+from ordd_api.models import Country
+from ordd_api.renderers import FastJSONRenderer, orjson
+from ordd_api.views import (ScoringWorldGet, ScoringCountryDetailsGet,
+                            DatasetListView, DatasetsDumpView)
+
+
+def timed(func, repeat):
+    """Return the result of 'func()' and the best time of 'repeat' runs
+in milliseconds."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best * 1000
+
+
+class Command(BaseCommand):
+    help = ('Measure rendering and compression of representative api'
+            ' payloads (world and country scoring, datasets list and dump)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='runs of each measure, the best is shown')
+        parser.add_argument('--country', type=str,
+                            help='iso2 of the country used for the country'
+                            ' details (default the one with most datasets)')
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        country = options['country']
+        if country is None:
+            country = Country.objects.annotate(
+                datasets=Count('dataset')).order_by(
+                    '-datasets').values_list('iso2', flat=True).first()
+        if country is None:
+            raise CommandError('no countries loaded')
+
+        factory = APIRequestFactory()
+        payloads = [
+            ('scoring/', ScoringWorldGet, {}),
+            ('scoring/%s' % country, ScoringCountryDetailsGet,
+             {'country_id': country}),
+            ('dataset/', DatasetListView, {}),
+            ('datasets_dump', DatasetsDumpView, {}),
+        ]
+
+        self.stdout.write('orjson: %s, brotli: %s' % (
+            'installed' if orjson else 'not installed',
+            'installed' if brotli else 'not installed'))
+        renderers = [('drf json', JSONRenderer())]
+        if orjson is not None:
+            renderers.append(('orjson', FastJSONRenderer()))
+
+        for path, view, kwargs in payloads:
+            request = factory.get('/api/' + path, HTTP_ACCEPT='*/*')
+            response = view.as_view()(request, **kwargs)
+            response.render()
+            content = response.content
+            self.stdout.write('\n%s (%s, %d bytes)' % (
+                path, response['Content-Type'], len(content)))
+
+            if response['Content-Type'].startswith('application/json'):
+                for name, renderer in renderers:
+                    _, elapsed = timed(
+                        lambda: renderer.render(response.data), repeat)
+                    self.stdout.write('  render %-12s %8.2f ms' % (
+                        name, elapsed))
+
+            compressors = [
+                ('gzip %d' % level,
+                 lambda level=level: gzip.compress(content, level))
+                for level in (1, 6, 9)]
+            if brotli is not None:
+                compressors += [
+                    ('brotli %d' % quality,
+                     lambda quality=quality: brotli.compress(
+                         content, quality=quality))
+                    for quality in (1, 5, 11)]
+            for name, compress in compressors:
+                compressed, elapsed = timed(compress, repeat)
+                self.stdout.write('  %-19s %8.2f ms %9d bytes (%4.1f%%)' % (
+                    name, elapsed, len(compressed),
+                    100.0 * len(compressed) / len(content)))
@@ -0,0 +1,248 @@
+import json
+import math
+import os
+import platform
+import time
+import tracemalloc
+from collections import OrderedDict
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory
+from ordd_api.country_details import invalidate_country_details
+from ordd_api.lib.synthetic import synthetic_datasets
+from ordd_api.models import Country, Dataset, KeyCategory, KeyDataset, KeyTag
+from ordd_api.scoring_cache import datasets_version, scoring_request
+from ordd_api.views import Score, DatasetListView, DatasetsDumpView
+
+NO_FILTERS = ((), ())
+
+REFERENCE_DIR = os.path.join(settings.BASE_DIR, 'contents')
+
+SYNTHETIC_OWNER = 'synthetic-bench'
+
+
+def percentile(values, pct):
+    """Nearest rank percentile of the sorted 'values'."""
+    return values[max(0, math.ceil(pct / 100.0 * len(values)) - 1)]
+
+
+def measure(func, repeat):
+    """Run 'func' 'repeat' times and return its latency statistics in ms,
+then once more to count its queries and its peak of allocated memory."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+
+    # separated run, tracing slows down the measured code; the log of the
+    # queries is bounded, it's emptied to count as many as possible
+    reset_queries()
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return OrderedDict([
+        ('min_ms', round(times[0], 2)),
+        ('mean_ms', round(sum(times) / len(times), 2)),
+        ('p50_ms', round(percentile(times, 50), 2)),
+        ('p95_ms', round(percentile(times, 95), 2)),
+        ('p99_ms', round(percentile(times, 99), 2)),
+        ('max_ms', round(times[-1], 2)),
+        ('queries', len(queries)),
+        ('queries_truncated', len(queries) >= connection.queries_limit),
+        ('peak_memory_kb', round(peak / 1024.0, 1)),
+    ])
+
+
+def load_reference(stdout):
+    """Load countries, key datasets and thinkhazard data from contents/
+when the catalogue is empty."""
+    # options given as arguments, call_command doesn't see the required
+    # ones passed as keywords
+    if not Country.objects.exists():
+        call_command('load_countries', '--filein', os.path.join(
+            REFERENCE_DIR, 'countries', 'ordd_countries_list_iso3166.csv'),
+            stdout=stdout)
+    if not KeyDataset.objects.exists():
+        call_command('load_key_datasets', '--filein', *[
+            os.path.join(REFERENCE_DIR, 'key_datasets', name)
+            for name in ('kd-categories.csv', 'kd-tags.csv',
+                         'kd-datasets.csv')], stdout=stdout)
+        call_command('load_thinkhazard', '--datapath', os.path.join(
+            REFERENCE_DIR, 'thinkhazard', 'cache'), stdout=stdout)
+
+
+class Command(BaseCommand):
+    help = ('Benchmark the scoring and the datasets list and dump on a'
+            ' synthetic population of datasets, the database is left'
+            ' untouched unless --keep is given')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--datasets', type=int, default=5000,
+                            help='synthetic datasets added to the existing'
+                            ' ones')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='seed of the synthetic population')
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='timed runs of each case')
+        parser.add_argument('--country', type=str,
+                            help='iso2 of the country used for the details'
+                            ' (default the one with most datasets)')
+        parser.add_argument('--skip-dump', action='store_true',
+                            help='skip the datasets dump, the slowest case')
+        parser.add_argument('--load-reference', action='store_true',
+                            help='load countries, key datasets and'
+                            ' thinkhazard data from contents/ when the'
+                            ' catalogue is empty')
+        parser.add_argument('--keep', action='store_true',
+                            help='keep the synthetic datasets')
+        parser.add_argument('--output', type=str,
+                            help='json file where the results are written')
+        parser.add_argument('--compare', type=str,
+                            help='json file of a previous run to compare'
+                            ' with')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be at least 1')
+        previous = None
+        if options['compare']:
+            with open(options['compare']) as filein:
+                previous = json.load(filein)
+
+        with transaction.atomic():
+            if options['load_reference']:
+                load_reference(self.stdout)
+            owner, _ = User.objects.get_or_create(username=SYNTHETIC_OWNER)
+            try:
+                created = synthetic_datasets(options['datasets'], owner,
+                                             seed=options['seed'])
+            except ValueError as ex:
+                raise CommandError('%s, see --load-reference' % ex)
+
+            report = OrderedDict([
+                ('meta', self.meta(options, created)),
+                ('results', self.run(options)),
+            ])
+
+            if options['keep']:
+                # bulk inserts don't send the signals that track changes
+                datasets_version.bump_on_commit()
+                invalidate_country_details()
+            else:
+                transaction.set_rollback(True)
+
+        self.report(report['results'], previous and previous['results'])
+        if options['output']:
+            with open(options['output'], 'w') as fileout:
+                json.dump(report, fileout, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                'Results written to %s.' % options['output']))
+
+    def meta(self, options, created):
+        return OrderedDict([
+            ('date', timezone.now().isoformat()),
+            ('python', platform.python_version()),
+            ('django', django.get_version()),
+            ('database', connection.vendor),
+            ('seed', options['seed']),
+            ('repeat', options['repeat']),
+            ('synthetic_datasets', created),
+            ('datasets', Dataset.objects.count()),
+            ('countries', Country.objects.count()),
+            ('keydatasets', KeyDataset.objects.count()),
+        ])
+
+    def cases(self, options):
+        country = options['country']
+        if country is None:
+            country = Country.objects.annotate(
+                datasets=Count('dataset')).order_by(
+                    '-datasets').values_list('iso2', flat=True).first()
+        peril = KeyTag.objects.filter(is_peril=True).order_by(
+            'name').values_list('name', flat=True).first()
+        category = KeyCategory.objects.order_by('pk').values_list(
+            'name', flat=True).first()
+        keydataset = KeyDataset.objects.order_by('pk').values_list(
+            'pk', flat=True).first()
+        filtered = ((peril,), ())
+        factory = APIRequestFactory()
+
+        def score(name, filters, *args):
+            return lambda: getattr(Score, name)(scoring_request(filters),
+                                                *args)
+
+        def view(view_class, path, **params):
+            view_func = view_class.as_view()
+
+            def get():
+                response = view_func(factory.get('/api/' + path, params,
+                                                 HTTP_ACCEPT='*/*'))
+                response.render()
+                return response
+            return get
+
+        cases = [
+            ('all_countries', score('all_countries', NO_FILTERS)),
+            ('all_countries peril', score('all_countries', filtered)),
+            ('country_details', score('country_details', NO_FILTERS,
+                                      country)),
+            ('country_details peril', score('country_details', filtered,
+                                            country)),
+            ('all_countries_categories', score('all_countries_categories',
+                                               NO_FILTERS)),
+            ('dataset list', view(DatasetListView, 'dataset/')),
+            ('dataset list country', view(DatasetListView, 'dataset/',
+                                          country=country)),
+            ('dataset list category peril', view(
+                DatasetListView, 'dataset/', category=category,
+                applicability=peril)),
+            ('dataset list keydataset', view(DatasetListView, 'dataset/',
+                                             kd=keydataset)),
+        ]
+        if not options['skip_dump']:
+            cases.append(('datasets dump', view(DatasetsDumpView,
+                                                'datasets_dump')))
+        return cases
+
+    def run(self, options):
+        results = OrderedDict()
+        for name, func in self.cases(options):
+            results[name] = measure(func, options['repeat'])
+            if options['verbosity'] > 1:
+                self.stdout.write('  %s: %.2f ms' % (
+                    name, results[name]['p50_ms']))
+        return results
+
+    def report(self, results, previous):
+        self.stdout.write('%-28s %9s %9s %9s %7s %10s' % (
+            'case', 'p50 ms', 'p95 ms', 'p99 ms', 'queries', 'peak kB'))
+        for name, result in results.items():
+            line = '%-28s %9.2f %9.2f %9.2f %7d %10.1f' % (
+                name, result['p50_ms'], result['p95_ms'], result['p99_ms'],
+                result['queries'], result['peak_memory_kb'])
+            if previous and name in previous and previous[name]['p50_ms']:
+                line += ' %+6.1f%%' % (
+                    100.0 * (result['p50_ms'] - previous[name]['p50_ms']) /
+                    previous[name]['p50_ms'])
+                if previous[name]['peak_memory_kb']:
+                    line += ' %+6.1f%% kB' % (
+                        100.0 * (result['peak_memory_kb'] -
+                                 previous[name]['peak_memory_kb']) /
+                        previous[name]['peak_memory_kb'])
+            if result['queries_truncated']:
+                line += ' (queries truncated)'
+            self.stdout.write(line)
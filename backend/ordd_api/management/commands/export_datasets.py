@@ -0,0 +1,53 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Prefetch
+from ordd_api.models import Dataset, KeyTag
+from ordd_api.lib.bulk_load import open_text, Throughput
+from ordd_api.lib.datasets_io import header, dataset_to_record
+
+
+class Command(BaseCommand):
+    help = ('Export datasets with urls and tags to a compressed line'
+            ' oriented dump that can be loaded with import_datasets')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fileout', nargs=1, type=str, required=True,
+                            help='dump file (gzipped if ends with .gz)')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='number of datasets read per query')
+        parser.add_argument('--progress', type=int, default=10000,
+                            help='report throughput every N datasets')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        throughput = Throughput(self.stdout.write, options['progress'])
+
+        queryset = Dataset.objects.select_related(
+            'owner', 'changed_by', 'country', 'keydataset').prefetch_related(
+                'url', Prefetch('tag', queryset=KeyTag.objects.select_related(
+                    'group'))).order_by('pk')
+
+        try:
+            with open_text(options['fileout'][0], 'w') as fileout:
+                fileout.write(json.dumps(header()) + '\n')
+
+                # keyset pagination keeps in memory just one chunk of
+                # datasets with their prefetched relations
+                last_pk = 0
+                while True:
+                    chunk = list(queryset.filter(pk__gt=last_pk)[:chunk_size])
+                    if not chunk:
+                        break
+                    fileout.write(''.join(
+                        json.dumps(dataset_to_record(dataset),
+                                   separators=(',', ':')) + '\n'
+                        for dataset in chunk))
+                    last_pk = chunk[-1].pk
+                    throughput.add(len(chunk))
+        except Exception as ex:
+            raise CommandError(
+                'Datasets export failed with exception of class %s and error'
+                ' string %s.' % (ex.__class__, ex))
+
+        self.stdout.write(self.style.SUCCESS(
+            'Successfully exported %s.' % throughput.summary()))
@@ -0,0 +1,166 @@
+import json
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from ordd_api.models import Country, KeyDataset, KeyTag, Url, Dataset
+from ordd_api.lib.bulk_load import (open_text, suspend_auto_now,
+                                    reset_sequences, bulk_insert, Throughput)
+from ordd_api.lib.datasets_io import (check_header, record_to_values,
+                                      BOOLEAN_FIELDS, TEXT_FIELDS,
+                                      DATETIME_FIELDS)
+from ordd_api.scoring_cache import datasets_version
+from ordd_api.country_details import invalidate_country_details
+
+
+class Command(BaseCommand):
+    help = 'Import datasets from a dump created with export_datasets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filein', nargs=1, type=str, required=True,
+                            help='dump file (gzipped if ends with .gz)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='number of datasets inserted per query')
+        parser.add_argument('--progress', type=int, default=10000,
+                            help='report throughput every N datasets')
+        parser.add_argument('--keep-ids', action='store_true',
+                            help='insert datasets with their original ids'
+                            ' instead of remapping them')
+        parser.add_argument('--default-owner', type=str,
+                            help='username used when a dataset owner does'
+                            ' not exist')
+        parser.add_argument('--idmap', nargs=1, type=str,
+                            help='write "<original id> <new id>" lines to'
+                            ' this file')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.keep_ids = options['keep_ids']
+        self.throughput = Throughput(self.stdout.write, options['progress'])
+
+        # reference tables are small, load them once
+        self.countries = {c.iso2: c.pk for c in Country.objects.all()}
+        self.keydatasets = set(KeyDataset.objects.values_list(
+            'code', flat=True))
+        self.tags = {(tag.name, tag.group.name): tag.pk for tag in
+                     KeyTag.objects.select_related('group')}
+        self.users = {}
+        self.default_owner = None
+        if options['default_owner']:
+            self.default_owner = User.objects.get(
+                username=options['default_owner']).pk
+
+        idmap = None
+        try:
+            with transaction.atomic():
+                with open_text(options['filein'][0]) as filein:
+                    if options['idmap']:
+                        idmap = open(options['idmap'][0], 'w')
+                    fields = check_header(json.loads(filein.readline()))
+                    batch = []
+                    for line in filein:
+                        if not line.strip():
+                            continue
+                        batch.append(record_to_values(fields,
+                                                      json.loads(line)))
+                        if len(batch) >= self.batch_size:
+                            self.insert(batch, idmap)
+                            batch = []
+                    self.insert(batch, idmap)
+                if self.keep_ids:
+                    reset_sequences([Dataset], connection.alias)
+                # bulk inserts don't send the signals that track changes
+                datasets_version.bump_on_commit()
+        except Exception as ex:
+            raise CommandError(
+                'Datasets import failed with exception of class %s and error'
+                ' string %s.' % (ex.__class__, ex))
+        finally:
+            if idmap is not None:
+                idmap.close()
+
+        self.stdout.write(self.style.SUCCESS(
+            'Successfully imported %s.' % self.throughput.summary()))
+
+    def user(self, username, fallback=None):
+        if username in self.users:
+            return self.users[username]
+        if fallback is not None:
+            return fallback
+        raise ValueError('user [%s] not exists' % username)
+
+    def preload_users(self, batch):
+        usernames = set()
+        for values in batch:
+            usernames.add(values['owner'])
+            if values['changed_by']:
+                usernames.add(values['changed_by'])
+        usernames -= set(self.users)
+        if usernames:
+            self.users.update(User.objects.filter(
+                username__in=usernames).values_list('username', 'pk'))
+
+    def urls(self, batch):
+        """Return the id of every url referenced by the batch creating the
+missing ones with a single insert."""
+        names = {url[0] for values in batch for url in values['url']}
+        ids = dict(Url.objects.filter(url__in=names).values_list('url', 'pk'))
+        missing = [Url(url=name) for name in names if name not in ids]
+        if missing:
+            Url.objects.bulk_create(missing, batch_size=self.batch_size)
+            ids.update(Url.objects.filter(url__in=[
+                url.url for url in missing]).values_list('url', 'pk'))
+        return ids
+
+    def insert(self, batch, idmap):
+        if not batch:
+            return
+
+        self.preload_users(batch)
+        url_ids = self.urls(batch)
+
+        datasets = []
+        for values in batch:
+            country = values['country'][0]
+            if country not in self.countries:
+                raise ValueError('country [%s] not exists' % country)
+            keydataset = values['keydataset'][0]
+            if keydataset not in self.keydatasets:
+                raise ValueError('keydataset [%s] not exists' % keydataset)
+
+            dataset = Dataset(
+                owner_id=self.user(values['owner'], self.default_owner),
+                changed_by_id=(self.user(values['changed_by'],
+                                         self.default_owner)
+                               if values['changed_by'] else None),
+                country_id=self.countries[country],
+                keydataset_id=keydataset)
+            if self.keep_ids:
+                dataset.pk = values['id']
+            for field in BOOLEAN_FIELDS + TEXT_FIELDS + DATETIME_FIELDS:
+                setattr(dataset, field, values[field])
+            datasets.append(dataset)
+
+        with suspend_auto_now(Dataset):
+            bulk_insert(Dataset, datasets, batch_size=self.batch_size)
+
+        url_rows = []
+        tag_rows = []
+        for dataset, values in zip(datasets, batch):
+            url_rows += [Dataset.url.through(dataset_id=dataset.pk,
+                                             url_id=url_ids[url[0]])
+                         for url in values['url']]
+            for tag in values['tag']:
+                if tuple(tag) not in self.tags:
+                    raise ValueError('tag [%s] not exists' % ' - '.join(tag))
+                tag_rows.append(Dataset.tag.through(
+                    dataset_id=dataset.pk, keytag_id=self.tags[tuple(tag)]))
+            if idmap is not None:
+                idmap.write('%d %d\n' % (values['id'], dataset.pk))
+        Dataset.url.through.objects.bulk_create(url_rows,
+                                                batch_size=self.batch_size)
+        Dataset.tag.through.objects.bulk_create(tag_rows,
+                                                batch_size=self.batch_size)
+        invalidate_country_details({dataset.country_id
+                                    for dataset in datasets})
+
+        self.throughput.add(len(datasets))
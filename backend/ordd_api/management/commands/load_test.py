@@ -0,0 +1,280 @@
+import json
+import os
+import platform
+import shutil
+import signal
+import subprocess
+import sys
+import time
+import http.client
+from collections import OrderedDict
+from urllib.parse import urlencode, urlsplit
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from ordd_api.country_details import invalidate_country_details
+from ordd_api.helpers.http_bench import bench_mix
+from ordd_api.lib.synthetic import (synthetic_datasets,
+                                    remove_synthetic_datasets)
+from ordd_api.models import Country, Dataset, KeyCategory, KeyLevel, KeyTag
+from ordd_api.scoring_cache import datasets_version
+
+from .bench_scoring import load_reference
+
+LOAD_TEST_OWNER = 'synthetic-load'
+
+# relative frequency of the frontend calls
+DEFAULT_WEIGHTS = OrderedDict([
+    ('scoring', 10),
+    ('scoring_country', 25),
+    ('scoring_category', 10),
+    ('dataset_country', 25),
+    ('keydataset', 30),
+])
+
+
+class Command(BaseCommand):
+    help = ('Load test a local gunicorn with a mix of the frontend requests'
+            ' on the database seeded with synthetic datasets, and report'
+            ' throughput and latency percentiles')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--datasets', type=int, default=5000,
+                            help='synthetic datasets added to the existing'
+                            ' ones')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='seed of the synthetic population and of'
+                            ' the requests')
+        parser.add_argument('--load-reference', action='store_true',
+                            help='load countries, key datasets and'
+                            ' thinkhazard data from contents/ when the'
+                            ' catalogue is empty')
+        parser.add_argument('--keep', action='store_true',
+                            help='keep the synthetic datasets, a next run'
+                            ' with the same --datasets reuses them')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='gunicorn workers')
+        parser.add_argument('--worker-class', type=str, default='sync',
+                            help='gunicorn worker class')
+        parser.add_argument('--threads', type=int, default=1,
+                            help='threads of each gunicorn worker')
+        parser.add_argument('--bind', type=str, default='127.0.0.1:8765',
+                            help='address of the started gunicorn')
+        parser.add_argument('--gunicorn', type=str,
+                            help='gunicorn executable (default the one of'
+                            ' this python)')
+        parser.add_argument('--url', type=str,
+                            help='base url of the api of an instance already'
+                            ' running on this database, gunicorn is not'
+                            ' started')
+        parser.add_argument('--host', type=str,
+                            help='Host header of the requests (default the'
+                            ' first of ALLOWED_HOSTS with gunicorn)')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='concurrent clients')
+        parser.add_argument('--duration', type=float, default=30,
+                            help='seconds of measured load')
+        parser.add_argument('--warmup', type=float, default=5,
+                            help='seconds of load before the measure')
+        parser.add_argument('--weight', action='append', default=[],
+                            metavar='NAME=WEIGHT',
+                            help='weight of a kind of request, one of %s' %
+                            ', '.join('%s (%d)' % item
+                                      for item in DEFAULT_WEIGHTS.items()))
+        parser.add_argument('--output', type=str,
+                            help='json file where the results are written')
+
+    def handle(self, *args, **options):
+        weights = self.weights(options['weight'])
+        if options['load_reference']:
+            load_reference(self.stdout)
+        owner, _ = User.objects.get_or_create(username=LOAD_TEST_OWNER)
+        self.seed(owner, options)
+
+        server = None
+        try:
+            base_url = options['url']
+            host = options['host']
+            if base_url is None:
+                base_url = 'http://%s/%s' % (options['bind'],
+                                             settings.ORDD_API_BASEPATH)
+                host = host or self.allowed_host()
+                server = self.start_gunicorn(options, base_url, host)
+            if not base_url.endswith('/'):
+                base_url += '/'
+            headers = {'Host': host} if host else {}
+            mix = self.mix(weights)
+
+            if options['warmup'] > 0:
+                bench_mix(base_url, mix, options['concurrency'],
+                          options['warmup'], headers, seed=options['seed'])
+            results = bench_mix(base_url, mix, options['concurrency'],
+                                options['duration'], headers,
+                                seed=options['seed'])
+            report = OrderedDict([
+                ('meta', self.meta(options, base_url, weights)),
+                ('results', results),
+            ])
+        finally:
+            if server is not None:
+                self.stop_gunicorn(server)
+            if not options['keep']:
+                remove_synthetic_datasets(owner)
+
+        self.report(results, mix)
+        if options['output']:
+            with open(options['output'], 'w') as fileout:
+                json.dump(report, fileout, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                'Results written to %s.' % options['output']))
+
+    def weights(self, values):
+        weights = OrderedDict(DEFAULT_WEIGHTS)
+        for value in values:
+            name, _, weight = value.partition('=')
+            if name not in weights:
+                raise CommandError('unknown kind of request %r' % name)
+            try:
+                weights[name] = int(weight)
+            except ValueError:
+                raise CommandError('weight of %r must be an integer' % name)
+        if sum(weights.values()) <= 0:
+            raise CommandError('at least one weight must be positive')
+        return weights
+
+    def seed(self, owner, options):
+        """Seed the synthetic datasets, committed to be seen by gunicorn,
+unless the ones kept by a previous run match."""
+        if Dataset.objects.filter(owner=owner).count() == options['datasets']:
+            return
+        with transaction.atomic():
+            remove_synthetic_datasets(owner)
+            try:
+                synthetic_datasets(options['datasets'], owner,
+                                   seed=options['seed'])
+            except ValueError as ex:
+                raise CommandError('%s, see --load-reference' % ex)
+            # bulk inserts don't send the signals that track changes
+            datasets_version.bump_on_commit()
+            invalidate_country_details()
+
+    def allowed_host(self):
+        for host in settings.ALLOWED_HOSTS:
+            if host != '*' and not host.startswith('.'):
+                return host
+        return None
+
+    def start_gunicorn(self, options, base_url, host):
+        executable = options['gunicorn'] or os.path.join(
+            os.path.dirname(sys.executable), 'gunicorn')
+        if not os.path.exists(executable):
+            executable = shutil.which('gunicorn')
+        if executable is None:
+            raise CommandError('gunicorn not found, see --gunicorn')
+        server = subprocess.Popen(
+            [executable, 'ordd.wsgi', '--bind', options['bind'],
+             '--workers', str(options['workers']),
+             '--worker-class', options['worker_class'],
+             '--threads', str(options['threads']),
+             '--log-level', 'warning'],
+            cwd=settings.BASE_DIR)
+
+        # ready once the version is served
+        split = urlsplit(base_url)
+        deadline = time.monotonic() + 60
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError('gunicorn exited with status %d' %
+                                   server.returncode)
+            try:
+                conn = http.client.HTTPConnection(split.netloc, timeout=5)
+                conn.request('GET', split.path + 'version',
+                             headers={'Host': host} if host else {})
+                status = conn.getresponse().status
+                conn.close()
+                if status == 200:
+                    return server
+            except (OSError, http.client.HTTPException):
+                pass
+            time.sleep(0.2)
+        self.stop_gunicorn(server)
+        raise CommandError('gunicorn not ready on %s' % options['bind'])
+
+    def stop_gunicorn(self, server):
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
+
+    def mix(self, weights):
+        """Paths of each kind of request, built from the catalogue and the
+countries with datasets, in the form used by the frontend."""
+        countries = list(Country.objects.filter(
+            dataset__isnull=False).distinct().order_by('iso2').values_list(
+                'iso2', flat=True))
+        filters = [''] + [
+            urlencode({'applicability': name.lower()}) for name in
+            KeyTag.objects.filter(is_peril=True).order_by(
+                'name').values_list('name', flat=True)] + [
+            urlencode({'category': name.lower()}) for name in
+            KeyCategory.objects.order_by('pk').values_list('name',
+                                                           flat=True)]
+        levels = list(KeyLevel.objects.order_by('pk').values_list(
+            'pk', flat=True))
+        categories = list(KeyCategory.objects.order_by('pk').values_list(
+            'pk', flat=True))
+
+        paths = {
+            'scoring': ['scoring/'],
+            'scoring_country': ['scoring/%s?%s' % (country, query)
+                                for country in countries
+                                for query in filters],
+            'scoring_category': ['scoring_category/?%s' % query
+                                 for query in filters
+                                 if not query.startswith('category')],
+            'dataset_country': ['dataset/?country=%s%s' % (
+                country, '&' + query if query else '')
+                for country in countries for query in filters],
+            'keydataset': ['keydataset/', 'keydataset/tag/'] + [
+                'keydataset/%d/' % level for level in levels] + [
+                'keydataset/%d/%d/' % (level, category)
+                for level in levels for category in categories],
+        }
+        return [(name, weight, paths[name])
+                for name, weight in weights.items()
+                if weight > 0 and paths[name]]
+
+    def meta(self, options, base_url, weights):
+        return OrderedDict([
+            ('date', timezone.now().isoformat()),
+            ('python', platform.python_version()),
+            ('django', django.get_version()),
+            ('database', connection.vendor),
+            ('url', base_url),
+            ('workers', None if options['url'] else options['workers']),
+            ('worker_class', None if options['url']
+             else options['worker_class']),
+            ('threads', None if options['url'] else options['threads']),
+            ('concurrency', options['concurrency']),
+            ('duration', options['duration']),
+            ('warmup', options['warmup']),
+            ('seed', options['seed']),
+            ('synthetic_datasets', options['datasets']),
+            ('datasets', Dataset.objects.count()),
+            ('weights', weights),
+        ])
+
+    def report(self, results, mix):
+        self.stdout.write('%-18s %9s %9s %7s %9s %9s %9s' % (
+            'requests', 'count', 'req/s', 'errors', 'p50 ms', 'p95 ms',
+            'p99 ms'))
+        for name in ['all'] + [name for name, _, _ in mix]:
+            result = results[name]
+            self.stdout.write('%-18s %9d %9.1f %7d %9.1f %9.1f %9.1f' % (
+                name, result['requests'], result['rps'], result['errors'],
+                result['p50'], result['p95'], result['p99']))
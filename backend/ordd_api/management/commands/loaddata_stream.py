@@ -0,0 +1,152 @@
+from collections import OrderedDict
+from django.apps import apps
+from django.core.serializers.base import build_instance
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, transaction
+from ordd_api.catalogue import CATALOGUE_MODELS, catalogue_version
+from ordd_api.models import Dataset
+from ordd_api.scoring_cache import datasets_version
+from ordd_api.country_details import invalidate_country_details
+from ordd_api.lib.bulk_load import (open_text, iter_json_array,
+                                    suspend_auto_now, reset_sequences,
+                                    bulk_insert, Throughput)
+
+
+class Command(BaseCommand):
+    help = ('Import json dump streaming it and inserting new objects in'
+            ' bulk without trigger any signal')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--filein', nargs=1, type=str, required=True,
+                            help='json dump file (gzipped if ends with .gz)')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='number of objects inserted per query')
+        parser.add_argument('--progress', type=int, default=10000,
+                            help='report throughput every N objects')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS,
+                            help='database where load the dump')
+
+    def handle(self, *args, **options):
+        self.using = options['database']
+        self.batch_size = options['batch_size']
+        self.natural_keys = {}
+        self.counters = OrderedDict()
+        self.throughput = Throughput(self.stdout.write, options['progress'])
+
+        try:
+            with transaction.atomic(using=self.using):
+                with open_text(options['filein'][0]) as stream:
+                    self.load(stream)
+                reset_sequences(list(self.counters), self.using)
+                # bulk inserts don't send the signals that track changes
+                if any(model in self.counters for model in CATALOGUE_MODELS):
+                    catalogue_version.bump_on_commit(self.using)
+                if Dataset in self.counters:
+                    datasets_version.bump_on_commit(self.using)
+                    invalidate_country_details(using=self.using)
+        except Exception as ex:
+            raise CommandError(
+                'Data import failed with exception of class %s and error'
+                ' string %s.' % (ex.__class__, ex))
+
+        for model, count in self.counters.items():
+            self.stdout.write('  %s: %d' % (model._meta.label, count))
+        self.stdout.write(self.style.SUCCESS(
+            'Successfully imported %s.' % self.throughput.summary()))
+
+    def load(self, stream):
+        # objects are grouped by model as 'dumpdata' emits them, each group
+        # is flushed before the next one starts so natural keys of
+        # previous groups can be resolved
+        group_model = None
+        group = []
+        for item in iter_json_array(stream):
+            model = apps.get_model(item['model'])
+            if model is not group_model or len(group) >= self.batch_size:
+                self.flush(group_model, group)
+                group_model, group = model, []
+            group.append(self.build(model, item))
+        self.flush(group_model, group)
+
+    def resolve(self, model, value):
+        """Return the primary key for 'value', looking up natural keys
+just the first time they are met."""
+        if not isinstance(value, (list, tuple)):
+            return model._meta.pk.to_python(value)
+
+        key = (model, tuple(value))
+        if key not in self.natural_keys:
+            self.natural_keys[key] = (
+                model._default_manager.db_manager(self.using)
+                .get_by_natural_key(*value).pk)
+        return self.natural_keys[key]
+
+    def build(self, model, item):
+        data = {}
+        m2m_data = {}
+        if item.get('pk') is not None:
+            data[model._meta.pk.attname] = model._meta.pk.to_python(
+                item['pk'])
+
+        for name, value in item['fields'].items():
+            field = model._meta.get_field(name)
+            if field.many_to_many:
+                m2m_data[field] = [self.resolve(field.related_model, v)
+                                   for v in value]
+            elif field.many_to_one or field.one_to_one:
+                data[field.attname] = (
+                    None if value is None else
+                    self.resolve(field.related_model, value))
+            else:
+                data[field.attname] = field.to_python(value)
+
+        # objects dumped without primary key ('--natural-primary') are
+        # matched to the existing rows by natural key, as 'loaddata' does
+        return build_instance(model, data, self.using), m2m_data
+
+    def flush(self, model, group):
+        if not group:
+            return
+
+        manager = model._base_manager.using(self.using)
+        objs = [obj for obj, _ in group]
+
+        # rows already in the database are updated one by one, as
+        # 'loaddata' does, all the others are inserted in bulk
+        existing = set(manager.filter(
+            pk__in=[obj.pk for obj in objs if obj.pk is not None]
+        ).values_list('pk', flat=True))
+        with suspend_auto_now(model):
+            for obj in objs:
+                if obj.pk in existing:
+                    obj.save_base(raw=True, using=self.using)
+            # the new objects get their primary keys for the relations
+            bulk_insert(model, [obj for obj in objs
+                                if obj.pk is None or obj.pk not in existing],
+                        batch_size=self.batch_size, using=self.using)
+
+        fields = OrderedDict()
+        for _, m2m_data in group:
+            fields.update((field, None) for field in m2m_data)
+
+        for field in fields:
+            through = field.remote_field.through
+            src = through._meta.get_field(field.m2m_field_name()).attname
+            dst = through._meta.get_field(
+                field.m2m_reverse_field_name()).attname
+            through_manager = through._base_manager.using(self.using)
+            if existing:
+                through_manager.filter(**{'%s__in' % src: existing}).delete()
+
+            rows = []
+            for obj, m2m_data in group:
+                if obj.pk is None:
+                    raise ValueError(
+                        'many to many relations of %s objects require'
+                        ' primary keys in the dump' % model._meta.label)
+                rows += [through(**{src: obj.pk, dst: pk})
+                         for pk in m2m_data.get(field, [])]
+            through_manager.bulk_create(rows, batch_size=self.batch_size)
+
+        self.counters[model] = self.counters.get(model, 0) + len(objs)
+        self.throughput.add(len(objs))
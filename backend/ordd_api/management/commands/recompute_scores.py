@@ -0,0 +1,120 @@
+import logging
+import time
+from functools import partial
+from multiprocessing import Pool
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from ordd_api.country_details import refresh_country_details
+from ordd_api.models import Country, CountryDetails, Dataset
+from ordd_api.parallel_scoring import PARALLEL_SCORINGS, parallel_score
+from ordd_api.recompute import (SCOPE_ALL, SCOPE_WORLD, WORLD_SCORINGS,
+                                background_enabled, claim_recompute,
+                                due_recomputes, enqueue_recompute,
+                                store_world_scores)
+from ordd_api.scoring_cache import scoring_request
+from ordd_api.views import Score
+
+NO_FILTERS = ((), ())
+
+logger = logging.getLogger('ordd_api.recompute')
+
+
+class Command(BaseCommand):
+    help = ('Compute again in background the scorings marked as dirty by'
+            ' the changes of datasets and countries, see'
+            ' ORDD_SCORING_BACKGROUND')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='compute the due scorings and exit')
+        parser.add_argument('--interval', type=float, default=1,
+                            help='seconds between checks of the queue')
+        parser.add_argument('--batch', type=int, default=50,
+                            help='due scorings read at each check')
+        parser.add_argument('--workers', type=int, default=0,
+                            help='processes computing the world scorings by'
+                            ' partitions of countries, 0 to compute them in'
+                            ' this process')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        self.workers = options['workers']
+        if not background_enabled():
+            self.stderr.write('ORDD_SCORING_BACKGROUND is not set, the'
+                              ' views compute the scorings themselves.')
+        while True:
+            close_old_connections()
+            computed = self.drain(options['batch'])
+            if options['once'] and not computed:
+                break
+            if not computed:
+                time.sleep(options['interval'])
+
+    def drain(self, batch):
+        """Compute the due scorings, return how many."""
+        computed = 0
+        for mark in due_recomputes(batch):
+            if not claim_recompute(mark):
+                continue
+            start = time.monotonic()
+            try:
+                self.recompute(mark.scope)
+            except Exception:
+                logger.exception('recompute of %s failed', mark.scope)
+                # retried after the debounce delay
+                self.enqueue_again(mark.scope)
+                continue
+            computed += 1
+            if self.verbosity > 1:
+                self.stdout.write('  %s: %.2f s' % (
+                    mark.scope, time.monotonic() - start))
+        return computed
+
+    def recompute(self, scope):
+        if scope == SCOPE_WORLD:
+            self.recompute_world()
+        elif scope == SCOPE_ALL:
+            countries = Country.objects.filter(
+                pk__in=Dataset.objects.values('country')) | \
+                Country.objects.filter(
+                    pk__in=CountryDetails.objects.values('country'))
+            for iso2 in countries.order_by('iso2').values_list('iso2',
+                                                               flat=True):
+                self.recompute_country(iso2)
+            self.recompute_world()
+        else:
+            iso2 = Country.objects.filter(
+                pk=int(scope.split(':')[1])).values_list('iso2',
+                                                         flat=True).first()
+            if iso2 is not None:
+                self.recompute_country(iso2)
+
+    def recompute_country(self, iso2):
+        refresh_country_details(iso2, partial(
+            Score.country_details, scoring_request(NO_FILTERS), iso2))
+
+    def recompute_world(self):
+        request = scoring_request(NO_FILTERS)
+        if self.workers <= 0:
+            for name in WORLD_SCORINGS:
+                store_world_scores(name, getattr(Score, name)(request))
+            return
+
+        # the processes open their own database connections
+        connections.close_all()
+        with Pool(self.workers) as pool:
+            for name in WORLD_SCORINGS:
+                if name in PARALLEL_SCORINGS:
+                    value = parallel_score(name, NO_FILTERS, pool)
+                else:
+                    value = getattr(Score, name)(request)
+                store_world_scores(name, value)
+
+    def enqueue_again(self, scope):
+        if scope == SCOPE_ALL:
+            enqueue_recompute()
+        elif scope == SCOPE_WORLD:
+            # the world follows each country
+            enqueue_recompute([])
+        else:
+            enqueue_recompute([int(scope.split(':')[1])])
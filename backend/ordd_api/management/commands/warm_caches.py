@@ -0,0 +1,101 @@
+import time
+from functools import partial
+from multiprocessing import Pool
+from django.core.cache import cache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from ordd_api.models import Country, Dataset, KeyCategory, KeyTag
+from ordd_api.country_details import materialized_country_details
+from ordd_api.recompute import (WORLD_SCORINGS, background_enabled,
+                                store_world_scores)
+from ordd_api.scoring_cache import cached_score, scoring_request
+from ordd_api.views import Score
+
+NO_FILTERS = ((), ())
+
+
+def warm(task):
+    """Compute and store the scoring described by 'task', return it with
+the elapsed time."""
+    name, args, filters = task
+    start = time.monotonic()
+    compute = partial(getattr(Score, name), scoring_request(filters), *args)
+    if name == 'country_details' and filters == NO_FILTERS:
+        # served from the materialized details, not from the cache
+        materialized_country_details(args[0], compute)
+    elif (name in WORLD_SCORINGS and filters == NO_FILTERS and
+            background_enabled()):
+        # served from the last computed world scorings
+        store_world_scores(name, compute())
+    else:
+        cached_score(name, args, filters, compute)
+    return task, time.monotonic() - start
+
+
+class Command(BaseCommand):
+    help = ('Precompute the scoring of the world, of the countries with'
+            ' datasets and of the common filters and store them in the'
+            ' cache')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4,
+                            help='number of worker processes, 0 to compute'
+                            ' in this process')
+        parser.add_argument('--country-filters', action='store_true',
+                            help='warm also the details of each country'
+                            ' filtered by single peril and category')
+
+    def tasks(self, country_filters):
+        perils = [name.lower() for name in KeyTag.objects.filter(
+            is_peril=True).order_by('name').values_list('name', flat=True)]
+        categories = [name.lower() for name in KeyCategory.objects.order_by(
+            'pk').values_list('name', flat=True)]
+        filters = ([((peril,), ()) for peril in perils] +
+                   [((), (category,)) for category in categories])
+        countries = Country.objects.filter(pk__in=Dataset.objects.values(
+            'country')).order_by('name').values_list('iso2', flat=True)
+
+        tasks = [('all_countries', [], NO_FILTERS),
+                 ('all_countries_categories', [], NO_FILTERS),
+                 ('all_regions', [], NO_FILTERS)]
+        tasks += [('all_countries', [], item) for item in filters]
+        tasks += [('all_regions', [], item) for item in filters]
+        tasks += [('all_countries_categories', [], ((peril,), ()))
+                  for peril in perils]
+        for country in countries:
+            tasks.append(('country_details', [country], NO_FILTERS))
+            if country_filters:
+                tasks += [('country_details', [country], item)
+                          for item in filters]
+        return tasks
+
+    def handle(self, *args, **options):
+        if isinstance(cache, LocMemCache):
+            raise CommandError(
+                'the default cache is local to each process, configure a'
+                ' shared one (see CACHES in settings.py.tmpl)')
+
+        self.verbosity = options['verbosity']
+        tasks = self.tasks(options['country_filters'])
+        start = time.monotonic()
+        if options['workers'] > 0:
+            # workers open their own database connections
+            connections.close_all()
+            with Pool(options['workers']) as pool:
+                results = pool.imap_unordered(warm, tasks)
+                self.report(results)
+        else:
+            self.report(warm(task) for task in tasks)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Successfully warmed %d scorings in %.1f s.' % (
+                len(tasks), time.monotonic() - start)))
+
+    def report(self, results):
+        for (name, args, filters), elapsed in results:
+            if self.verbosity > 1:
+                self.stdout.write('  %s %s %s: %.2f s' % (
+                    name, ' '.join(args),
+                    ' '.join('|'.join(values) for values in filters if
+                             values), elapsed))
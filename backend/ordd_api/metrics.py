@@ -0,0 +1,246 @@
+# metrics.py
+"""Counters and histograms of the api served in the Prometheus text format.
+
+Each process keeps its own values and writes them, at most every
+ORDD_METRICS_FLUSH_INTERVAL seconds, to a file of ORDD_METRICS_DIR; the
+metrics endpoint sums the files of all the processes (gunicorn workers
+included). Without ORDD_METRICS_DIR only the values of the serving process
+are reported."""
+import atexit
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+
+from django.conf import settings
+
+from .lib.ttl_cache import registry as ttl_caches
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0)
+QUERIES_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 5000)
+MAIL_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# name: (type, labels, help, buckets)
+METRICS = {
+    'ordd_http_requests_total': (
+        'counter', ('view', 'method', 'status'),
+        'Requests by view, method and response status.', None),
+    'ordd_http_request_duration_seconds': (
+        'histogram', ('view', 'method'),
+        'Time to produce the response of a view.', LATENCY_BUCKETS),
+    'ordd_http_request_queries': (
+        'histogram', ('view', ),
+        'Sql queries run by a request.', QUERIES_BUCKETS),
+    'ordd_mail_duration_seconds': (
+        'histogram', ('template', ),
+        'Time to send a mail.', MAIL_BUCKETS),
+    'ordd_mail_failures_total': (
+        'counter', ('template', ), 'Mails not sent because of an error.',
+        None),
+    'ordd_cache_requests_total': (
+        'counter', ('cache', 'result'),
+        'Lookups of the caches by result (hit or miss).', None),
+    'ordd_single_flight_total': (
+        'counter', ('cache', 'outcome'),
+        'Cache misses by outcome: computed, stale value served, waited for'
+        ' another process or computed after the wait timeout.', None),
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (name, _escape(value))
+                             for name, value in pairs)
+
+
+def _bound(value):
+    return '%g' % value
+
+
+class Metrics(object):
+    """Metrics of this process, see the module documentation."""
+
+    def __init__(self, directory, flush_interval, retention):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # a forked process starts from zero with its own file
+        self.pid = os.getpid()
+        self.filename = None
+        if self.directory:
+            self.filename = os.path.join(self.directory, '%d-%s.json' % (
+                self.pid, uuid.uuid4().hex))
+        self.counters = {}
+        self.histograms = {}
+        self.flushed = 0.0
+        self._timer = None
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            values = self.counters.setdefault(name, {})
+            values[labels] = values.get(labels, 0) + value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][3]
+        with self._lock:
+            values = self.histograms.setdefault(name, {})
+            histogram = values.get(labels)
+            if histogram is None:
+                # counts of each bucket (not cumulated), sum
+                histogram = values[labels] = [[0] * (len(buckets) + 1), 0.0]
+            histogram[0][bisect_left(buckets, value)] += 1
+            histogram[1] += value
+
+    def snapshot(self):
+        """Values of the process in a json serializable form."""
+        with self._lock:
+            counters = {name: [[list(labels), value]
+                               for labels, value in values.items()]
+                        for name, values in self.counters.items()}
+            histograms = {name: [[list(labels), histogram[0][:],
+                                  histogram[1]]
+                                 for labels, histogram in values.items()]
+                          for name, values in self.histograms.items()}
+        # the in process caches count their own lookups
+        counters.setdefault('ordd_cache_requests_total', []).extend(
+            [[name, result], count]
+            for name, cache in ttl_caches.items()
+            for result, count in (('hit', cache.hits),
+                                  ('miss', cache.misses)))
+        return {'counters': counters, 'histograms': histograms}
+
+    def flush(self, force=False):
+        """Write the values of the process to its file, if due."""
+        if os.getpid() != self.pid:
+            self._reset()
+        now = time.monotonic()
+        if self.filename is None:
+            return
+        if not force and now - self.flushed < self.flush_interval:
+            # values of idle processes are written anyway
+            self._schedule(self.flush_interval - (now - self.flushed))
+            return
+        if not self.counters and not self.histograms:
+            # e.g. management commands, nothing worth a file
+            return
+        with self._flush_lock:
+            self.flushed = now
+            os.makedirs(self.directory, exist_ok=True)
+            tmp = '%s.tmp' % self.filename
+            with open(tmp, 'w') as fileout:
+                json.dump(self.snapshot(), fileout)
+            os.replace(tmp, self.filename)
+
+    def _schedule(self, delay):
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(delay, self._scheduled_flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _scheduled_flush(self):
+        with self._lock:
+            self._timer = None
+        self.flush(force=True)
+
+    def snapshots(self):
+        """Snapshots of all the processes, files not updated for
+'retention' seconds belong to old processes and are removed."""
+        if self.filename is None:
+            return [self.snapshot()]
+
+        self.flush(force=True)
+        snapshots = []
+        oldest = time.time() - self.retention
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < oldest:
+                    os.remove(path)
+                    continue
+                with open(path) as filein:
+                    snapshots.append(json.load(filein))
+            except (OSError, ValueError):
+                # removed or replaced meanwhile
+                continue
+        return snapshots
+
+    def collect(self):
+        """Sum the values of all the processes."""
+        counters = {}
+        histograms = {}
+        for snapshot in self.snapshots():
+            for name, values in snapshot['counters'].items():
+                total = counters.setdefault(name, {})
+                for labels, value in values:
+                    labels = tuple(labels)
+                    total[labels] = total.get(labels, 0) + value
+            for name, values in snapshot['histograms'].items():
+                total = histograms.setdefault(name, {})
+                for labels, counts, value_sum in values:
+                    labels = tuple(labels)
+                    if labels not in total:
+                        total[labels] = [[0] * len(counts), 0.0]
+                    histogram = total[labels]
+                    histogram[0] = [a + b for a, b in zip(histogram[0],
+                                                          counts)]
+                    histogram[1] += value_sum
+        return counters, histograms
+
+    def render(self):
+        """All the metrics in the Prometheus text format."""
+        counters, histograms = self.collect()
+        lines = []
+        for name in sorted(METRICS):
+            kind, label_names, help_text, buckets = METRICS[name]
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+            if kind == 'counter':
+                for labels, value in sorted(counters.get(name, {}).items()):
+                    lines.append('%s%s %s' % (
+                        name, _labels(label_names, labels), value))
+                continue
+            for labels, (counts, value_sum) in sorted(
+                    histograms.get(name, {}).items()):
+                cumulated = 0
+                for bound, count in zip(buckets + (float('inf'), ), counts):
+                    cumulated += count
+                    lines.append('%s_bucket%s %d' % (
+                        name, _labels(label_names, labels, [
+                            ('le', '+Inf' if bound == float('inf')
+                             else _bound(bound))]), cumulated))
+                lines.append('%s_sum%s %s' % (
+                    name, _labels(label_names, labels), repr(value_sum)))
+                lines.append('%s_count%s %d' % (
+                    name, _labels(label_names, labels), cumulated))
+        return '\n'.join(lines) + '\n'
+
+
+def count_lookup(cache, hit):
+    """Count a lookup of 'cache' (a name), a hit if 'hit' is true."""
+    metrics.inc('ordd_cache_requests_total',
+                (cache, 'hit' if hit else 'miss'))
+
+
+metrics = Metrics(getattr(settings, 'ORDD_METRICS_DIR', None),
+                  getattr(settings, 'ORDD_METRICS_FLUSH_INTERVAL', 5),
+                  getattr(settings, 'ORDD_METRICS_RETENTION', 7 * 24 * 3600))
+atexit.register(metrics.flush, force=True)
@@ -0,0 +1,317 @@
+# middleware.py
+import cProfile
+import logging
+import random
+import re
+import threading
+import time
+import zlib
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+
+from .authentication import request_user
+from .lib.payload import accepted_encodings
+from .lib.nplusone import RepeatedQueries, explain, group_queries
+from .lib.timing import request_timing, install_serializer_timing
+from .metrics import metrics
+from .models import RequestProfile
+from .profiling import sampler, store_profile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript',
+                      'application/xml', 'image/svg+xml')
+
+class GzipCompressor(object):
+    encoding = 'gzip'
+
+    def __init__(self, level):
+        # wbits 16 + MAX_WBITS produces the gzip container
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED,
+                                           16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def flush(self):
+        return self.compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self.compressor.flush()
+
+
+class BrotliCompressor(object):
+    encoding = 'br'
+
+    def __init__(self, quality):
+        self.compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self.compressor.process(data)
+
+    def flush(self):
+        return self.compressor.flush()
+
+    def finish(self):
+        return self.compressor.finish()
+
+
+class CompressionMiddleware(object):
+    """Compress the responses with brotli (when the 'brotli' package is
+installed) or gzip, according to the Accept-Encoding of the request.
+
+Responses smaller than ORDD_COMPRESSION_MIN_SIZE bytes, already encoded or
+of a not compressible content type are left untouched. Streaming responses
+are compressed chunk by chunk."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'ORDD_COMPRESSION_MIN_SIZE', 1024)
+        self.gzip_level = getattr(settings, 'ORDD_COMPRESSION_GZIP_LEVEL', 6)
+        self.brotli_quality = getattr(
+            settings, 'ORDD_COMPRESSION_BROTLI_QUALITY', 5)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if (response.status_code != 200 or
+                response.has_header('Content-Encoding') or
+                not response.get('Content-Type', '').startswith(
+                    COMPRESSIBLE_TYPES)):
+            return response
+        if (not response.streaming and
+                len(response.content) < self.min_size):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        compressor = self.compressor(
+            request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if compressor is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = self.compress_stream(
+                compressor, response.streaming_content)
+            del response['Content-Length']
+        else:
+            compressed = compressor.compress(
+                response.content) + compressor.finish()
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        if response.has_header('ETag'):
+            # the compressed body is not byte for byte the same
+            response['ETag'] = re.sub(r'^"', 'W/"', response['ETag'])
+        response['Content-Encoding'] = compressor.encoding
+        return response
+
+    def compressor(self, accept_encoding):
+        encodings = accepted_encodings(accept_encoding)
+        if brotli is not None and 'br' in encodings:
+            return BrotliCompressor(self.brotli_quality)
+        if 'gzip' in encodings:
+            return GzipCompressor(self.gzip_level)
+        return None
+
+    @staticmethod
+    def compress_stream(compressor, stream):
+        for chunk in stream:
+            data = compressor.compress(chunk)
+            # flush so each chunk reaches the client without waiting
+            # for the next ones
+            data += compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+
+class TimingMiddleware(object):
+    """Measure wall, sql, serializer and render time of the requests whose
+path matches one of the regular expressions in ORDD_TIMING_ENDPOINTS, and
+report them in a Server-Timing header (unless ORDD_TIMING_HEADER is False)
+and in a log line of the 'ordd_api.timing' logger.
+
+The middleware is not loaded at all when no endpoint is configured, put it
+first to include the time of the other middlewares in the total."""
+
+    def __init__(self, get_response):
+        endpoints = getattr(settings, 'ORDD_TIMING_ENDPOINTS', ())
+        if not endpoints:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.endpoints = re.compile('|'.join(
+            '(?:%s)' % endpoint for endpoint in endpoints))
+        self.header = getattr(settings, 'ORDD_TIMING_HEADER', True)
+        self.logger = logging.getLogger('ordd_api.timing')
+        install_serializer_timing()
+
+    def __call__(self, request):
+        if not self.endpoints.search(request.path_info):
+            return self.get_response(request)
+
+        with request_timing(connections.all()) as timing:
+            request._ordd_timing = timing
+            response = self.get_response(request)
+
+        metrics = timing.metrics()
+        if self.header:
+            response['Server-Timing'] = timing.server_timing(metrics)
+        record = timing.record(request, response, metrics)
+        self.logger.info(' '.join('%s=%s' % item for item in record.items()),
+                         extra={'timing': record})
+        return response
+
+    def process_template_response(self, request, response):
+        timing = getattr(request, '_ordd_timing', None)
+        if timing is not None:
+            # rendered by the handler right after this
+            timing.rendering()
+            response.add_post_render_callback(timing.rendered)
+        return response
+
+
+class MetricsMiddleware(object):
+    """Count the requests by view and status, and record their duration
+and sql queries, see 'ordd_api.metrics'."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        with request_timing(connections.all()) as timing:
+            queries = timing.sql_count
+            response = self.get_response(request)
+            queries = timing.sql_count - queries
+        elapsed = time.perf_counter() - start
+
+        match = request.resolver_match
+        view = match.url_name if match is not None else None
+        # unresolved paths are grouped, they are unbounded
+        view = view or '-'
+        metrics.inc('ordd_http_requests_total',
+                    (view, request.method, str(response.status_code)))
+        metrics.observe('ordd_http_request_duration_seconds',
+                        (view, request.method), elapsed)
+        metrics.observe('ordd_http_request_queries', (view, ), queries)
+        metrics.flush()
+        return response
+
+
+class ProfilingMiddleware(object):
+    """Store profiles of the requests, see 'ordd_api.profiling':
+
+- with cProfile, a fraction ORDD_PROFILING_SAMPLE_RATE of the requests and
+  the requests of staff users with the ORDD_PROFILING_HEADER header;
+- with the stack sampler, the other requests slower than
+  ORDD_PROFILING_THRESHOLD seconds.
+
+The middleware is not loaded when none of them is configured."""
+
+    def __init__(self, get_response):
+        self.threshold = getattr(settings, 'ORDD_PROFILING_THRESHOLD', None)
+        self.sample_rate = getattr(settings, 'ORDD_PROFILING_SAMPLE_RATE', 0)
+        header = getattr(settings, 'ORDD_PROFILING_HEADER', None)
+        if self.threshold is None and not self.sample_rate and not header:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.header = None
+        if header:
+            self.header = 'HTTP_' + header.upper().replace('-', '_')
+
+    def __call__(self, request):
+        trigger = None
+        # the header is honoured only for staff users, authenticated here as
+        # by the views, the other requests are profiled as the others
+        if (self.header and request.META.get(self.header) and
+                getattr(request_user(request), 'is_staff', False)):
+            trigger = 'header'
+        elif self.sample_rate and random.random() < self.sample_rate:
+            trigger = 'sample'
+        elif self.threshold is None:
+            return self.get_response(request)
+
+        thread_id = threading.get_ident()
+        profiler = None
+        samples = None
+        start = time.perf_counter()
+        if trigger is not None:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            samples = sampler.start(thread_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            else:
+                sampler.stop(thread_id)
+        duration = time.perf_counter() - start
+
+        if profiler is not None:
+            store_profile(request, response, duration,
+                          RequestProfile.KIND_CPROFILE, trigger,
+                          profiler.dump_stats)
+        elif duration >= self.threshold:
+            def write(path):
+                with open(path, 'w') as fileout:
+                    for stack, count in samples.most_common():
+                        fileout.write('%s %d\n' % (stack, count))
+            store_profile(request, response, duration,
+                          RequestProfile.KIND_SAMPLED, 'threshold', write)
+        return response
+
+
+class NPlusOneMiddleware(object):
+    """Report the sql statements executed more than ORDD_NPLUSONE_THRESHOLD
+times by a request, the N+1 pattern, see 'ordd_api.lib.nplusone'.
+
+Repeated statements are logged as warnings of the 'ordd_api.nplusone'
+logger with their call sites, and their query plan when
+ORDD_NPLUSONE_EXPLAIN is set; with ORDD_NPLUSONE_RAISE they fail the
+request with RepeatedQueries, e.g. to fail the tests. Statements or call
+sites matching one of the regular expressions of ORDD_NPLUSONE_IGNORE are
+not reported.
+
+The middleware is not loaded without threshold, put it last so the
+queries of the other middlewares are not counted."""
+
+    def __init__(self, get_response):
+        self.threshold = getattr(settings, 'ORDD_NPLUSONE_THRESHOLD', None)
+        if self.threshold is None:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.explain = getattr(settings, 'ORDD_NPLUSONE_EXPLAIN', False)
+        self.fail = getattr(settings, 'ORDD_NPLUSONE_RAISE', False)
+        ignore = getattr(settings, 'ORDD_NPLUSONE_IGNORE', ())
+        self.ignore = None
+        if ignore:
+            self.ignore = re.compile('|'.join('(?:%s)' % pattern
+                                              for pattern in ignore))
+        self.logger = logging.getLogger('ordd_api.nplusone')
+
+    def __call__(self, request):
+        with group_queries(connections.all()) as groups:
+            response = self.get_response(request)
+
+        repeated = groups.repeated(self.threshold, self.ignore)
+        if not repeated:
+            return response
+        if self.explain:
+            for group in repeated:
+                explain(connections[group.alias], group)
+        for group in repeated:
+            self.logger.warning('%s %s: %s', request.method,
+                                request.get_full_path(), group,
+                                extra={'query_group': group})
+        if self.fail:
+            raise RepeatedQueries(repeated)
+        return response
@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-19 13:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ordd_api', '0014_migrate_content_to_v9'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CountryDetails',
+            fields=[
+                ('country', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='details', serialize=False, to='ordd_api.Country')),
+                ('revision', models.PositiveIntegerField(default=0)),
+                ('payload', models.TextField(null=True)),
+                ('payload_revision', models.PositiveIntegerField(null=True)),
+                ('catalogue_version', models.CharField(blank=True, max_length=32)),
+                ('update_time', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-19 13:58
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('ordd_api', '0015_country_details'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('create_time', models.DateTimeField(auto_now_add=True)),
+                ('method', models.CharField(max_length=16)),
+                ('path', models.CharField(max_length=2048)),
+                ('query', models.TextField(blank=True)),
+                ('status', models.PositiveSmallIntegerField()),
+                ('duration', models.FloatField(verbose_name='Duration (s)')),
+                ('kind', models.CharField(choices=[('cprofile', 'cProfile stats'), ('sampled', 'sampled stacks (folded)')], max_length=16)),
+                ('trigger', models.CharField(max_length=16)),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ('-create_time', '-pk'),
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.1 on 2026-10-19 14:18
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ordd_api', '0016_request_profile'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScoreRecompute',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(max_length=32, unique=True)),
+                ('first_time', models.DateTimeField()),
+                ('last_time', models.DateTimeField()),
+                ('due_time', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='WorldScores',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=64, unique=True)),
+                ('payload', models.TextField()),
+                ('update_time', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -316,6 +316,76 @@ class Dataset(models.Model):
     tag = models.ManyToManyField(KeyTag, blank=True)
 
 
+class CountryDetails(models.Model):
+    """Materialized scoring details of a country without filters.
+
+'revision' is increased when datasets or hazard applicability of the
+country change, 'payload' is valid while 'payload_revision' matches it
+and 'catalogue_version' matches the current catalogue version."""
+    country = models.OneToOneField(Country, primary_key=True,
+                                   related_name='details',
+                                   on_delete=models.CASCADE)
+    revision = models.PositiveIntegerField(default=0)
+    payload = models.TextField(null=True)
+    payload_revision = models.PositiveIntegerField(null=True)
+    catalogue_version = models.CharField(max_length=32, blank=True)
+    update_time = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return "%s (revision %d)" % (self.country_id, self.revision)
+
+
+class WorldScores(models.Model):
+    """Last computed unfiltered world scoring 'name' (a Score method),
+served while it is computed again in background."""
+    name = models.CharField(max_length=64, unique=True)
+    payload = models.TextField()
+    update_time = models.DateTimeField()
+
+    def __str__(self):
+        return self.name
+
+
+class ScoreRecompute(models.Model):
+    """Scoring to compute again in background: 'scope' is 'country:<id>',
+'world' or 'all', it is due at 'due_time'."""
+    scope = models.CharField(max_length=32, unique=True)
+    first_time = models.DateTimeField()
+    last_time = models.DateTimeField()
+    due_time = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return "%s (due %s)" % (self.scope, self.due_time)
+
+
+class RequestProfile(models.Model):
+    """Profile of a request stored by the ProfilingMiddleware, the content
+is in 'filename' under ORDD_PROFILING_DIR."""
+    KIND_CPROFILE = 'cprofile'
+    KIND_SAMPLED = 'sampled'
+    KIND_CHOICES = ((KIND_CPROFILE, 'cProfile stats'),
+                    (KIND_SAMPLED, 'sampled stacks (folded)'))
+
+    create_time = models.DateTimeField(auto_now_add=True)
+    method = models.CharField(max_length=16)
+    path = models.CharField(max_length=2048)
+    query = models.TextField(blank=True)
+    status = models.PositiveSmallIntegerField()
+    duration = models.FloatField("Duration (s)")
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    trigger = models.CharField(max_length=16)
+    user = models.ForeignKey(User, blank=True, null=True,
+                             on_delete=models.SET_NULL)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ('-create_time', '-pk')
+
+    def __str__(self):
+        return "%s %s (%.2f s)" % (self.method, self.path, self.duration)
+
+
 #  Don't remove 'KeyPeril' model (now 'KeyPerilObsolete') allow
 #  backward migrations.
 class KeyPerilObsoleteManager(models.Manager):
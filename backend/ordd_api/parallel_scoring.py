@@ -0,0 +1,101 @@
+# parallel_scoring.py
+"""World scorings computed by a pool of processes, for batch jobs.
+
+The countries with datasets are split in partitions of similar number of
+datasets, each process computes the world scoring of its partitions
+(loading only their datasets) and the partial results are merged in the
+same response the views produce: counters are summed, the rows of the
+countries are sorted by country name as the serial computation does."""
+import os
+
+from django.db.models import Count
+
+from .models import Country, Dataset
+from .scoring_cache import scoring_request
+from .views import Score
+
+# scorings that can be computed by partition
+PARALLEL_SCORINGS = ('all_countries', 'all_countries_categories')
+
+
+def partition_countries(chunks):
+    """Split the countries with datasets in at most 'chunks' lists of iso2
+with similar number of datasets, the largest countries first."""
+    sizes = Dataset.objects.values_list('country__iso2').annotate(
+        datasets=Count('pk')).order_by('-datasets', 'country__iso2')
+    partitions = [[0, []] for _ in range(max(1, chunks))]
+    for iso2, datasets in sizes:
+        # to the least loaded partition
+        partition = min(partitions, key=lambda item: item[0])
+        partition[0] += datasets
+        partition[1].append(iso2)
+    return [countries for _, countries in partitions if countries]
+
+
+def score_partition(task):
+    """Compute the scoring 'name' with 'filters' of the 'countries' of
+'task', run by the processes of the pool."""
+    name, filters, countries = task
+    return getattr(Score, name)(scoring_request(filters), countries)
+
+
+def merge_all_countries(results, order):
+    ret = {'scores': [], 'datasets_count': 0, 'fullscores_count': 0,
+           'countries_count': 0, 'categories_counters': [],
+           'perils_counters': []}
+    for result in results:
+        ret['scores'].extend(result['scores'])
+        for name in ('datasets_count', 'fullscores_count',
+                     'countries_count'):
+            ret[name] += result[name]
+        for name in ('categories_counters', 'perils_counters'):
+            if not ret[name]:
+                ret[name] = [dict(counter) for counter in result[name]]
+                continue
+            for total, counter in zip(ret[name], result[name]):
+                total['count'] += counter['count']
+                total['fullcount'] += counter['fullcount']
+    ret['scores'].sort(key=lambda item: order[item['country']])
+    return ret
+
+
+def merge_all_countries_categories(results, order):
+    header = None
+    rows = []
+    for result in results:
+        header = result[0]
+        rows.extend(result[1:])
+    rows.sort(key=lambda row: order[row[0]])
+    return [header] + rows
+
+
+MERGES = {
+    'all_countries': merge_all_countries,
+    'all_countries_categories': merge_all_countries_categories,
+}
+
+
+def parallel_score(name, filters, pool=None, chunks=None):
+    """Return the world scoring 'name' (one of PARALLEL_SCORINGS) with
+'filters', as Score computes it, from partitions of the countries computed
+by the processes of 'pool' (a multiprocessing pool), or by this process
+if None. 'chunks' is the number of partitions, by default four for each
+cpu to balance the load of the processes.
+
+The pool must be created after closing the database connections, so its
+processes open their own ones."""
+    if chunks is None:
+        chunks = 4 * (os.cpu_count() or 1)
+    tasks = [(name, filters, countries)
+             for countries in partition_countries(chunks)]
+    if not tasks:
+        # no datasets, the serial computation gives the empty shape
+        return score_partition((name, filters, []))
+
+    if pool is None:
+        results = list(map(score_partition, tasks))
+    else:
+        results = pool.map(score_partition, tasks, chunksize=1)
+    order = {iso2: position for position, iso2 in enumerate(
+        Country.objects.order_by('name').values_list('iso2', flat=True))}
+    return MERGES[name](results, order)
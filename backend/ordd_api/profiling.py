@@ -0,0 +1,139 @@
+# profiling.py
+"""Profiles of the requests stored by 'ordd_api.middleware.
+ProfilingMiddleware'.
+
+Requests explicitly profiled (sampled or asked with a header) run under
+cProfile; any other request can be followed by a sampling profiler, which
+reads the stack of its thread every ORDD_PROFILING_SAMPLE_INTERVAL seconds
+from a background thread, and is stored only when it is slower than
+ORDD_PROFILING_THRESHOLD. Stored profiles are bounded in number and size,
+the oldest ones are removed first."""
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.conf import settings
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import RequestProfile
+
+
+def profiling_dir():
+    return getattr(settings, 'ORDD_PROFILING_DIR',
+                   os.path.join(settings.BASE_DIR, 'profiles'))
+
+
+def _frame_name(code):
+    # function with the last two components of its file, as
+    # 'ordd_api/views.py', and its first line to tell apart homonyms
+    filename = os.path.join(*code.co_filename.split(os.sep)[-2:])
+    return '%s (%s:%d)' % (code.co_name, filename, code.co_firstlineno)
+
+
+def folded_stack(frame):
+    """The stack of 'frame' in the folded format, outermost call first."""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler(object):
+    """Background thread sampling the stacks of the registered threads,
+idle while none is registered."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self, thread_id):
+        """Start sampling 'thread_id', return the counter of its stacks."""
+        samples = Counter()
+        with self._condition:
+            self.samples[thread_id] = samples
+            if self._thread is None or not self._thread.is_alive():
+                # also after a fork, which doesn't copy the thread
+                self._thread = threading.Thread(target=self._run,
+                                                name='ordd-stack-sampler',
+                                                daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return samples
+
+    def stop(self, thread_id):
+        with self._condition:
+            self.samples.pop(thread_id, None)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            # counters are updated under the lock, after 'stop' they can be
+            # read safely
+            with self._condition:
+                while not self.samples:
+                    self._condition.wait()
+                frames = sys._current_frames()
+                for thread_id, samples in self.samples.items():
+                    if thread_id != own_id and thread_id in frames:
+                        samples[folded_stack(frames[thread_id])] += 1
+                del frames
+            time.sleep(self.interval)
+
+
+sampler = StackSampler(getattr(settings, 'ORDD_PROFILING_SAMPLE_INTERVAL',
+                               0.005))
+
+
+def store_profile(request, response, duration, kind, trigger, write):
+    """Store the profile of 'request', whose content is written by
+'write(path)', then drop the oldest profiles beyond the limits."""
+    directory = profiling_dir()
+    os.makedirs(directory, exist_ok=True)
+    filename = '%s.%s' % (uuid.uuid4().hex,
+                          'prof' if kind == RequestProfile.KIND_CPROFILE
+                          else 'folded')
+    path = os.path.join(directory, filename)
+    write(path)
+
+    user = getattr(request, 'user', None)
+    profile = RequestProfile.objects.create(
+        method=request.method, path=request.path[:2048],
+        query=request.META.get('QUERY_STRING', ''),
+        status=response.status_code, duration=duration, kind=kind,
+        trigger=trigger, filename=filename, size=os.path.getsize(path),
+        user=user if user is not None and user.is_authenticated else None)
+    rotate_profiles()
+    return profile
+
+
+def rotate_profiles():
+    """Remove the oldest profiles beyond ORDD_PROFILING_MAX_FILES profiles
+or ORDD_PROFILING_MAX_BYTES bytes."""
+    max_files = getattr(settings, 'ORDD_PROFILING_MAX_FILES', 200)
+    max_bytes = getattr(settings, 'ORDD_PROFILING_MAX_BYTES',
+                        100 * 1024 * 1024)
+    total = 0
+    expired = []
+    for count, (pk, size) in enumerate(
+            RequestProfile.objects.values_list('pk', 'size')):
+        total += size
+        if count >= max_files or total > max_bytes:
+            expired.append(pk)
+    # one by one, the signal removes the files
+    for profile in RequestProfile.objects.filter(pk__in=expired):
+        profile.delete()
+
+
+@receiver(post_delete, sender=RequestProfile)
+def profile_deleted(sender, instance, **kwargs):
+    try:
+        os.remove(os.path.join(profiling_dir(), instance.filename))
+    except OSError:
+        pass
@@ -0,0 +1,91 @@
+# recompute.py
+"""Scorings computed again off the request path, enabled by
+ORDD_SCORING_BACKGROUND.
+
+Changes of the datasets or of the hazard applicability of a country mark
+the country and the world aggregates as dirty in the ScoreRecompute
+queue; a mark is due ORDD_RECOMPUTE_DEBOUNCE seconds after the last
+change, a burst of changes postpones it at most up to
+ORDD_RECOMPUTE_MAX_DELAY seconds after the first one. The
+'recompute_scores' command drains the due marks, meanwhile the views serve
+the last computed results with their computation time."""
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import ScoreRecompute, WorldScores
+from .renderers import FastJSONRenderer
+
+SCOPE_WORLD = 'world'
+SCOPE_ALL = 'all'
+
+# unfiltered world scorings served from WorldScores
+WORLD_SCORINGS = ('all_countries', 'all_countries_categories', 'all_regions')
+
+
+def background_enabled():
+    return getattr(settings, 'ORDD_SCORING_BACKGROUND', False)
+
+
+def country_scope(country_id):
+    return 'country:%d' % country_id
+
+
+def enqueue_recompute(countries=None, using=None):
+    """Mark as dirty the scoring of 'countries' (ids) and of the world, of
+everything if None."""
+    if not background_enabled():
+        return
+    if countries is None:
+        scopes = [SCOPE_ALL]
+    else:
+        scopes = [country_scope(pk) for pk in sorted(countries)]
+        scopes.append(SCOPE_WORLD)
+
+    now = timezone.now()
+    debounce = timedelta(seconds=getattr(
+        settings, 'ORDD_RECOMPUTE_DEBOUNCE', 5))
+    max_delay = timedelta(seconds=getattr(
+        settings, 'ORDD_RECOMPUTE_MAX_DELAY', 60))
+    queryset = ScoreRecompute.objects.using(using)
+    for scope in scopes:
+        mark, created = queryset.get_or_create(
+            scope=scope, defaults={'first_time': now, 'last_time': now,
+                                   'due_time': now + debounce})
+        if not created:
+            queryset.filter(pk=mark.pk).update(
+                last_time=now,
+                due_time=min(now + debounce, mark.first_time + max_delay))
+
+
+def due_recomputes(limit=None):
+    queryset = ScoreRecompute.objects.filter(
+        due_time__lte=timezone.now()).order_by('due_time')
+    return list(queryset[:limit] if limit else queryset)
+
+
+def claim_recompute(mark):
+    """Remove 'mark' from the queue, False if changed meanwhile (it will be
+due again later) or already claimed by another worker."""
+    deleted, _ = ScoreRecompute.objects.filter(
+        pk=mark.pk, due_time=mark.due_time).delete()
+    return deleted > 0
+
+
+def world_scores(name):
+    """Return the last computed payload of the world scoring 'name' and its
+computation time, None if never computed."""
+    row = WorldScores.objects.filter(name=name).first()
+    if row is None:
+        return None
+    return row.payload.encode('utf-8'), row.update_time
+
+
+def store_world_scores(name, value):
+    payload = FastJSONRenderer().render(value)
+    now = timezone.now()
+    WorldScores.objects.update_or_create(
+        name=name, defaults={'payload': payload.decode('utf-8'),
+                             'update_time': now})
+    return payload, now
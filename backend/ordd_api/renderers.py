@@ -0,0 +1,85 @@
+# renderers.py
+from rest_framework import renderers
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# values rendered by orjson as the standard encoder, or refused
+COMPATIBLE_TYPES = frozenset((str, int, bool, type(None)))
+
+
+def orjson_compatible(data):
+    """True if orjson renders 'data' as the standard encoder: it writes NaN
+and infinities as null and the floats the standard encoder writes with an
+exponent differently (1e16 for 1e+16, 0.00001 for 1e-05). Non string keys
+and integers beyond 64 bits are refused by orjson, values of other types
+are checked once converted by the DRF encoder."""
+    stack = [data]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            value = value.values()
+        elif not isinstance(value, (list, tuple)):
+            value = (value,)
+        for item in value:
+            if type(item) in COMPATIBLE_TYPES:
+                continue
+            if isinstance(item, float):
+                if not (item == 0 or 1e-4 <= abs(item) < 1e16):
+                    return False
+            elif isinstance(item, (dict, list, tuple)):
+                stack.append(item)
+    return True
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """JSON renderer using orjson, when installed, for the compact output;
+indented output (as requested by the browsable API), installations
+without orjson and data which orjson can't render as the standard DRF
+renderer (see orjson_compatible) fall back to it."""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or data is None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if indent is not None or not self.compact or self.ensure_ascii:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        if not orjson_compatible(data):
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # dates and times are formatted by the DRF encoder
+        encoder = self.encoder_class()
+
+        def default(obj):
+            value = encoder.default(obj)
+            if not orjson_compatible(value):
+                raise TypeError('%r is rendered differently by orjson' % obj)
+            return value
+
+        try:
+            output = orjson.dumps(data, default=default,
+                                  option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        # keep the output a strict javascript subset as the DRF renderer
+        return output.replace(b'\xe2\x80\xa8', b'\\u2028'
+                              ).replace(b'\xe2\x80\xa9', b'\\u2029')
+
+
+class PrometheusTextRenderer(renderers.BaseRenderer):
+    """Renderer of the Prometheus text exposition format, 'data' is the
+already formatted text (or an error detail)."""
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, dict):
+            data = '# %s\n' % data.get('detail', '')
+        return data.encode(self.charset)
@@ -0,0 +1,96 @@
+# roles.py
+from django.conf import settings
+from django.contrib.auth.models import User, Group
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .lib.ttl_cache import TTLCache
+from .lib.versioned import SharedVersion
+
+ROLE_ADMIN = 'admin'
+ROLE_REVIEWER = 'reviewer'
+
+ROLES_CACHE_TTL = getattr(settings, 'ORDD_ROLES_CACHE_TTL', 60)
+
+# bumped by the signals below, the other processes drop their entries when
+# they see it changed
+roles_version = SharedVersion(
+    'ordd_api:roles_version',
+    getattr(settings, 'ORDD_AUTH_CHECK_INTERVAL', 1))
+
+user_groups_cache = TTLCache('user_groups', 4096, ROLES_CACHE_TTL,
+                             roles_version)
+role_emails_cache = TTLCache('role_emails', 64, ROLES_CACHE_TTL,
+                             roles_version)
+
+
+def last_login_only(kwargs):
+    """True if the saved user changed only its last login, as done on
+every login, which does not affect roles nor tokens."""
+    return kwargs.get('update_fields') == frozenset(('last_login',))
+
+
+def user_groups(user):
+    """Return the names of the groups of 'user'.
+
+They are loaded once per request, stored on the user instance, and
+shared between requests through 'user_groups_cache'."""
+    if not user.is_authenticated:
+        return frozenset()
+
+    try:
+        return user._ordd_groups
+    except AttributeError:
+        pass
+
+    groups = user_groups_cache.get_or_build(
+        user.pk, lambda: frozenset(user.groups.values_list('name', flat=True)))
+    user._ordd_groups = groups
+    return groups
+
+
+def has_role(user, *roles):
+    """True if 'user' belongs to at least one of 'roles' groups."""
+    return not user_groups(user).isdisjoint(roles)
+
+
+def role_emails(role):
+    """Return the email addresses of the members of 'role' group, used
+as recipients of notifications."""
+    return role_emails_cache.get_or_build(role, lambda: tuple(
+        User.objects.filter(groups__name=role).order_by(
+            'pk').values_list('email', flat=True)))
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if isinstance(instance, User):
+        user_groups_cache.delete(instance.pk)
+    elif pk_set is None:
+        # a group has been cleared, members are unknown at this point
+        user_groups_cache.clear()
+    else:
+        for pk in pk_set:
+            user_groups_cache.delete(pk)
+    role_emails_cache.clear()
+    roles_version.bump_on_commit(kwargs.get('using'))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    if last_login_only(kwargs):
+        return
+    user_groups_cache.delete(instance.pk)
+    role_emails_cache.clear()
+    roles_version.bump_on_commit(kwargs.get('using'))
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    user_groups_cache.clear()
+    role_emails_cache.clear()
+    roles_version.bump_on_commit(kwargs.get('using'))
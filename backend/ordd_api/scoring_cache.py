@@ -0,0 +1,105 @@
+# scoring_cache.py
+import hashlib
+import json
+from types import SimpleNamespace
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.http import QueryDict
+
+from .catalogue import catalogue_version
+from .lib.single_flight import SingleFlight
+from .lib.versioned import SharedVersion
+from .metrics import count_lookup, metrics
+from .models import Dataset
+
+SCORING_CACHE_TIMEOUT = getattr(settings, 'ORDD_SCORING_CACHE_TIMEOUT',
+                                7 * 24 * 3600)
+SCORING_SERVE_STALE = getattr(settings, 'ORDD_SCORING_SERVE_STALE', True)
+
+# a single process computes a missing scoring, see 'cached_score'
+scoring_flight = SingleFlight(
+    'ordd_api:scoring',
+    getattr(settings, 'ORDD_SCORING_LOCK_TIMEOUT', 120),
+    getattr(settings, 'ORDD_SCORING_WAIT_TIMEOUT', 30))
+
+# bumped when datasets change, together with the catalogue version it
+# selects the valid entries of the scoring cache
+datasets_version = SharedVersion(
+    'ordd_api:datasets_version',
+    getattr(settings, 'ORDD_CATALOGUE_CHECK_INTERVAL', 1))
+
+
+def scoring_filters(query_params):
+    """Return the filters of a scoring request in a normalized form, they
+are compared case insensitively and combined in or."""
+    return tuple(tuple(sorted({value.lower() for value in
+                               query_params.getlist(name)}))
+                 for name in ('applicability', 'category'))
+
+
+def scoring_request(filters):
+    """Return a request-like object with 'filters' as query parameters, as
+read by the Score methods."""
+    query_params = QueryDict(mutable=True)
+    for name, values in zip(('applicability', 'category'), filters):
+        query_params.setlist(name, list(values))
+    return SimpleNamespace(query_params=query_params)
+
+
+def scoring_digest(name, args, filters):
+    return hashlib.md5(json.dumps([name, args, filters]).encode(
+        'utf-8')).hexdigest()
+
+
+def scoring_key(name, args, filters):
+    return 'ordd_api:scoring:%s:%s:%s' % (
+        catalogue_version.get(), datasets_version.get(),
+        scoring_digest(name, args, filters))
+
+
+def cached_score(name, args, filters, compute):
+    """Return the result of 'compute()', the scoring 'name' of 'args' with
+'filters', from the cache if already computed for the current datasets and
+catalogue.
+
+When it is missing a single process computes it: meanwhile the others
+serve the result computed for the previous versions, if still cached and
+ORDD_SCORING_SERVE_STALE is set, or wait for it."""
+    key = scoring_key(name, args, filters)
+    value = cache.get(key)
+    count_lookup('scoring', value is not None)
+    if value is not None:
+        return value
+
+    # key of the last result computed, whatever the versions
+    latest_key = 'ordd_api:scoring:latest:%s' % scoring_digest(
+        name, args, filters)
+
+    def compute_and_store():
+        value = compute()
+        cache.set(key, value, SCORING_CACHE_TIMEOUT)
+        cache.set(latest_key, key, SCORING_CACHE_TIMEOUT)
+        return value
+
+    def stale():
+        previous = cache.get(latest_key)
+        return cache.get(previous) if previous is not None else None
+
+    value, outcome = scoring_flight.run(
+        key, compute_and_store, lambda: cache.get(key),
+        stale if SCORING_SERVE_STALE else None)
+    metrics.inc('ordd_single_flight_total', ('scoring', outcome))
+    return value
+
+
+def datasets_changed(sender, **kwargs):
+    datasets_version.bump_on_commit(kwargs.get('using'))
+
+
+post_save.connect(datasets_changed, sender=Dataset,
+                  dispatch_uid='scoring_dataset_save')
+post_delete.connect(datasets_changed, sender=Dataset,
+                    dispatch_uid='scoring_dataset_delete')
+m2m_changed.connect(datasets_changed, sender=Dataset.tag.through,
+                    dispatch_uid='scoring_dataset_tag')
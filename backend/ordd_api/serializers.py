@@ -1,19 +1,25 @@
 # ordd_api/serializers.py
 
+from collections import OrderedDict
 from django.contrib.auth.models import User, Group
 from django.contrib.auth.password_validation import validate_password
+from django.utils import timezone
 from django.utils.http import (urlencode, quote as http_quote)
 import django.core.exceptions
 from django.db import transaction
 from django.db import IntegrityError
 from rest_framework import serializers
 from rest_framework.serializers import ValidationError
-from .models import (Region, Country, KeyTag, Profile, OptIn, Dataset, Url)
+from .models import (Region, Country, KeyTag, KeyDataset, Profile, OptIn,
+                     Dataset, Url)
 from ordd_api import MAIL_SUBJECT_PREFIX
 from ordd.settings import EMAIL_CONFIRM_PROTO
 
 from .keydatasets_serializers import KeyDataset4on4Serializer
 from .mailer import mailer
+from .lib.bulk_load import bulk_insert, bulk_update
+from .scoring_cache import datasets_version
+from .country_details import invalidate_country_details
 
 
 class RegionSerializer(serializers.ModelSerializer):
@@ -216,6 +222,14 @@ class ProfileDatasetListSerializer(serializers.ModelSerializer):
         read_only_fields = ('owner', 'changed_by', 'create_time',
                             'modify_time', 'is_reviewed')
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Load with 'queryset' the related objects read by the serializer."""
+        queryset = KeyDataset4on4Serializer.setup_eager_loading(
+            queryset, 'keydataset__')
+        return queryset.select_related(
+            'owner', 'changed_by', 'country').prefetch_related('url', 'tag')
+
 
 class ProfileDatasetCreateSerializer(serializers.ModelSerializer):
     country = serializers.SlugRelatedField(slug_field='iso2',
@@ -233,6 +247,157 @@ class ProfileDatasetCreateSerializer(serializers.ModelSerializer):
                             'modify_time', 'is_reviewed')
 
 
+def preload_dataset_lookups():
+    """Reference objects used to validate many datasets at once, indexed
+by model and slug."""
+    return {
+        Country: {country.iso2: country
+                  for country in Country.objects.all()},
+        KeyDataset: {keydataset.code: keydataset
+                     for keydataset in KeyDataset.objects.select_related(
+                         'dataset', 'level')},
+        KeyTag: {tag.name: tag for tag in KeyTag.objects.all()},
+    }
+
+
+class PreloadedSlugRelatedField(serializers.SlugRelatedField):
+    """Slug related field resolved against the 'preloaded' lookups of the
+serializer context instead of querying the database for each value."""
+
+    def to_internal_value(self, data):
+        preloaded = self.context.get('preloaded')
+        if preloaded is None:
+            return super().to_internal_value(data)
+        try:
+            return preloaded[self.queryset.model][data]
+        except KeyError:
+            self.fail('does_not_exist', slug_name=self.slug_field, value=data)
+        except TypeError:
+            self.fail('invalid')
+
+
+class ProfileDatasetBulkListSerializer(serializers.ListSerializer):
+    """Create or update all the datasets of the request with a constant
+number of queries (where the backend returns the ids of bulk inserts)."""
+
+    # written by an update, the others are not changed by the owner
+    updated_fields = [field.name for field in Dataset._meta.concrete_fields
+                      if not field.primary_key and field.name not in (
+                          'owner', 'create_time', 'review_date')]
+
+    def validate(self, attrs):
+        for item in attrs:
+            # same check of check_tags_consistency but on preloaded objects
+            for tag in item['tag']:
+                if tag.group_id != item['keydataset'].tag_available_id:
+                    raise ValidationError(
+                        {"detail": "Tag '%s' not allowed for KeyDataset '%s'"
+                         % (tag.name, item['keydataset'].description)})
+
+        ids = [item['id'] for item in attrs if item.get('id') is not None]
+        if len(ids) != len(set(ids)):
+            raise ValidationError({"detail": "Dataset ids must be unique"})
+        owned = set(Dataset.objects.filter(
+            owner=self.context['request'].user, pk__in=ids).values_list(
+                'pk', flat=True))
+        for pk in ids:
+            if pk not in owned:
+                raise ValidationError(
+                    {"detail": "Dataset %d not found" % pk})
+
+        return attrs
+
+    def url_ids(self, validated_data):
+        """Get or create in one pass all the urls of the request."""
+        names = {url for item in validated_data for url in item['url']}
+        ids = dict(Url.objects.filter(url__in=names).values_list('url', 'pk'))
+        missing = [Url(url=name) for name in names if name not in ids]
+        if missing:
+            Url.objects.bulk_create(missing)
+            ids.update(Url.objects.filter(url__in=[
+                url.url for url in missing]).values_list('url', 'pk'))
+        return ids
+
+    def create(self, validated_data):
+        user = self.context['request'].user
+        url_ids = self.url_ids(validated_data)
+        instances = Dataset.objects.in_bulk([
+            item['id'] for item in validated_data if item.get('id')])
+
+        now = timezone.now()
+        created = []
+        updated = []
+        pairs = []
+        # a dataset moved to another country changes both of them
+        countries = set()
+        for item in validated_data:
+            fields = {field: value for field, value in item.items()
+                      if field not in ('id', 'url', 'tag')}
+            if item.get('id') is None:
+                dataset = Dataset(owner=user, changed_by=user, **fields)
+                created.append(dataset)
+            else:
+                dataset = instances[item['id']]
+                countries.add(dataset.country_id)
+                for field, value in fields.items():
+                    setattr(dataset, field, value)
+                dataset.changed_by = user
+                dataset.is_reviewed = False
+                dataset.modify_time = now
+                updated.append(dataset)
+            pairs.append((dataset, item))
+            countries.add(dataset.country_id)
+
+        bulk_insert(Dataset, created)
+        bulk_update(Dataset, updated, self.updated_fields)
+
+        url_through = Dataset.url.through
+        tag_through = Dataset.tag.through
+        if updated:
+            updated_ids = [dataset.pk for dataset in updated]
+            url_through.objects.filter(dataset_id__in=updated_ids).delete()
+            tag_through.objects.filter(dataset_id__in=updated_ids).delete()
+
+        url_rows = []
+        tag_rows = []
+        for dataset, item in pairs:
+            # like related managers 'add', repeated values are linked once
+            url_rows += [url_through(dataset_id=dataset.pk,
+                                     url_id=url_ids[url])
+                         for url in OrderedDict.fromkeys(item['url'])]
+            tag_rows += [tag_through(dataset_id=dataset.pk, keytag_id=tag.pk)
+                         for tag in OrderedDict.fromkeys(item['tag'])]
+        url_through.objects.bulk_create(url_rows)
+        tag_through.objects.bulk_create(tag_rows)
+        # bulk inserts don't send the signals that track changes
+        datasets_version.bump_on_commit()
+        invalidate_country_details(countries)
+
+        return [dataset for dataset, _ in pairs]
+
+
+class ProfileDatasetBulkSerializer(serializers.ModelSerializer):
+    """Serializer of a single dataset of a bulk submission, use it with
+'many=True' and the 'preloaded' lookups in the context."""
+    id = serializers.IntegerField(required=False)
+    country = PreloadedSlugRelatedField(slug_field='iso2',
+                                        queryset=Country.objects.all())
+    keydataset = PreloadedSlugRelatedField(
+        slug_field='code', queryset=KeyDataset.objects.all())
+    url = serializers.ListField(
+        child=serializers.CharField(max_length=4096, allow_blank=True))
+    tag = PreloadedSlugRelatedField(slug_field='name',
+                                    queryset=KeyTag.objects.all(),
+                                    many=True)
+
+    class Meta:
+        model = Dataset
+        fields = '__all__'
+        read_only_fields = ('owner', 'changed_by', 'create_time',
+                            'modify_time', 'is_reviewed', 'review_date')
+        list_serializer_class = ProfileDatasetBulkListSerializer
+
+
 class DatasetListSerializer(serializers.ModelSerializer):
     owner = serializers.SlugRelatedField(slug_field='username',
                                          queryset=User.objects.all())
@@ -253,6 +418,14 @@ class DatasetListSerializer(serializers.ModelSerializer):
         fields = '__all__'
         read_only_fields = ('changed_by', 'create_time', 'modify_time')
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Load with 'queryset' the related objects read by the serializer."""
+        queryset = KeyDataset4on4Serializer.setup_eager_loading(
+            queryset, 'keydataset__')
+        return queryset.select_related(
+            'owner', 'changed_by', 'country').prefetch_related('url', 'tag')
+
 
 class DatasetPutSerializer(serializers.ModelSerializer):
     owner = serializers.SlugRelatedField(slug_field='username',
@@ -305,6 +478,12 @@ class DatasetsDumpSerializer(serializers.ModelSerializer):
             'is_prov_timely_last', 'tag',
             )
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Load with 'queryset' the related objects read by the serializer."""
+        return queryset.select_related(
+            'owner', 'changed_by').prefetch_related('url', 'tag')
+
     def to_representation(self, obj):
         repres = super(DatasetsDumpSerializer, self).to_representation(obj)
         tag_flat = ""
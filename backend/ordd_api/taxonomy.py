@@ -0,0 +1,155 @@
+# taxonomy.py
+from django.db.models import Prefetch
+
+from .catalogue import catalogue_version
+from .lib.versioned import VersionedValue
+from .keydatasets_serializers import (
+    KeyDataset0on4Serializer, KeyDataset1on4Serializer,
+    KeyDataset2on4Serializer, KeyDataset3on4Serializer,
+    KeyDataset4on4Serializer, KeyTagByGroupSerializer,
+)
+from .models import KeyDataset, KeyDatasetName, KeyTag, KeyTagGroup
+
+
+def _filter_key(value):
+    """Return the id matched by a level, category or dataset url argument,
+None if the argument selects everything."""
+    if value <= '0':
+        return None
+    return int(value) if value.isdigit() else value
+
+
+class TaxonomyEntry(object):
+    """A key dataset with its ids and its serialized representations."""
+
+    __slots__ = ('code', 'level', 'category', 'dataset', 'description',
+                 'category_name', 'applicability', 'as_level', 'as_category',
+                 'as_dataset', 'as_description', 'as_keydataset')
+
+    def __init__(self, keydataset):
+        self.code = keydataset.code
+        self.level = keydataset.level_id
+        self.category = keydataset.category_id
+        self.dataset = keydataset.dataset_id
+        self.description = keydataset.description
+        # lowercase, as compared by the scoring filters
+        self.category_name = keydataset.category.name.lower()
+        self.applicability = frozenset(
+            tag.name.lower() for tag in keydataset.applicability.all())
+        self.as_level = KeyDataset0on4Serializer(keydataset).data
+        self.as_category = KeyDataset1on4Serializer(keydataset).data
+        self.as_dataset = KeyDataset2on4Serializer(keydataset).data
+        self.as_description = KeyDataset3on4Serializer(keydataset).data
+        self.as_keydataset = KeyDataset4on4Serializer(keydataset).data
+
+
+class Taxonomy(object):
+    """Index of the key datasets by level, category and dataset name, with
+the tag groups, used to serve the keydataset/... endpoints and the scoring
+of missing datasets."""
+
+    # limit of the filters combinations kept by dataset_names
+    DATASET_NAMES_SIZE = 256
+
+    def __init__(self, keydatasets, tag_groups, dataset_names):
+        self.entries = [TaxonomyEntry(keydataset)
+                        for keydataset in keydatasets]
+        self.dataset_names_all = [
+            {"id": name.pk, "name": name.name, "category": name.category}
+            for name in dataset_names]
+        self.dataset_names_by_filters = {}
+        self.by_code = {entry.code: entry for entry in self.entries}
+        self.tag_groups = [KeyTagByGroupSerializer(group).data
+                           for group in tag_groups]
+        self.tag_groups_by_name = {group['group']: group
+                                   for group in self.tag_groups}
+
+    @staticmethod
+    def matches(entry, level, category, dataset):
+        return ((level is None or entry.level == level) and
+                (category is None or entry.category == category) and
+                (dataset is None or entry.dataset == dataset))
+
+    def filter(self, level='0', category='0', dataset='0'):
+        level = _filter_key(level)
+        category = _filter_key(category)
+        dataset = _filter_key(dataset)
+        return [entry for entry in self.entries
+                if self.matches(entry, level, category, dataset)]
+
+    @staticmethod
+    def distinct(entries, field):
+        """First entry for each value of 'field', ordered by it."""
+        firsts = {}
+        for entry in entries:
+            firsts.setdefault(getattr(entry, field), entry)
+        return [firsts[key] for key in sorted(firsts)]
+
+    def levels(self):
+        return [entry.as_level
+                for entry in self.distinct(self.entries, 'level')]
+
+    def categories(self, level):
+        return [entry.as_category for entry in
+                self.distinct(self.filter(level), 'category')]
+
+    def datasets(self, level, category):
+        return [entry.as_dataset for entry in
+                self.distinct(self.filter(level, category), 'dataset')]
+
+    def descriptions(self, level, category, dataset):
+        entries = self.filter(level, category, dataset)
+        return [entry.as_description for entry in
+                sorted(entries, key=lambda entry: entry.description)]
+
+    def keydataset(self, level, category, dataset, code):
+        """Representation of the key dataset 'code', None if it does not
+exist or does not match the other arguments."""
+        entry = self.by_code.get(code)
+        if entry is None or not self.matches(entry, _filter_key(level),
+                                             _filter_key(category),
+                                             _filter_key(dataset)):
+            return None
+        return entry.as_keydataset
+
+    def dataset_names(self, applicability=(), category=()):
+        """Key dataset names, ordered by category and name, with at least a
+key dataset matching the lowercase names in 'applicability' and
+'category', all the names if there are no filters."""
+        if not applicability and not category:
+            return self.dataset_names_all
+
+        key = (frozenset(applicability), frozenset(category))
+        names = self.dataset_names_by_filters.get(key)
+        if names is None:
+            ids = {entry.dataset for entry in self.entries
+                   if ((not applicability or
+                        not entry.applicability.isdisjoint(applicability)) and
+                       (not category or entry.category_name in category))}
+            names = [name for name in self.dataset_names_all
+                     if name['id'] in ids]
+            if len(self.dataset_names_by_filters) < self.DATASET_NAMES_SIZE:
+                self.dataset_names_by_filters[key] = names
+        return names
+
+    def tag_group_names(self):
+        return [group['group'] for group in self.tag_groups]
+
+    def tag_group(self, name):
+        return self.tag_groups_by_name.get(name)
+
+
+def build_taxonomy():
+    tags = KeyTag.objects.order_by('pk')
+    keydatasets = KeyDataset.objects.select_related(
+        'level', 'category', 'dataset', 'tag_available').prefetch_related(
+            Prefetch('tag_available__tags', queryset=tags),
+            Prefetch('applicability', queryset=tags)).order_by('pk')
+    tag_groups = KeyTagGroup.objects.prefetch_related(
+        Prefetch('tags', queryset=tags)).order_by('pk')
+    # same ordering of the database, nulls included
+    dataset_names = KeyDatasetName.objects.order_by('category', 'name')
+    return Taxonomy(keydatasets, tag_groups, dataset_names)
+
+
+taxonomy = VersionedValue(catalogue_version, build_taxonomy)
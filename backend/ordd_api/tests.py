@@ -0,0 +1,1515 @@
+# /ordd_api/tests.py
+import gzip
+import io
+import json
+import os
+import pstats
+import tempfile
+import threading
+import time
+import unittest
+import uuid
+from unittest import mock
+from datetime import timedelta
+from decimal import Decimal
+
+from rest_framework.test import APIRequestFactory, APIClient
+from rest_framework.request import Request
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
+
+from django.contrib.auth.models import User, Group
+from django.core.cache import cache
+from django.core import serializers
+from django.core import mail
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.http import HttpResponse, StreamingHttpResponse
+from django import test
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (Region, Country, KeyLevel, KeyCategory,
+                     KeyDatasetName, KeyTagGroup, KeyTag, KeyDataset, Url,
+                     Dataset, CountryDetails, RequestProfile,
+                     ScoreRecompute)
+from .management.commands.bench_scoring import REFERENCE_DIR, load_reference
+from .lib.bulk_load import iter_json_array
+from .lib.datasets_io import BOOLEAN_FIELDS, dataset_to_record
+from .lib.nplusone import RepeatedQueries, normalize
+from .lib.single_flight import (SingleFlight, COMPUTED, STALE, TIMEOUT,
+                                 WAITED)
+from .lib.synthetic import synthetic_datasets
+from .lib.versioned import SharedVersion
+from .metrics import Metrics
+from .middleware import (CompressionMiddleware, TimingMiddleware,
+                         ProfilingMiddleware, brotli)
+from .renderers import FastJSONRenderer, orjson
+from .parallel_scoring import (PARALLEL_SCORINGS, parallel_score,
+                               partition_countries)
+from .profiling import rotate_profiles
+from .authentication import (CachedTokenAuthentication, auth_version,
+                             token_cache)
+from .roles import (has_role, role_emails, user_groups_cache,
+                    role_emails_cache, roles_version, ROLE_ADMIN,
+                    ROLE_REVIEWER)
+from .scoring_cache import scoring_key, scoring_request
+from .views import DatasetDetailsViewPerms, Score
+from ordd_api import MAIL_SUBJECT_PREFIX
+
+# the default cache is shared by the processes of the installation, the
+# tests use one of their own, emptied before each test, so the scorings,
+# versions and locks left by other runs or tests can't change the results
+TEST_CACHES = {'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'ordd-tests'}}
+
+
+class EmptyCacheMixin(object):
+
+    def _pre_setup(self):
+        super()._pre_setup()
+        cache.clear()
+
+
+@override_settings(CACHES=TEST_CACHES)
+class SimpleTestCase(EmptyCacheMixin, test.SimpleTestCase):
+    pass
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TestCase(EmptyCacheMixin, test.TestCase):
+    pass
+
+
+@override_settings(CACHES=TEST_CACHES)
+class TransactionTestCase(EmptyCacheMixin, test.TransactionTestCase):
+    pass
+
+
+@override_settings(CACHES=TEST_CACHES)
+class LiveServerTestCase(EmptyCacheMixin, test.LiveServerTestCase):
+    pass
+
+
+class LoadDataStreamTestCase(TestCase):
+    """Test suite for the streamed load of json dumps."""
+
+    def setUp(self):
+        self.keydataset = create_keydataset()
+        region = Region.objects.create(name="Europe")
+        self.country = Country.objects.create(iso2="IT", name="Italy",
+                                              region=region)
+        self.country.thinkhazard_appl.add(KeyTag.objects.get(name="flood"))
+        self.user = User.objects.create(username="user")
+        self.dataset = Dataset.objects.create(
+            owner=self.user, country=self.country,
+            keydataset=self.keydataset,
+            **dict.fromkeys(BOOLEAN_FIELDS, True))
+        self.dataset.tag.add(KeyTag.objects.get(name="flood"))
+        # json dumps keep the milliseconds
+        past = timezone.now().replace(microsecond=0) - timedelta(days=10)
+        Dataset.objects.filter(pk=self.dataset.pk).update(
+            create_time=past, modify_time=past)
+
+    def dump(self, filename):
+        call_command('dumpdata', 'ordd_api.region', 'ordd_api.keytaggroup',
+                     'ordd_api.keytag', 'ordd_api.country',
+                     'ordd_api.dataset', natural_primary=True,
+                     natural_foreign=True, output=filename,
+                     stdout=io.StringIO())
+
+    def snapshot(self):
+        return [serializers.serialize(
+            'python', model.objects.order_by('pk'),
+            use_natural_primary_keys=True, use_natural_foreign_keys=True)
+            for model in (Region, KeyTag, Country, Dataset)]
+
+    def change(self):
+        Country.objects.filter(pk=self.country.pk).update(name="Renamed")
+        self.country.thinkhazard_appl.clear()
+        Dataset.objects.filter(pk=self.dataset.pk).update(
+            is_open_licence=False, create_time=timezone.now())
+        self.dataset.tag.clear()
+
+    def test_iter_json_array(self):
+        """Test the items are parsed across chunks of any size."""
+        items = [{"a": "x] [,", "b": [1, 2, {"c": None}]}, [], "s", 3.5,
+                 1e10, 12345]
+        text = ' \n' + json.dumps(items, indent=1)
+        for chunk_size in (1, 3, 7, 1024):
+            self.assertEqual(list(iter_json_array(io.StringIO(text),
+                                                  chunk_size)), items)
+        self.assertEqual(list(iter_json_array(io.StringIO(''))), [])
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.StringIO('{"a": 1}')))
+        with self.assertRaises(ValueError):
+            list(iter_json_array(io.StringIO('[1, 2'), 2))
+
+    def test_same_as_loaddata(self):
+        """Test a dump with natural keys updates the existing rows, keeping
+their timestamps, as loaddata does."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'dump.json')
+            self.dump(filename)
+            expected = self.snapshot()
+
+            self.change()
+            # django 1.11 checks the constraints of sqlite >= 3.26 on the
+            # '__old' tables left by the migrations
+            with mock.patch.object(connection, 'check_constraints'):
+                call_command('loaddata', filename, verbosity=0)
+            self.assertEqual(self.snapshot(), expected)
+
+            self.change()
+            gzipped = filename + '.gz'
+            with open(filename, 'rb') as filein, \
+                    gzip.open(gzipped, 'wb') as fileout:
+                fileout.write(filein.read())
+            call_command('loaddata_stream', '--filein', gzipped,
+                         batch_size=2, stdout=io.StringIO())
+            self.assertEqual(self.snapshot(), expected)
+
+        # the sequences follow the loaded ids
+        self.assertGreater(Dataset.objects.create(
+            owner=self.user, country=self.country,
+            keydataset=self.keydataset,
+            **dict.fromkeys(BOOLEAN_FIELDS, False)).pk, self.dataset.pk)
+
+    def test_new_objects(self):
+        """Test objects missing from the database are inserted with their
+relations."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'dump.json')
+            self.dump(filename)
+            expected = self.snapshot()
+            Dataset.objects.all().delete()
+            self.country.delete()
+            Region.objects.all().delete()
+
+            call_command('loaddata_stream', '--filein', filename,
+                         stdout=io.StringIO())
+        self.assertEqual(self.snapshot(), expected)
+
+
+class ExportImportDatasetsTestCase(TestCase):
+    """Test suite for the datasets dump referencing objects by natural
+key."""
+
+    def setUp(self):
+        keydataset = create_keydataset()
+        flood = KeyTag.objects.get(name="flood")
+        region = Region.objects.create(name="Europe")
+        owner = User.objects.create(username="owner")
+        reviewer = User.objects.create(username="reviewer")
+        now = timezone.now()
+        for i, (iso2, name) in enumerate((("IT", "Italy"),
+                                          ("FR", "France"))):
+            country = Country.objects.create(iso2=iso2, name=name,
+                                             region=region)
+            dataset = Dataset.objects.create(
+                owner=owner, changed_by=reviewer, country=country,
+                keydataset=keydataset, notes="notes %d" % i,
+                review_date=now, **dict.fromkeys(BOOLEAN_FIELDS, i == 0))
+            dataset.url.add(Url.objects.create(
+                url="http://example.org/%d" % i))
+            dataset.tag.add(flood)
+        Dataset.objects.create(owner=owner, country=country,
+                               keydataset=keydataset,
+                               **dict.fromkeys(BOOLEAN_FIELDS, False))
+        Dataset.objects.update(create_time=now - timedelta(days=3),
+                               modify_time=now - timedelta(days=2))
+
+    def records(self):
+        return [dataset_to_record(dataset)
+                for dataset in Dataset.objects.order_by('pk')]
+
+    def round_trip(self, *args, **options):
+        """Export, remove and import again the datasets, return the records
+before and after the import."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'datasets.jsonl.gz')
+            call_command('export_datasets', '--fileout', filename,
+                         chunk_size=2, stdout=io.StringIO())
+            expected = self.records()
+            Dataset.objects.all().delete()
+            call_command('import_datasets', '--filein', filename, *args,
+                         batch_size=2, stdout=io.StringIO(), **options)
+        return expected, self.records()
+
+    def test_round_trip(self):
+        """Test imported datasets are the exported ones with new ids."""
+        with tempfile.NamedTemporaryFile(mode='r') as idmap:
+            expected, records = self.round_trip('--idmap', idmap.name)
+            ids = dict(tuple(map(int, line.split())) for line in idmap)
+        self.assertEqual(sorted(ids), [record[0] for record in expected])
+        for record in expected:
+            record[0] = ids[record[0]]
+        self.assertEqual(records, expected)
+        self.assertTrue(set(ids).isdisjoint(ids.values()))
+
+    def test_keep_ids(self):
+        """Test the original ids are kept on request."""
+        expected, records = self.round_trip('--keep-ids')
+        self.assertEqual(records, expected)
+
+    def test_default_owner(self):
+        """Test missing owners fall back to the default one and missing
+countries fail the whole import."""
+        User.objects.create(username="fallback")
+        with tempfile.NamedTemporaryFile(suffix='.jsonl') as dump:
+            call_command('export_datasets', '--fileout', dump.name,
+                         stdout=io.StringIO())
+            Dataset.objects.all().delete()
+            User.objects.filter(username="owner").delete()
+            call_command('import_datasets', '--filein', dump.name,
+                         default_owner="fallback", stdout=io.StringIO())
+            self.assertEqual(set(Dataset.objects.values_list(
+                'owner__username', 'changed_by__username')), {
+                    ("fallback", "reviewer"), ("fallback", None)})
+
+            Dataset.objects.all().delete()
+            Country.objects.filter(iso2="FR").delete()
+            with self.assertRaises(CommandError):
+                call_command('import_datasets', '--filein', dump.name,
+                             default_owner="fallback", stdout=io.StringIO())
+            self.assertFalse(Dataset.objects.exists())
+
+
+class ProfileDatasetBulkTestCase(TestCase):
+    """Test suite for the submission of many datasets at once."""
+
+    def setUp(self):
+        role_emails_cache.clear()
+        self.keydataset = create_keydataset()
+        region = Region.objects.create(name="Europe")
+        for iso2, name in (("IT", "Italy"), ("FR", "France")):
+            Country.objects.create(iso2=iso2, name=name, region=region)
+        self.user = User.objects.create(username="user",
+                                        email="user@example.org")
+        reviewer = User.objects.create(username="reviewer",
+                                       email="reviewer@example.org")
+        reviewer.groups.add(Group.objects.create(name=ROLE_REVIEWER))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def item(self, country="IT", **fields):
+        item = dict.fromkeys(BOOLEAN_FIELDS[1:], True)
+        item.update(country=country, keydataset="BA_1A", notes="",
+                    url=["http://example.org/%s" % country], tag=["flood"])
+        item.update(fields)
+        return item
+
+    def post(self, items):
+        return self.client.post('/api/profile/dataset/bulk', items,
+                                format='json')
+
+    def test_valid_batch(self):
+        """Test new and owned datasets are saved with their relations and
+the reviewers get a single notification."""
+        owned = Dataset.objects.create(
+            owner=self.user, country=Country.objects.get(iso2="IT"),
+            keydataset=self.keydataset, is_reviewed=True,
+            **dict.fromkeys(BOOLEAN_FIELDS[1:], False))
+        response = self.post([self.item(), self.item("FR"),
+                              self.item("FR", id=owned.pk, notes="moved")])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data['created']), 2)
+        self.assertEqual(response.data['updated'], [owned.pk])
+
+        datasets = Dataset.objects.order_by('pk')
+        self.assertEqual([(dataset.country.iso2, dataset.owner,
+                           dataset.changed_by, dataset.is_reviewed,
+                           dataset.is_open_licence)
+                          for dataset in datasets], [
+            ("FR", self.user, self.user, False, True),
+            ("IT", self.user, self.user, False, True),
+            ("FR", self.user, self.user, False, True)])
+        self.assertEqual(datasets[0].notes, "moved")
+        self.assertEqual([[url.url for url in dataset.url.all()]
+                          for dataset in datasets],
+                         [["http://example.org/FR"],
+                          ["http://example.org/IT"],
+                          ["http://example.org/FR"]])
+        self.assertEqual(Url.objects.count(), 2)
+        self.assertEqual(set(Dataset.tag.through.objects.values_list(
+            'keytag__name', flat=True)), {"flood"})
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["reviewer@example.org"])
+        self.assertIn("2 new and 1 updated datasets from user 'user'",
+                      mail.outbox[0].subject)
+
+    def test_invalid_item_rejects_batch(self):
+        """Test an invalid item rejects the whole batch with the errors of
+each item."""
+        owned = Dataset.objects.create(
+            owner=self.user, country=Country.objects.get(iso2="IT"),
+            keydataset=self.keydataset,
+            **dict.fromkeys(BOOLEAN_FIELDS, False))
+        response = self.post([self.item(id=owned.pk),
+                              self.item(is_existing="maybe")])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('is_existing', response.data[1])
+        self.assertEqual(Dataset.objects.count(), 1)
+        self.assertFalse(Dataset.objects.get().is_existing)
+        self.assertEqual(len(mail.outbox), 0)
+
+        other = User.objects.create(username="other")
+        Dataset.objects.update(owner=other)
+        response = self.post([self.item(), self.item(id=owned.pk)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Dataset.objects.count(), 1)
+
+    def test_unknown_slugs(self):
+        """Test unknown countries, key datasets and tags are item errors."""
+        for field, value in (("country", "XX"), ("keydataset", "ZZ_9Z"),
+                             ("tag", ["earthquake"])):
+            response = self.post([self.item(), self.item(**{field: value})])
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(list(response.data[1]), [field])
+        self.assertFalse(Dataset.objects.exists())
+
+    def test_queries_constant(self):
+        """Test the queries don't grow with the number of datasets."""
+        def count(size):
+            owned = [Dataset.objects.create(
+                owner=self.user, country=Country.objects.get(iso2="IT"),
+                keydataset=self.keydataset,
+                **dict.fromkeys(BOOLEAN_FIELDS, False)).pk
+                for _ in range(size)]
+            with CaptureQueriesContext(connection) as queries:
+                response = self.post(
+                    [self.item("FR") for _ in range(size)] +
+                    [self.item(id=pk) for pk in owned])
+            self.assertEqual(response.status_code, 201)
+            if connection.features.can_return_ids_from_bulk_insert:
+                return len(queries)
+            # the backend inserts one dataset at a time to get their ids
+            return len([query for query in queries if not query[
+                'sql'].startswith('INSERT INTO "ordd_api_dataset" ')])
+
+        # the first request fills the caches of the roles
+        count(1)
+        self.assertEqual(count(1), count(5))
+
+    def test_anonymous(self):
+        """Test anonymous users can't submit datasets."""
+        self.client.force_authenticate(None)
+        response = self.post([self.item()])
+        self.assertIn(response.status_code, (401, 403))
+        self.assertFalse(Dataset.objects.exists())
+
+
+class DatasetBulkReviewTestCase(TransactionTestCase):
+    """Test suite for the review of many datasets at once."""
+
+    def setUp(self):
+        user_groups_cache.clear()
+        keydataset = create_keydataset()
+        region = Region.objects.create(name="Europe")
+        self.reviewer = User.objects.create(username="reviewer",
+                                            email="reviewer@example.org")
+        self.reviewer.groups.add(Group.objects.create(name=ROLE_REVIEWER))
+        self.owners = [User.objects.create(username="owner%d" % i,
+                                           email="owner%d@example.org" % i)
+                       for i in range(2)]
+        self.datasets = []
+        for iso2, name in (("IT", "Italy"), ("FR", "France")):
+            country = Country.objects.create(iso2=iso2, name=name,
+                                             region=region)
+            for owner in self.owners:
+                self.datasets.append(Dataset.objects.create(
+                    owner=owner, country=country, keydataset=keydataset,
+                    **dict.fromkeys(BOOLEAN_FIELDS, False)).pk)
+        self.client = APIClient()
+        self.client.force_authenticate(self.reviewer)
+
+    def review(self, data, query=''):
+        return self.client.put('/api/dataset/review' + query, data,
+                               format='json')
+
+    def reviewed(self):
+        return list(Dataset.objects.filter(is_reviewed=True).order_by(
+            'pk').values_list('pk', flat=True))
+
+    def test_reviewers_only(self):
+        """Test only reviewers and admins can review datasets."""
+        self.client.force_authenticate(self.owners[0])
+        self.assertEqual(self.review({"ids": self.datasets}).status_code,
+                         403)
+        self.client.force_authenticate(None)
+        self.assertIn(self.review({"ids": self.datasets}).status_code,
+                      (401, 403))
+        self.assertEqual(self.reviewed(), [])
+
+    def test_selection(self):
+        """Test the datasets are selected by ids and filters together."""
+        response = self.review({"ids": self.datasets[:3]}, '?country=IT')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"reviewed": 2,
+                                         "ids": self.datasets[:2]})
+        response = self.review({}, '?country=FR')
+        self.assertEqual(response.data["ids"], self.datasets[2:])
+        self.assertEqual(self.reviewed(), self.datasets)
+        dataset = Dataset.objects.get(pk=self.datasets[0])
+        self.assertEqual(dataset.changed_by, self.reviewer)
+        self.assertIsNotNone(dataset.review_date)
+        # already reviewed datasets are left as they are
+        self.assertEqual(self.review({"ids": self.datasets}).data,
+                         {"reviewed": 0, "ids": []})
+
+    def test_invalid_selection(self):
+        """Test the request needs ids, integers only, or a filter."""
+        for data in ({}, {"ids": []}, {"ids": [True]}, {"ids": "1"},
+                     {"ids": [self.datasets[0], "2"]}, {"ids": [1.0]}):
+            response = self.review(data)
+            self.assertEqual(response.status_code, 400, data)
+        self.assertEqual(self.reviewed(), [])
+
+    def test_digest(self):
+        """Test each owner gets a single mail for the reviewed datasets."""
+        self.review({}, '?country=IT&country=FR')
+        self.assertEqual(sorted((message.to[0], message.subject)
+                                for message in mail.outbox), [
+            ("owner%d@example.org" % i,
+             "%s: 2 of your datasets have been reviewed" %
+             MAIL_SUBJECT_PREFIX) for i in range(2)])
+
+
+class RolesTestCase(TestCase):
+    """Test suite for the roles resolution and its caches."""
+
+    def setUp(self):
+        user_groups_cache.clear()
+        role_emails_cache.clear()
+        self.reviewers = Group.objects.create(name=ROLE_REVIEWER)
+        self.admins = Group.objects.create(name=ROLE_ADMIN)
+        self.reviewer = User.objects.create(username="reviewer",
+                                            email="reviewer@example.org")
+        self.reviewer.groups.add(self.reviewers)
+        self.user = User.objects.create(username="user",
+                                        email="user@example.org")
+
+    def unsafe_request(self, user):
+        request = Request(APIRequestFactory().put('/'))
+        request.user = user
+        return request
+
+    def test_permission_checks_share_one_query(self):
+        """Test an unsafe request loads the groups just once."""
+        perms = DatasetDetailsViewPerms()
+        request = self.unsafe_request(User.objects.get(pk=self.reviewer.pk))
+        with self.assertNumQueries(1):
+            self.assertTrue(perms.has_permission(request, None))
+            self.assertTrue(perms.has_object_permission(request, None, None))
+
+    def test_groups_are_cached_between_requests(self):
+        """Test groups of a user are not queried again by a new request."""
+        perms = DatasetDetailsViewPerms()
+        request = self.unsafe_request(User.objects.get(pk=self.user.pk))
+        with self.assertNumQueries(1):
+            self.assertFalse(perms.has_permission(request, None))
+
+        request = self.unsafe_request(User.objects.get(pk=self.user.pk))
+        with self.assertNumQueries(0):
+            self.assertFalse(perms.has_permission(request, None))
+            self.assertFalse(perms.has_object_permission(request, None, None))
+
+    def test_group_change_invalidates_cache(self):
+        """Test adding or removing a group is seen by the next request."""
+        self.assertFalse(has_role(User.objects.get(pk=self.user.pk),
+                                  ROLE_ADMIN))
+
+        self.user.groups.add(self.admins)
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(has_role(user, ROLE_ADMIN))
+
+        self.admins.user_set.remove(self.user)
+        self.assertFalse(has_role(User.objects.get(pk=self.user.pk),
+                                  ROLE_ADMIN))
+
+    def test_role_emails(self):
+        """Test recipients are loaded with one query and invalidated."""
+        with self.assertNumQueries(1):
+            self.assertEqual(role_emails(ROLE_REVIEWER),
+                             ("reviewer@example.org",))
+        with self.assertNumQueries(0):
+            role_emails(ROLE_REVIEWER)
+
+        self.reviewers.user_set.add(self.user)
+        self.assertEqual(role_emails(ROLE_REVIEWER),
+                         ("reviewer@example.org", "user@example.org"))
+
+    @mock.patch.object(roles_version, 'check_interval', 0)
+    def test_change_in_other_process(self):
+        """Test groups changed by another process are seen once it bumps
+the shared version, checked on each access."""
+        self.assertFalse(has_role(User.objects.get(pk=self.user.pk),
+                                  ROLE_ADMIN))
+        self.assertEqual(role_emails(ROLE_ADMIN), ())
+
+        # no signal reaches this process, only the shared version changes
+        User.groups.through.objects.create(user=self.user, group=self.admins)
+        self.assertFalse(has_role(User.objects.get(pk=self.user.pk),
+                                  ROLE_ADMIN))
+        SharedVersion(roles_version.key, 0).bump()
+        self.assertTrue(has_role(User.objects.get(pk=self.user.pk),
+                                 ROLE_ADMIN))
+        self.assertEqual(role_emails(ROLE_ADMIN), ("user@example.org",))
+
+class CachedTokenAuthenticationTestCase(TestCase):
+    """Test suite for the cached token authentication."""
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create(username="user",
+                                        email="user@example.org")
+        self.token = Token.objects.get(user=self.user)
+        self.auth = CachedTokenAuthentication()
+
+    def test_token_is_resolved_once(self):
+        """Test a known token is authenticated without queries."""
+        with self.assertNumQueries(1):
+            user, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(user, self.user)
+
+        with self.assertNumQueries(0):
+            other, token = self.auth.authenticate_credentials(self.token.key)
+        self.assertEqual(other, self.user)
+        self.assertIsNot(other, user)
+
+    def test_deactivated_user_is_rejected(self):
+        """Test deactivating the user invalidates the cached token."""
+        self.auth.authenticate_credentials(self.token.key)
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    def test_deleted_token_is_rejected(self):
+        """Test deleting the token invalidates the cached entry."""
+        self.auth.authenticate_credentials(self.token.key)
+        self.token.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(self.token.key)
+
+    @mock.patch.object(auth_version, 'check_interval', 0)
+    def test_change_in_other_process(self):
+        """Test a user deactivated or a token deleted by another process are
+refused once it bumps the shared version, checked on each access."""
+        key = self.token.key
+        self.auth.authenticate_credentials(key)
+
+        # no signal reaches this process, only the shared version changes
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.auth.authenticate_credentials(key)
+        SharedVersion(auth_version.key, 0).bump()
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(key)
+
+        User.objects.filter(pk=self.user.pk).update(is_active=True)
+        self.auth.authenticate_credentials(key)
+        # the deletion drops the entry of the cache of the other process
+        with mock.patch.object(token_cache, 'delete'):
+            self.token.delete()
+        self.auth.authenticate_credentials(key)
+        SharedVersion(auth_version.key, 0).bump()
+        with self.assertRaises(AuthenticationFailed):
+            self.auth.authenticate_credentials(key)
+
+def create_keydataset():
+    """Create a key dataset with its level, category, name and tags."""
+    level = KeyLevel.objects.create(name="National")
+    category = KeyCategory.objects.create(code="BA", name="Base data",
+                                          weight=1)
+    name = KeyDatasetName.objects.create(name="Boundaries", category="base")
+    group = KeyTagGroup.objects.create(name="hazard")
+    flood = KeyTag.objects.create(group=group, name="flood", is_peril=True)
+    keydataset = KeyDataset.objects.create(
+        code="BA_1A", category=category, dataset=name, tag_available=group,
+        description="Administrative boundaries", level=level, weight=1)
+    keydataset.applicability.add(flood)
+    return keydataset
+
+
+class CatalogueTestCase(TransactionTestCase):
+    """Test suite for the reference catalogue served from memory."""
+
+    def setUp(self):
+        self.keydataset = create_keydataset()
+        self.flood = KeyTag.objects.get(name="flood")
+        self.client = APIClient()
+
+    def test_keydatasets_served_without_queries(self):
+        """Test the keydataset endpoints don't query the database."""
+        self.client.get('/api/keydataset/')
+        url = '/api/keydataset/0/0/0/BA_1A'
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['tag_available'],
+                         {'group': 'hazard', 'tags': ['flood']})
+        self.assertEqual(response.data[0]['applicability'], ['flood'])
+
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/keydataset/0/')
+        self.assertEqual(response.data, [
+            {'level': 'National',
+             'category': {'id': self.keydataset.category_id,
+                          'name': 'Base data'}}])
+        response = self.client.get('/api/keydataset/0/0/0/XX_1A')
+        self.assertEqual(response.status_code, 404)
+
+    def test_catalogue_change_rebuilds_taxonomy(self):
+        """Test a committed change of the catalogue is served."""
+        self.client.get('/api/keydataset/')
+        self.keydataset.description = "Boundaries of the country"
+        self.keydataset.save()
+        response = self.client.get('/api/keydataset/0/0/0/')
+        self.assertEqual(response.data[0]['description']['name'],
+                         "Boundaries of the country")
+
+    def test_catalogue_bootstrap(self):
+        """Test the catalogue is served gzipped and revalidated by etag."""
+        response = self.client.get('/api/catalogue')
+        catalogue = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(catalogue['levels'],
+                         [{'id': self.keydataset.level_id,
+                           'name': 'National'}])
+        self.assertEqual(catalogue['tag_groups'],
+                         [{'name': 'hazard', 'tags': ['flood']}])
+        self.assertEqual(catalogue['perils'], ['flood'])
+        self.assertEqual(catalogue['keydatasets'][0]['applicability'],
+                         ['flood'])
+
+        with self.assertNumQueries(0):
+            gzipped = self.client.get('/api/catalogue',
+                                      HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(gzipped.content), response.content)
+        self.assertNotEqual(gzipped['ETag'], response['ETag'])
+        refused = self.client.get('/api/catalogue',
+                                  HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(refused.has_header('Content-Encoding'))
+        self.assertEqual(refused['ETag'], response['ETag'])
+
+        for etag, accept_encoding, status_code in (
+                (response['ETag'], '', 304),
+                (gzipped['ETag'], 'gzip', 304),
+                (response['ETag'], 'gzip', 200),
+                (gzipped['ETag'], '', 200)):
+            self.assertEqual(self.client.get(
+                '/api/catalogue', HTTP_IF_NONE_MATCH=etag,
+                HTTP_ACCEPT_ENCODING=accept_encoding).status_code,
+                status_code)
+
+        self.flood.is_peril = False
+        self.flood.save()
+        response = self.client.get('/api/catalogue',
+                                   HTTP_IF_NONE_MATCH=gzipped['ETag'],
+                                   HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 200)
+
+    def test_reference_lists_rendered_once(self):
+        """Test reference lists are rendered once per catalogue version."""
+        self.client.get('/api/peril/')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/peril/')
+        self.assertEqual(json.loads(response.content.decode('utf-8')),
+                         [{'name': 'flood'}])
+
+        KeyTag.objects.create(group=self.flood.group, name="earthquake",
+                              is_peril=True)
+        response = self.client.get('/api/peril/')
+        self.assertEqual(json.loads(response.content.decode('utf-8')),
+                         [{'name': 'earthquake'}, {'name': 'flood'}])
+
+
+class DatasetListTestCase(TestCase):
+    """Test suite for the number of queries of the datasets lists."""
+
+    def setUp(self):
+        self.keydataset = create_keydataset()
+        self.flood = KeyTag.objects.get(name="flood")
+        region = Region.objects.create(name="Europe")
+        self.country = Country.objects.create(iso2="IT", name="Italy",
+                                              region=region)
+        self.user = User.objects.create(username="user",
+                                        email="user@example.org")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_datasets(self, count):
+        for i in range(count):
+            dataset = Dataset.objects.create(
+                owner=self.user, changed_by=self.user, country=self.country,
+                keydataset=self.keydataset,
+                **dict.fromkeys(BOOLEAN_FIELDS, False))
+            dataset.url.add(Url.objects.create(
+                url="http://example.org/%d" % dataset.pk))
+            dataset.tag.add(self.flood)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response.data
+
+    def assert_queries_constant(self, url):
+        self.add_datasets(1)
+        queries, data = self.count_queries(url)
+        self.assertEqual(len(data), 1)
+
+        self.add_datasets(5)
+        more_queries, data = self.count_queries(url)
+        self.assertEqual(len(data), 6)
+        self.assertEqual(more_queries, queries)
+        self.assertEqual(data[0]['keydataset']['tag_available'],
+                         {'group': 'hazard', 'tags': ['flood']})
+        self.assertEqual(data[0]['tag'], ['flood'])
+
+    def test_dataset_list_queries(self):
+        """Test listing datasets doesn't query once per dataset."""
+        self.assert_queries_constant('/api/dataset/')
+
+    def test_profile_dataset_list_queries(self):
+        """Test listing own datasets doesn't query once per dataset."""
+        self.assert_queries_constant('/api/profile/dataset/')
+
+
+class BenchScoringTestCase(TestCase):
+    """Test suite for the scoring benchmark and its synthetic datasets."""
+
+    def setUp(self):
+        create_keydataset()
+        region = Region.objects.create(name="Europe")
+        country = Country.objects.create(iso2="IT", name="Italy",
+                                         region=region)
+        country.thinkhazard_appl.add(KeyTag.objects.get(name="flood"))
+
+    def test_bench_scoring(self):
+        """Test the benchmark reports each case and leaves no datasets."""
+        with tempfile.NamedTemporaryFile(mode='r', suffix='.json') as out:
+            call_command('bench_scoring', datasets=20, repeat=1,
+                         output=out.name, stdout=io.StringIO())
+            report = json.load(out)
+        self.assertEqual(report['meta']['datasets'], 20)
+        self.assertIn('country_details', report['results'])
+        self.assertGreater(report['results']['all_countries']['queries'], 0)
+        self.assertEqual(Dataset.objects.count(), 0)
+
+    def test_load_reference(self):
+        """Test the reference catalogue is loaded when missing."""
+        for model in (KeyDataset, KeyDatasetName, KeyTag, KeyTagGroup,
+                      KeyLevel, KeyCategory, Country, Region):
+            model.objects.all().delete()
+        # load_thinkhazard prints a report and opens files with non ascii
+        # names, which fails under a C locale: only its call is checked
+        with mock.patch('ordd_api.management.commands.load_thinkhazard.'
+                        'Command.handle') as load_thinkhazard:
+            load_reference(io.StringIO())
+        self.assertTrue(Country.objects.filter(iso2="IT").exists())
+        self.assertTrue(KeyDataset.objects.exists())
+        self.assertEqual(load_thinkhazard.call_args[1]['datapath'],
+                         [os.path.join(REFERENCE_DIR, 'thinkhazard',
+                                       'cache')])
+
+
+class LoadTestTestCase(LiveServerTestCase):
+    """Test suite for the load test of the frontend requests."""
+
+    def setUp(self):
+        create_keydataset()
+        region = Region.objects.create(name="Europe")
+        country = Country.objects.create(iso2="IT", name="Italy",
+                                         region=region)
+        country.thinkhazard_appl.add(KeyTag.objects.get(name="flood"))
+
+    def test_load_test(self):
+        """Test the mix is replayed without errors and the synthetic
+datasets are removed."""
+        with tempfile.NamedTemporaryFile(mode='r', suffix='.json') as out:
+            call_command('load_test', datasets=20, duration=0.5, warmup=0,
+                         concurrency=2, url=self.live_server_url + '/api/',
+                         output=out.name, stdout=io.StringIO())
+            report = json.load(out)
+        self.assertEqual(report['meta']['datasets'], 20)
+        self.assertGreater(report['results']['all']['requests'], 0)
+        self.assertEqual(report['results']['all']['errors'], 0)
+        self.assertIn('scoring_country', report['results'])
+        self.assertEqual(Dataset.objects.count(), 0)
+
+
+@override_settings(ORDD_TIMING_ENDPOINTS=(r'^/api/dataset/$', ))
+class TimingMiddlewareTestCase(TestCase):
+    """Test suite for the timing of the requests."""
+
+    def setUp(self):
+        keydataset = create_keydataset()
+        region = Region.objects.create(name="Europe")
+        country = Country.objects.create(iso2="IT", name="Italy",
+                                         region=region)
+        user = User.objects.create(username="user",
+                                   email="user@example.org")
+        Dataset.objects.create(owner=user, country=country,
+                               keydataset=keydataset,
+                               **dict.fromkeys(BOOLEAN_FIELDS, True))
+
+    def test_timed_endpoint(self):
+        """Test the timings of a configured endpoint are sent and logged."""
+        with self.assertLogs('ordd_api.timing', 'INFO') as logs:
+            with CaptureQueriesContext(connection) as queries:
+                response = APIClient().get('/api/dataset/')
+        timing = response['Server-Timing']
+        for name in ('total', 'sql', 'serializer', 'render'):
+            self.assertIn('%s;dur=' % name, timing)
+        self.assertIn('desc="%d queries"' % len(queries), timing)
+        self.assertEqual(logs.records[0].timing['path'], '/api/dataset/')
+        self.assertEqual(logs.records[0].timing['sql_count'], len(queries))
+
+    def test_not_timed_endpoint(self):
+        """Test other endpoints are left untouched."""
+        response = APIClient().get('/api/country/')
+        self.assertFalse(response.has_header('Server-Timing'))
+
+    @override_settings(ORDD_TIMING_ENDPOINTS=())
+    def test_disabled(self):
+        """Test the middleware is not loaded without endpoints."""
+        with self.assertRaises(MiddlewareNotUsed):
+            TimingMiddleware(lambda request: HttpResponse())
+
+
+class MetricsTestCase(TestCase):
+    """Test suite for the metrics and their endpoint."""
+
+    def test_processes_aggregated(self):
+        """Test the values written by each process are summed."""
+        with tempfile.TemporaryDirectory() as directory:
+            workers = [Metrics(directory, 0, 3600) for _ in range(2)]
+            for worker in workers:
+                worker.inc('ordd_http_requests_total',
+                           ('version', 'GET', '200'))
+                worker.observe('ordd_http_request_duration_seconds',
+                               ('version', 'GET'), 0.02)
+                worker.flush()
+            text = workers[0].render()
+        self.assertIn('ordd_http_requests_total{view="version",method="GET",'
+                      'status="200"} 2', text)
+        self.assertIn('ordd_http_request_duration_seconds_bucket{'
+                      'view="version",method="GET",le="0.01"} 0', text)
+        self.assertIn('ordd_http_request_duration_seconds_bucket{'
+                      'view="version",method="GET",le="+Inf"} 2', text)
+        self.assertIn('ordd_http_request_duration_seconds_count{'
+                      'view="version",method="GET"} 2', text)
+
+    def test_endpoint(self):
+        """Test only administrators can read the metrics."""
+        client = APIClient()
+        client.get('/api/version')
+        user = User.objects.create(username="user")
+        client.force_authenticate(user)
+        self.assertEqual(client.get('/api/metrics').status_code, 403)
+
+        user.is_staff = True
+        response = client.get('/api/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        content = response.content.decode()
+        self.assertIn('# TYPE ordd_http_request_queries histogram', content)
+        self.assertIn('ordd_http_requests_total{view="version",method="GET",'
+                      'status="200"}', content)
+        self.assertIn('ordd_cache_requests_total{cache="auth_token",'
+                      'result="miss"}', content)
+
+
+class ProfilingMiddlewareTestCase(TestCase):
+    """Test suite for the profiles of the requests."""
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        settings = self.settings(
+            ORDD_PROFILING_DIR=self.tmpdir.name,
+            ORDD_PROFILING_THRESHOLD=None, ORDD_PROFILING_SAMPLE_RATE=0,
+            ORDD_PROFILING_HEADER='X-Ordd-Profile')
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.staff = User.objects.create(username="staff", is_staff=True,
+                                         is_superuser=True)
+
+    def test_threshold(self):
+        """Test requests slower than the threshold store their stacks."""
+        with self.settings(ORDD_PROFILING_THRESHOLD=0):
+            APIClient().get('/api/version')
+        profile = RequestProfile.objects.get()
+        self.assertEqual((profile.path, profile.kind, profile.trigger),
+                         ('/api/version', RequestProfile.KIND_SAMPLED,
+                          'threshold'))
+        self.assertTrue(os.path.exists(os.path.join(self.tmpdir.name,
+                                                    profile.filename)))
+
+    def test_header(self):
+        """Test staff users can ask a cProfile of their request."""
+        client = APIClient()
+        client.get('/api/version', HTTP_X_ORDD_PROFILE='1')
+        self.assertFalse(RequestProfile.objects.exists())
+
+        client.force_authenticate(self.staff)
+        client.get('/api/version', {'format': 'json'},
+                   HTTP_X_ORDD_PROFILE='1')
+        profile = RequestProfile.objects.get()
+        self.assertEqual((profile.kind, profile.query, profile.user),
+                         (RequestProfile.KIND_CPROFILE, 'format=json',
+                          self.staff))
+        stats = pstats.Stats(os.path.join(self.tmpdir.name,
+                                          profile.filename))
+        self.assertTrue(stats.total_calls)
+
+    def test_header_not_staff(self):
+        """Test the header doesn't enable cProfile for the other users, their
+requests are profiled as the others."""
+        user = User.objects.create(username="user")
+        token = Token.objects.get(user=user)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        with self.settings(ORDD_PROFILING_THRESHOLD=0), \
+                mock.patch('cProfile.Profile') as profile:
+            client.get('/api/version', HTTP_X_ORDD_PROFILE='1')
+            APIClient().get('/api/version', HTTP_X_ORDD_PROFILE='1')
+        profile.assert_not_called()
+        self.assertCountEqual(
+            RequestProfile.objects.values_list('trigger', 'user'),
+            [('threshold', None), ('threshold', user.pk)])
+
+    def test_rotation(self):
+        """Test the oldest profiles beyond the limit are removed."""
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        for _ in range(3):
+            client.get('/api/version', HTTP_X_ORDD_PROFILE='1')
+        newest = list(RequestProfile.objects.values_list('filename',
+                                                         flat=True)[:2])
+        with self.settings(ORDD_PROFILING_MAX_FILES=2):
+            rotate_profiles()
+        self.assertEqual(list(RequestProfile.objects.values_list(
+            'filename', flat=True)), newest)
+        self.assertEqual(sorted(os.listdir(self.tmpdir.name)),
+                         sorted(newest))
+
+    def test_admin_download(self):
+        """Test staff users download the profiles from the admin."""
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        client.get('/api/version', HTTP_X_ORDD_PROFILE='1')
+        profile = RequestProfile.objects.get()
+
+        client = APIClient()
+        client.force_login(self.staff)
+        response = client.get(reverse(
+            'admin:ordd_api_requestprofile_download', args=[profile.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(profile.filename, response['Content-Disposition'])
+        with open(os.path.join(self.tmpdir.name, profile.filename),
+                  'rb') as filein:
+            self.assertEqual(b''.join(response.streaming_content),
+                             filein.read())
+
+    def test_disabled(self):
+        """Test the middleware is not loaded when nothing is configured."""
+        with self.settings(ORDD_PROFILING_HEADER=None):
+            with self.assertRaises(MiddlewareNotUsed):
+                ProfilingMiddleware(lambda request: HttpResponse())
+
+
+@override_settings(ORDD_NPLUSONE_THRESHOLD=2, ORDD_NPLUSONE_RAISE=True)
+class NPlusOneTestCase(TestCase):
+    """Test suite for the detection of repeated queries on the scoring and
+list endpoints."""
+
+    def setUp(self):
+        keydataset = create_keydataset()
+        flood = KeyTag.objects.get(name="flood")
+        region = Region.objects.create(name="Europe")
+        user = User.objects.create(username="user")
+        for iso2, name in (("IT", "Italy"), ("FR", "France"),
+                           ("ES", "Spain")):
+            country = Country.objects.create(iso2=iso2, name=name,
+                                             region=region)
+            country.thinkhazard_appl.add(flood)
+            for _ in range(3):
+                dataset = Dataset.objects.create(
+                    owner=user, country=country, keydataset=keydataset,
+                    **dict.fromkeys(BOOLEAN_FIELDS, True))
+                dataset.tag.add(flood)
+        self.client = APIClient()
+
+    def test_normalize(self):
+        """Test statements differing by literals have the same shape."""
+        self.assertEqual(
+            normalize("SELECT * FROM t WHERE id = 12 AND name = 'a''b'"),
+            normalize("SELECT *\n FROM t WHERE id = 7 AND name = 'c'"))
+        self.assertEqual(normalize('SELECT * FROM t WHERE id IN (%s, %s)'),
+                         'SELECT * FROM t WHERE id IN (...)')
+
+    def add_perils(self):
+        """Add perils, the counters of the scorings take two queries for
+each one."""
+        group = KeyTagGroup.objects.get(name="hazard")
+        for name in ("earthquake", "cyclone"):
+            KeyTag.objects.create(group=group, name=name, is_peril=True)
+
+    def test_list_endpoints(self):
+        """Test the scoring, datasets list and dump endpoints don't repeat
+queries."""
+        for url in ('/api/scoring/', '/api/scoring/?applicability=flood',
+                    '/api/scoring_category/', '/api/scoring/region/',
+                    '/api/scoring/IT', '/api/scoring/IT?category=Base+data',
+                    '/api/dataset/', '/api/dataset/?country=IT',
+                    '/api/datasets_dump'):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_perils_reported(self):
+        """Test the per peril queries of the country scoring are reported
+with their call site and plan."""
+        self.add_perils()
+        with self.settings(ORDD_NPLUSONE_EXPLAIN=True), \
+                self.assertLogs('ordd_api.nplusone', 'WARNING') as logs, \
+                self.assertRaises(RepeatedQueries) as raised:
+            self.client.get('/api/scoring/IT')
+        groups = raised.exception.groups
+        self.assertEqual(len(logs.records), len(groups))
+        self.assertEqual([group.count for group in groups], [3, 3])
+        self.assertTrue(all(
+            site.startswith('ordd_api/views.py:') and
+            site.endswith(' in country_details')
+            for group in groups for site in group.call_sites))
+        self.assertTrue(groups[0].plan)
+
+    @override_settings(ORDD_NPLUSONE_IGNORE=(r'views\.py:\d+ in ', ))
+    def test_ignore(self):
+        """Test ignored call sites are not reported."""
+        self.add_perils()
+        response = self.client.get('/api/scoring/IT')
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(ORDD_SCORING_BACKGROUND=True, ORDD_RECOMPUTE_DEBOUNCE=0)
+class RecomputeTestCase(TestCase):
+    """Test suite for the scorings computed in background."""
+
+    def setUp(self):
+        keydataset = create_keydataset()
+        region = Region.objects.create(name="Europe")
+        self.country = Country.objects.create(iso2="IT", name="Italy",
+                                              region=region)
+        self.country.thinkhazard_appl.add(KeyTag.objects.get(name="flood"))
+        user = User.objects.create(username="user")
+        self.dataset = Dataset.objects.create(
+            owner=user, country=self.country, keydataset=keydataset,
+            **dict.fromkeys(BOOLEAN_FIELDS, True))
+        self.client = APIClient()
+
+    def scores(self):
+        country = self.client.get('/api/scoring/IT')
+        world = self.client.get('/api/scoring/')
+        self.assertTrue(country.has_header('Last-Modified'))
+        self.assertTrue(world.has_header('Last-Modified'))
+        return (json.loads(country.content.decode())['score'],
+                json.loads(world.content.decode())['scores'][0]['score'])
+
+    @override_settings(ORDD_RECOMPUTE_DEBOUNCE=60,
+                       ORDD_RECOMPUTE_MAX_DELAY=90)
+    def test_debounce(self):
+        """Test a burst of changes postpones the recompute up to the
+maximum delay."""
+        ScoreRecompute.objects.all().delete()
+        self.dataset.save()
+        mark = ScoreRecompute.objects.get(
+            scope='country:%d' % self.country.pk)
+        self.dataset.save()
+        self.assertEqual(ScoreRecompute.objects.count(), 2)
+        self.assertGreater(ScoreRecompute.objects.get(pk=mark.pk).due_time,
+                           mark.due_time)
+
+        ScoreRecompute.objects.update(
+            first_time=mark.first_time - timedelta(seconds=100))
+        self.dataset.save()
+        self.assertLess(ScoreRecompute.objects.get(pk=mark.pk).due_time,
+                        timezone.now())
+
+    def test_last_computed_served(self):
+        """Test the views serve the last computed scores until the worker
+computes them again."""
+        self.assertEqual(self.scores(), ('100.0', '100.0'))
+        self.dataset.is_open_licence = False
+        self.dataset.save()
+        self.assertEqual(self.scores(), ('100.0', '100.0'))
+
+        call_command('recompute_scores', once=True, stdout=io.StringIO())
+        self.assertFalse(ScoreRecompute.objects.exists())
+        self.assertEqual(self.scores(), ('70.0', '70.0'))
+
+        self.country.thinkhazard_appl.clear()
+        self.assertTrue(ScoreRecompute.objects.filter(
+            scope='country:%d' % self.country.pk).exists())
+
+
+class ParallelScoringTestCase(TestCase):
+    """Test suite for the world scorings computed by partitions."""
+
+    def setUp(self):
+        create_keydataset()
+        region = Region.objects.create(name="Europe")
+        flood = KeyTag.objects.get(name="flood")
+        for iso2, name in (("IT", "Italy"), ("FR", "France"),
+                           ("AT", "Austria"), ("ES", "Spain")):
+            country = Country.objects.create(iso2=iso2, name=name,
+                                              region=region)
+            country.thinkhazard_appl.add(flood)
+        owner = User.objects.create(username="synthetic")
+        synthetic_datasets(60, owner, seed=1)
+
+    def test_same_as_serial(self):
+        """Test the merged partitions give the serial results."""
+        self.assertEqual(len(partition_countries(3)), 3)
+        for filters in (((), ()), (("flood",), ())):
+            for name in PARALLEL_SCORINGS:
+                expected = getattr(Score, name)(scoring_request(filters))
+                for chunks in (1, 3, 8):
+                    self.assertEqual(
+                        parallel_score(name, filters, chunks=chunks),
+                        expected)
+
+
+class ScoringRegionTestCase(TestCase):
+    """Test suite for the scores aggregated by region."""
+
+    def setUp(self):
+        keydataset = create_keydataset()
+        flood = KeyTag.objects.get(name="flood")
+        user = User.objects.create(username="user")
+        for region, countries in (("Europe", (("IT", "Italy", 100),
+                                              ("FR", "France", 70),
+                                              ("AT", "Austria", 55))),
+                                  ("Africa", (("KE", "Kenya", 55),))):
+            region = Region.objects.create(name=region)
+            for iso2, name, score in countries:
+                country = Country.objects.create(iso2=iso2, name=name,
+                                                 region=region)
+                country.thinkhazard_appl.add(flood)
+                answers = dict.fromkeys(BOOLEAN_FIELDS, True)
+                # 70.0 without open licence, 55.0 without free access too
+                answers['is_open_licence'] = score == 100
+                answers['is_avail_for_free'] = score >= 70
+                Dataset.objects.create(owner=user, country=country,
+                                       keydataset=keydataset, **answers)
+        Region.objects.create(name="Asia")
+        self.client = APIClient()
+
+    def test_statistics(self):
+        """Test the statistics of the countries of each region."""
+        response = self.client.get('/api/scoring/region/')
+        self.assertEqual(response.status_code, 200)
+        regions = response.data['regions']
+        self.assertEqual([region['region'] for region in regions],
+                         ["Africa", "Europe"])
+        europe = regions[1]
+        self.assertEqual(europe['countries_count'], 3)
+        self.assertEqual(europe['score'], {
+            'mean': '75.0', 'median': '70.0', 'min': '55.0',
+            'max': '100.0'})
+        self.assertEqual(europe['categories'], [
+            {'category': 'Base data', 'countries_count': 3,
+             'score': europe['score']}])
+        self.assertEqual(regions[0]['score']['median'], '55.0')
+        with self.assertNumQueries(0):
+            self.client.get('/api/scoring/region/')
+
+    def test_filters(self):
+        """Test the filters select the datasets of the scores."""
+        response = self.client.get('/api/scoring/region/?category=Other')
+        self.assertEqual(response.data['regions'], [])
+        response = self.client.get(
+            '/api/scoring/region/?applicability=Flood')
+        self.assertEqual(len(response.data['regions']), 2)
+
+
+class CompressionMiddlewareTestCase(SimpleTestCase):
+    """Test suite for the responses compression."""
+
+    def setUp(self):
+        self.body = b'{"name":"Administrative boundaries"}' * 100
+
+    def process(self, response, accept_encoding):
+        request = RequestFactory().get(
+            '/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_gzip(self):
+        """Test large responses are gzipped for clients accepting it."""
+        response = self.process(
+            HttpResponse(self.body, content_type='application/json'),
+            'gzip;q=1.0, br;q=0')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.body)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    @unittest.skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli(self):
+        """Test brotli is preferred when available."""
+        response = self.process(
+            HttpResponse(self.body, content_type='application/json'),
+            'gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), self.body)
+
+    def test_not_compressed(self):
+        """Test small, binary or not accepted responses are untouched."""
+        for response, accept_encoding in (
+                (HttpResponse(b'{}', content_type='application/json'),
+                 'gzip'),
+                (HttpResponse(self.body, content_type='image/png'), 'gzip'),
+                (HttpResponse(self.body, content_type='application/json'),
+                 'identity')):
+            response = self.process(response, accept_encoding)
+            self.assertFalse(response.has_header('Content-Encoding'))
+            self.assertIn(response.content, (b'{}', self.body))
+
+    def test_streaming(self):
+        """Test streaming responses are compressed chunk by chunk."""
+        response = self.process(
+            StreamingHttpResponse(iter([self.body] * 3),
+                                  content_type='text/csv'), 'gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)),
+            self.body * 3)
+
+
+@unittest.skipIf(orjson is None, 'orjson is not installed')
+class FastJSONRendererTestCase(TestCase):
+    """Test suite for the orjson renderer, its output must be the one of
+the standard DRF renderer."""
+
+    def setUp(self):
+        keydataset = create_keydataset()
+        flood = KeyTag.objects.get(name="flood")
+        region = Region.objects.create(name="Europe")
+        user = User.objects.create(username="user")
+        for iso2, name, answer in (("IT", "Italy", True),
+                                   ("CI", "C\u00f4te d\u2019Ivoire", False)):
+            country = Country.objects.create(iso2=iso2, name=name,
+                                             region=region)
+            country.thinkhazard_appl.add(flood)
+            Dataset.objects.create(
+                owner=user, country=country, keydataset=keydataset,
+                notes="line\u2028separator",
+                is_existing_txt="null in 2017, 0.00001 of the 1e6 km2",
+                **dict.fromkeys(BOOLEAN_FIELDS, answer))
+        self.renderers = (FastJSONRenderer(), JSONRenderer())
+
+    def assertSameOutput(self, data):
+        fast, standard = (renderer.render(data)
+                          for renderer in self.renderers)
+        self.assertEqual(fast, standard)
+
+    def test_scoring_payloads(self):
+        """Test the scoring payloads are rendered as the DRF renderer."""
+        request = Request(APIRequestFactory().get('/api/scoring/'))
+        for data in (Score.all_countries(request),
+                     Score.all_countries_categories(request),
+                     Score.all_regions(request),
+                     Score.country_details(request, "IT"),
+                     Score.country_details(request, "CI")):
+            self.assertSameOutput(data)
+
+    def test_divergent_data(self):
+        """Test data orjson can't render as the DRF renderer."""
+        for data in ({"score": float('nan')}, {"score": float('inf')},
+                     {1: "integer key"}, {"big": 2 ** 70},
+                     {"floats": [1e16, 2.5e-05, 1e-07, 1.5]},
+                     {"date": timezone.now(),
+                      "time": timezone.now().time()},
+                     {"decimal": Decimal("0.00001")},
+                     {"missing": None}):
+            self.assertSameOutput(data)
+
+    def test_dataset_list(self):
+        """Test a datasets list, with nulls and free text, is rendered by
+orjson."""
+        data = APIClient().get('/api/dataset/').data
+        self.assertSameOutput(data)
+        with mock.patch.object(JSONRenderer, 'render') as render:
+            FastJSONRenderer().render(data)
+        render.assert_not_called()
+
+
+class ScoringCacheTestCase(TransactionTestCase):
+    """Test suite for the cache of the scoring results."""
+
+    def setUp(self):
+        self.keydataset = create_keydataset()
+        flood = KeyTag.objects.get(name="flood")
+        region = Region.objects.create(name="Europe")
+        self.country = Country.objects.create(iso2="IT", name="Italy",
+                                              region=region)
+        self.country.thinkhazard_appl.add(flood)
+        self.user = User.objects.create(username="user",
+                                        email="user@example.org")
+        self.dataset = Dataset.objects.create(
+            owner=self.user, country=self.country,
+            keydataset=self.keydataset,
+            **dict.fromkeys(BOOLEAN_FIELDS, True))
+        self.client = APIClient()
+
+    def test_scoring_cached_until_datasets_change(self):
+        """Test scores are computed once and again after a change."""
+        response = self.client.get('/api/scoring/IT?category=Base+data')
+        self.assertEqual(response.data['score'], '100.0')
+        with self.assertNumQueries(0):
+            self.client.get('/api/scoring/IT?category=Base+data')
+        self.client.get('/api/scoring/?applicability=flood')
+        with self.assertNumQueries(0):
+            self.client.get('/api/scoring/?applicability=Flood')
+
+        self.dataset.is_open_licence = False
+        self.dataset.save()
+        response = self.client.get('/api/scoring/IT?category=Base+data')
+        self.assertEqual(response.data['score'], '70.0')
+
+    def test_country_details_materialized(self):
+        """Test unfiltered country details are stored and regenerated only
+when the country changes."""
+        other = Country.objects.create(iso2="FR", name="France",
+                                       region=self.country.region)
+        response = self.client.get('/api/scoring/IT')
+        self.assertEqual(json.loads(response.content.decode())['score'],
+                         '100.0')
+        # only the materialized row is read
+        with self.assertNumQueries(1):
+            cached = self.client.get('/api/scoring/IT')
+        self.assertEqual(cached.content, response.content)
+
+        # changes of other countries keep it
+        self.client.get('/api/scoring/FR')
+        Dataset.objects.create(owner=self.user, country=other,
+                               keydataset=self.keydataset,
+                               **dict.fromkeys(BOOLEAN_FIELDS, False))
+        with self.assertNumQueries(1):
+            self.client.get('/api/scoring/IT')
+        self.assertNotEqual(other.details.revision,
+                            other.details.payload_revision)
+
+        self.dataset.is_open_licence = False
+        self.dataset.save()
+        response = self.client.get('/api/scoring/IT')
+        self.assertEqual(json.loads(response.content.decode())['score'],
+                         '70.0')
+
+        self.country.thinkhazard_appl.clear()
+        details = CountryDetails.objects.get(country=self.country)
+        self.assertNotEqual(details.revision, details.payload_revision)
+
+        response = self.client.get('/api/scoring/XX')
+        self.assertEqual(response.status_code, 404)
+
+    def test_stale_while_computing(self):
+        """Test the previous scores are served while another process
+computes the current ones."""
+        url = '/api/scoring/?category=Base+data'
+        self.assertEqual(self.client.get(url).data['scores'][0]['score'],
+                         '100.0')
+        self.dataset.is_open_licence = False
+        self.dataset.save()
+
+        lock_key = 'ordd_api:scoring:lock:%s' % scoring_key(
+            'all_countries', [], ((), ('base data', )))
+        cache.add(lock_key, 'other process', 60)
+        try:
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertEqual(response.data['scores'][0]['score'], '100.0')
+        finally:
+            cache.delete(lock_key)
+        self.assertEqual(self.client.get(url).data['scores'][0]['score'],
+                         '70.0')
+
+    def test_single_flight(self):
+        """Test concurrent misses compute a value once, the others wait for
+it or give up after the timeout."""
+        flight = SingleFlight('ordd_api:test', 10, 5, poll_interval=0.01)
+        key = uuid.uuid4().hex
+        computed = []
+        results = []
+
+        def compute():
+            computed.append(1)
+            time.sleep(0.2)
+            cache.set('ordd_api:test:%s' % key, 'value', 60)
+            return 'value'
+
+        def run():
+            results.append(flight.run(
+                key, compute, lambda: cache.get('ordd_api:test:%s' % key)))
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(computed), 1)
+        self.assertEqual(sorted(outcome for _, outcome in results),
+                         [COMPUTED, WAITED, WAITED, WAITED])
+
+        flight = SingleFlight('ordd_api:test', 10, 0.05, poll_interval=0.01)
+        cache.add('ordd_api:test:lock:other', 'other process', 60)
+        try:
+            self.assertEqual(flight.run('other', lambda: 'mine',
+                                        lambda: None, lambda: 'stale'),
+                             ('stale', STALE))
+            self.assertEqual(flight.run('other', lambda: 'mine',
+                                        lambda: None), ('mine', TIMEOUT))
+        finally:
+            cache.delete('ordd_api:test:lock:other')
+
+    def test_missing_datasets(self):
+        """Test missing datasets follow the filters of the request."""
+        unused = KeyDatasetName.objects.create(name="Unused",
+                                               category="Base data")
+        request = scoring_request(((), ()))
+        details = Score.country_details(request, "IT")
+        self.assertEqual(details['missing_datasets'], [
+            {"id": unused.pk, "name": "Unused", "category": "Base data"}])
+        request = scoring_request((("Flood",), ()))
+        details = Score.country_details(request, "IT")
+        self.assertEqual(details['missing_datasets'], [])
+
+    def test_country_details_rows(self):
+        """Test the rows report the answers of the scored dataset."""
+        self.dataset.is_open_licence = False
+        self.dataset.save()
+        details = Score.country_details(scoring_request(((), ())), "IT")
+        self.assertEqual(details['datasets_count'], 1)
+        self.assertEqual(details['fullscores_count'], 0)
+        self.assertEqual(len(details['scores'][0]), 13)
+        self.assertEqual(details['scores'][1:], [
+            ["BA_1A", "Administrative boundaries", "70.0"] + [True] * 8 +
+            [False, True]])
+
+    def test_warm_caches(self):
+        """Test warm_caches stores the scores read by the views."""
+        call_command('warm_caches', workers=0, stdout=io.StringIO())
+        for url in ('/api/scoring/', '/api/scoring_category/',
+                    '/api/scoring/?category=Base+data'):
+            with self.assertNumQueries(0):
+                self.client.get(url)
+        with self.assertNumQueries(1):
+            self.client.get('/api/scoring/IT')
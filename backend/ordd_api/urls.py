@@ -5,12 +5,15 @@ from rest_framework.urlpatterns import format_suffix_patterns
 
 from rest_framework.authtoken.views import obtain_auth_token
 from .views import (
-    RegionListView, CountryListView, KeyPerilListView,
+    RegionListView, CountryListView, KeyPerilListView, CatalogueView,
     ProfileDetails, ProfilePasswordUpdate, ProfilePasswordReset,
     ProfileCommentSendView, UserCreateView, UserDetailsView,
-    RegistrationView, ProfileDatasetListCreateView, ProfileDatasetDetailsView,
-    DatasetListView, DatasetDetailsView, DatasetsDumpView, VersionGet,
-    ScoringWorldGet, ScoringCountryDetailsGet, ScoringWorldCategoriesGet)
+    RegistrationView, ProfileDatasetListCreateView, ProfileDatasetBulkView,
+    ProfileDatasetDetailsView,
+    DatasetListView, DatasetDetailsView, DatasetBulkReviewView,
+    DatasetsDumpView, VersionGet, MetricsGet,
+    ScoringWorldGet, ScoringCountryDetailsGet, ScoringWorldCategoriesGet,
+    ScoringRegionsGet)
 
 from .keydatasets_views import (
     KeyDataset0on4ListView, KeyDataset1on4ListView, KeyDataset2on4ListView,
@@ -27,7 +30,10 @@ urlpatterns = [
     url(r'^scoring/(?P<country_id>[A-Z0-9][A-Z0-9])$',
         ScoringCountryDetailsGet.as_view(), name="scoring_country"),
     url(r'^scoring/$', ScoringWorldGet.as_view(), name="scoring_world"),
+    url(r'^scoring/region/$', ScoringRegionsGet.as_view(),
+        name="scoring_region"),
     url(r'^version$', VersionGet.as_view(), name="version"),
+    url(r'^metrics$', MetricsGet.as_view(), name="metrics"),
     url(r'^profile$', ProfileDetails.as_view(), name="profile_details"),
     url(r'^profile/password$', ProfilePasswordUpdate.as_view(),
         name="profile_password_update"),
@@ -35,6 +41,8 @@ urlpatterns = [
         name="profile_password_reset"),
     url(r'^profile/dataset/$', ProfileDatasetListCreateView.as_view(),
         name="profile_dataset_listcreate"),
+    url(r'^profile/dataset/bulk$', ProfileDatasetBulkView.as_view(),
+        name="profile_dataset_bulk"),
     url(r'^profile/dataset/(?P<pk>[0-9]+)$',
         ProfileDatasetDetailsView.as_view(), name="profile_dataset_details"),
     url(r'^profile/comment/send$',
@@ -42,6 +50,8 @@ urlpatterns = [
     url(r'^dataset/$', DatasetListView.as_view(), name="dataset_list"),
     url(r'^dataset/(?P<pk>[0-9]+)$',
         DatasetDetailsView.as_view(), name="dataset_details"),
+    url(r'^dataset/review$',
+        DatasetBulkReviewView.as_view(), name="dataset_bulk_review"),
 
     url(r'^datasets_dump$', DatasetsDumpView.as_view(), name="datasets_dump"),
 
@@ -57,6 +67,8 @@ urlpatterns = [
 
     url(r'^country/$', CountryListView.as_view(), name="country_list"),
 
+    url(r'^catalogue$', CatalogueView.as_view(), name="catalogue"),
+
     url(r'^keydataset/tag/$',  KeyDatasetTagGroup.as_view(),
         name="key_dataset_tag_group"),
     url(r'^keydataset/tag/(?P<group>.+)$',
@@ -1,10 +1,12 @@
 # views.py
 from datetime import datetime, timedelta
+from functools import partial
+from itertools import islice
 
 import pytz
 import json
+import statistics
 import django.core.exceptions
-from django.db.models import Sum
 from django.utils import timezone
 from rest_framework.renderers import JSONRenderer
 from rest_framework import generics, permissions, status
@@ -13,13 +15,14 @@ from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.exceptions import NotFound
 from rest_framework.serializers import ValidationError
-from collections import OrderedDict
+from collections import OrderedDict, defaultdict
 from django.core.exceptions import ObjectDoesNotExist
-from django.utils.http import urlencode
+from django.utils.http import http_date, urlencode
 from django.db.models import Q
 from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
-from django.http import Http404
+from django.http import Http404, HttpResponse
+from django.db import transaction
 
 from rest_framework_csv import renderers as csv_rend
 
@@ -29,11 +32,21 @@ from .serializers import (
     ChangePasswordSerializer, ResetPasswordReqSerializer,
     ResetPasswordSerializer, ProfileCommentSendSerializer,
     ProfileDatasetListSerializer, ProfileDatasetCreateSerializer,
+    ProfileDatasetBulkSerializer, preload_dataset_lookups,
     DatasetListSerializer, DatasetPutSerializer, DatasetsDumpSerializer)
 from .models import (Region, Country, OptIn, Dataset, KeyDataset,
-                     KeyDatasetName, KeyCategory, KeyTag,
-                     my_random_key, Profile)
+                     KeyCategory, KeyTag,
+                     my_random_key)
 from .mailer import mailer
+from .bootstrap import bootstrap
+from .catalogue import RenderedCatalogueMixin
+from .country_details import materialized_country_details
+from .taxonomy import taxonomy
+from .metrics import metrics
+from .recompute import background_enabled, world_scores, store_world_scores
+from .renderers import PrometheusTextRenderer
+from .scoring_cache import cached_score, scoring_filters
+from .roles import has_role, role_emails, ROLE_ADMIN, ROLE_REVIEWER
 from ordd_api import __version__, MAIL_SUBJECT_PREFIX
 from ordd.settings import EMAIL_CONFIRM_PROTO
 
@@ -56,6 +69,20 @@ def check_tags_consistency(serializer):
                      'keydataset'].description)})
 
 
+class EagerLoadingMixin(object):
+    """Mixin for generic views: the queryset loads the related objects
+declared by the 'setup_eager_loading' method of the serializer class, so
+the number of queries doesn't grow with the number of objects."""
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        setup_eager_loading = getattr(self.get_serializer_class(),
+                                      'setup_eager_loading', None)
+        if setup_eager_loading is not None:
+            queryset = setup_eager_loading(queryset)
+        return queryset
+
+
 class VersionGet(APIView):
     """This class handles the GET requests of our rest api."""
 
@@ -63,6 +90,16 @@ class VersionGet(APIView):
         return Response(__version__)
 
 
+class MetricsGet(APIView):
+    """This view return the metrics of all the api processes in the
+Prometheus text format"""
+    permission_classes = (permissions.IsAdminUser,)
+    renderer_classes = (PrometheusTextRenderer, )
+
+    def get(self, request):
+        return Response(metrics.render())
+
+
 class ProfileDetails(generics.RetrieveUpdateAPIView):
     queryset = User.objects.all()
     serializer_class = ProfileSerializer
@@ -226,8 +263,8 @@ class RegistrationView(generics.CreateAPIView, generics.RetrieveAPIView):
             MAIL_SUBJECT_PREFIX, user.username))
         content = ("""New user '%s' has activated his or her account.<br>
 EMail address: '%s'.<br>""" % (user.username, user.email))
-        for admin in Profile.objects.filter(user__groups__name='admin'):
-            mailer(admin.user.email, subject,
+        for email in role_emails(ROLE_ADMIN):
+            mailer(email, subject,
                    {"title": subject,
                     "content": content},
                    None, 'base')
@@ -235,24 +272,34 @@ EMail address: '%s'.<br>""" % (user.username, user.email))
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class RegionListView(generics.ListAPIView):
+class RegionListView(RenderedCatalogueMixin, generics.ListAPIView):
     """This class handles the GET and POSt requests of our rest api."""
     queryset = Region.objects.all().order_by('id')
     serializer_class = RegionSerializer
 
 
-class CountryListView(generics.ListAPIView):
+class CountryListView(RenderedCatalogueMixin, generics.ListAPIView):
     """This class handles the GET and POSt requests of our rest api."""
-    queryset = Country.objects.all().order_by('name')
+    queryset = Country.objects.select_related('region').order_by('name')
     serializer_class = CountrySerializer
 
 
-class KeyPerilListView(generics.ListAPIView):
+class KeyPerilListView(RenderedCatalogueMixin, generics.ListAPIView):
     """This class handles the GET and POSt requests of our rest api."""
     queryset = KeyTag.objects.filter(is_peril=True).order_by('name')
     serializer_class = KeyPerilSerializer
 
 
+class CatalogueView(APIView):
+    """This class handles the GET requests of our rest api.
+
+Return the whole reference catalogue in one precompressed payload, rebuilt
+only when the reference tables change."""
+
+    def get(self, request, format=None):
+        return bootstrap.get().response(request)
+
+
 class CountryDetailsView(generics.RetrieveAPIView):
     """This class handles the GET and POSt requests of our rest api."""
     queryset = Country.objects.all().order_by('name')
@@ -273,8 +320,8 @@ class UserCreateView(generics.ListCreateAPIView):
             MAIL_SUBJECT_PREFIX, instance.username))
         content = ("""User '%s' has been deleted by an administrator.<br>"""
                    % instance.username)
-        for admin in Profile.objects.filter(user__groups__name='admin'):
-            mailer(admin.user.email, subject,
+        for email in role_emails(ROLE_ADMIN):
+            mailer(email, subject,
                    {"title": subject,
                     "content": content},
                    None, 'base')
@@ -323,8 +370,8 @@ class ProfileCommentSendView(APIView):
             MAIL_SUBJECT_PREFIX,
             request.user.username))
 
-        for reviewer in Profile.objects.filter(user__groups__name='reviewer'):
-            mailer(reviewer.user.email, subject,
+        for email in role_emails(ROLE_REVIEWER):
+            mailer(email, subject,
                    {"title": subject,
                     "human_name": human_name,
                     "comment": instance.validated_data['comment'],
@@ -344,7 +391,8 @@ class IsOwner(permissions.BasePermission):
         return obj.owner == request.user
 
 
-class ProfileDatasetListCreateView(generics.ListCreateAPIView):
+class ProfileDatasetListCreateView(EagerLoadingMixin,
+                                   generics.ListCreateAPIView):
     permission_classes = (IsOwner, )
 
     def get_serializer_class(self):
@@ -412,8 +460,8 @@ class ProfileDatasetListCreateView(generics.ListCreateAPIView):
                  post_field._meta.get_field(field).verbose_name,
                  "post": post_value})
 
-        for reviewer in Profile.objects.filter(user__groups__name='reviewer'):
-            mailer(reviewer.user.email, subject,
+        for email in role_emails(ROLE_REVIEWER):
+            mailer(email, subject,
                    {"title": subject,
                     "owner": post_field.changed_by.username,
                     "table_title": "Created dataset:",
@@ -421,7 +469,54 @@ class ProfileDatasetListCreateView(generics.ListCreateAPIView):
                    None, 'create_by_owner')
 
 
-class ProfileDatasetDetailsView(generics.RetrieveUpdateDestroyAPIView):
+class ProfileDatasetBulkView(GenericAPIView):
+    """Create (items without 'id') or update (items with the 'id' of an
+owned dataset) many datasets with a single request and a single
+notification for each reviewer."""
+    serializer_class = ProfileDatasetBulkSerializer
+    permission_classes = (permissions.IsAuthenticated, )
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['preloaded'] = preload_dataset_lookups()
+        return context
+
+    def post(self, request):
+        serializer = self.get_serializer(data=request.data, many=True)
+        serializer.is_valid(raise_exception=True)
+        updated_ids = {item['id'] for item in serializer.validated_data
+                       if item.get('id') is not None}
+
+        with transaction.atomic():
+            datasets = serializer.save()
+
+        created = [ds for ds in datasets if ds.pk not in updated_ids]
+        updated = [ds for ds in datasets if ds.pk in updated_ids]
+
+        if datasets:
+            subject = ("%s: %d new and %d updated datasets from user '%s'" % (
+                MAIL_SUBJECT_PREFIX, len(created), len(updated),
+                request.user.username))
+            rows = [{"action": ("created" if ds.pk not in updated_ids
+                                else "updated"),
+                     "country": ds.country.name,
+                     "keydataset": ds.keydataset.__str__()}
+                    for ds in datasets]
+            for email in role_emails(ROLE_REVIEWER):
+                mailer(email, subject,
+                       {"title": subject,
+                        "owner": request.user.username,
+                        "rows": rows},
+                       None, 'bulk_by_owner')
+
+        return Response({"created": [ds.pk for ds in created],
+                         "updated": [ds.pk for ds in updated]},
+                        status=(status.HTTP_201_CREATED if created
+                                else status.HTTP_200_OK))
+
+
+class ProfileDatasetDetailsView(EagerLoadingMixin,
+                                generics.RetrieveUpdateDestroyAPIView):
     serializer_class = ProfileDatasetListSerializer
     permission_classes = (IsOwner, )
 
@@ -515,9 +610,8 @@ class ProfileDatasetDetailsView(generics.RetrieveUpdateDestroyAPIView):
                  "pre": pre_value if pre_value != post_value else None})
 
         if (rows):
-            for reviewer in Profile.objects.filter(
-                    user__groups__name='reviewer'):
-                mailer(reviewer.user.email, subject,
+            for email in role_emails(ROLE_REVIEWER):
+                mailer(email, subject,
                        {"title": subject,
                         "changed_by": self.request.user.username,
                         "is_reviewed": post['is_reviewed'].value,
@@ -573,8 +667,8 @@ class ProfileDatasetDetailsView(generics.RetrieveUpdateDestroyAPIView):
                  instance._meta.get_field(field).verbose_name,
                  "post": post_value})
 
-        for reviewer in Profile.objects.filter(user__groups__name='reviewer'):
-            mailer(reviewer.user.email, subject,
+        for email in role_emails(ROLE_REVIEWER):
+            mailer(email, subject,
                    {"title": subject,
                     "owner": instance.changed_by.username,
                     "table_title": "Deleted dataset:",
@@ -593,20 +687,19 @@ class DatasetDetailsViewPerms(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
         else:
-            perms = (request.user.groups.filter(name='reviewer').exists() or
-                     request.user.groups.filter(name='admin').exists())
+            perms = has_role(request.user, ROLE_REVIEWER, ROLE_ADMIN)
         return perms
 
     def has_object_permission(self, request, view, obj):
         if request.method in permissions.SAFE_METHODS:
             return True
         else:
-            perms = (request.user.groups.filter(name='reviewer').exists() or
-                     request.user.groups.filter(name='admin').exists())
+            perms = has_role(request.user, ROLE_REVIEWER, ROLE_ADMIN)
         return perms
 
 
-class DatasetDetailsView(generics.RetrieveUpdateDestroyAPIView):
+class DatasetDetailsView(EagerLoadingMixin,
+                         generics.RetrieveUpdateDestroyAPIView):
     """This class handles the GET requests of our rest api."""
     permission_classes = (DatasetDetailsViewPerms, )
     queryset = Dataset.objects.all()
@@ -759,53 +852,119 @@ class DatasetDetailsView(generics.RetrieveUpdateDestroyAPIView):
         instance.delete()
 
 
-class DatasetListView(generics.ListAPIView):
+DATASET_FILTER_PARAMS = ('kd', 'country', 'category', 'applicability',
+                         'tag', 'is_reviewed')
+
+
+def dataset_list_filter(queryset, query_params):
+    """Apply to 'queryset' the filters passed as query parameters to the
+datasets list, see DATASET_FILTER_PARAMS."""
+    kd = query_params.getlist('kd')
+    country = query_params.getlist('country')
+    category = query_params.getlist('category')
+    applicability = query_params.getlist('applicability')
+    tag = query_params.getlist('tag')
+    is_reviewed = query_params.getlist('is_reviewed')
+
+    q = Q()
+    for v in is_reviewed:
+        q = q | Q(is_reviewed__iexact=v)
+    queryset = queryset.filter(q)
+
+    q = Q()
+    for v in country:
+        q = q | Q(country__iso2__iexact=v)
+    queryset = queryset.filter(q)
+
+    q = Q()
+    for v in kd:
+        q = q | Q(keydataset__code__iexact=v)
+    queryset = queryset.filter(q)
+
+    q = Q()
+    for v in category:
+        q = q | Q(keydataset__category__name__iexact=v)
+    queryset = queryset.filter(q)
+
+    q = Q()
+    for v in applicability:
+        # FIXME currently in tag we may have extra applicabilities
+        # when category (tag group) is 'hazard'
+        q = q | (Q(keydataset__applicability__name__iexact=v) |
+                 Q(tag__name__iexact=v))
+    queryset = queryset.filter(q)
+
+    q = Q()
+    for v in tag:
+        q = q | Q(tag__name__iexact=v)
+    queryset = queryset.filter(q)
+
+    return queryset.distinct()
+
+
+class DatasetListView(EagerLoadingMixin, generics.ListAPIView):
     serializer_class = DatasetListSerializer
 
     def get_queryset(self):
         queryset = Dataset.objects.all().order_by('country__name',
                                                   'keydataset__code')
-        kd = self.request.query_params.getlist('kd')
-        country = self.request.query_params.getlist('country')
-        category = self.request.query_params.getlist('category')
-        applicability = self.request.query_params.getlist('applicability')
-        tag = self.request.query_params.getlist('tag')
-        is_reviewed = self.request.query_params.getlist('is_reviewed')
-
-        q = Q()
-        for v in is_reviewed:
-            q = q | Q(is_reviewed__iexact=v)
-        queryset = queryset.filter(q)
-
-        q = Q()
-        for v in country:
-            q = q | Q(country__iso2__iexact=v)
-        queryset = queryset.filter(q)
-
-        q = Q()
-        for v in kd:
-            q = q | Q(keydataset__code__iexact=v)
-        queryset = queryset.filter(q)
-
-        q = Q()
-        for v in category:
-            q = q | Q(keydataset__category__name__iexact=v)
-        queryset = queryset.filter(q)
-
-        q = Q()
-        for v in applicability:
-            # FIXME currently in tag we may have extra applicabilities
-            # when category (tag group) is 'hazard'
-            q = q | (Q(keydataset__applicability__name__iexact=v) |
-                     Q(tag__name__iexact=v))
-        queryset = queryset.filter(q)
-
-        q = Q()
-        for v in tag:
-            q = q | Q(tag__name__iexact=v)
-        queryset = queryset.filter(q)
-
-        return queryset.distinct()
+        return dataset_list_filter(queryset, self.request.query_params)
+
+
+class DatasetBulkReviewView(APIView):
+    """Mark as reviewed the datasets listed in 'ids' and/or matching the
+same query parameters of the datasets list, a digest is sent to each
+owner"""
+    permission_classes = (DatasetDetailsViewPerms, )
+
+    def put(self, request):
+        ids = request.data.get('ids', None)
+        has_filters = any(param in request.query_params
+                          for param in DATASET_FILTER_PARAMS)
+        if not ids and not has_filters:
+            return Response(
+                {"detail": "'ids' or at least one filter are required"},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = Dataset.objects.filter(is_reviewed=False)
+        if ids:
+            # bool is an int, 'true' is not the id 1
+            if (not isinstance(ids, list) or
+                    not all(type(pk) is int for pk in ids)):
+                return Response({"detail": "'ids' must be a list of integers"},
+                                status=status.HTTP_400_BAD_REQUEST)
+            queryset = queryset.filter(pk__in=ids)
+        queryset = dataset_list_filter(queryset, request.query_params)
+
+        now = datetime.now(tz=pytz.utc).replace(microsecond=0)
+        with transaction.atomic():
+            reviewed_ids = list(queryset.values_list('pk', flat=True))
+            Dataset.objects.filter(pk__in=reviewed_ids).update(
+                is_reviewed=True, review_date=now, modify_time=now,
+                changed_by=request.user)
+            transaction.on_commit(
+                lambda: self.send_digests(reviewed_ids, request.user))
+
+        return Response({"reviewed": len(reviewed_ids), "ids": reviewed_ids})
+
+    def send_digests(self, reviewed_ids, reviewer):
+        owners = OrderedDict()
+        datasets = Dataset.objects.filter(pk__in=reviewed_ids).select_related(
+            'owner', 'country', 'keydataset__dataset', 'keydataset__level')
+        for dataset in datasets.order_by('owner', 'country__name',
+                                         'keydataset__code'):
+            owners.setdefault(dataset.owner, []).append(
+                {"country": dataset.country.name,
+                 "keydataset": dataset.keydataset.__str__()})
+
+        for owner, rows in owners.items():
+            subject = "%s: %d of your datasets have been reviewed" % (
+                MAIL_SUBJECT_PREFIX, len(rows))
+            mailer(owner.email, subject,
+                   {"title": subject,
+                    "changed_by": reviewer.username,
+                    "rows": rows},
+                   None, 'review_digest')
 
 
 class DatasetsDumpRenderer(csv_rend.CSVRenderer):
@@ -821,7 +980,7 @@ class DatasetsDumpRenderer(csv_rend.CSVRenderer):
     ]
 
 
-class DatasetsDumpView(generics.ListAPIView):
+class DatasetsDumpView(EagerLoadingMixin, generics.ListAPIView):
     """This view return a downloadable csv with all the datasets with urls and
  tags serialized"""
     queryset = Dataset.objects.all()
@@ -836,13 +995,65 @@ class DatasetsDumpView(generics.ListAPIView):
         return response
 
 
+# answers reported for each key dataset of the country details
+SCORE_ANSWERS = (
+    'is_existing', 'is_digital_form', 'is_avail_online',
+    'is_avail_online_meta', 'is_bulk_avail', 'is_machine_read',
+    'is_pub_available', 'is_avail_for_free', 'is_open_licence',
+    'is_prov_timely')
+
+
+def score_datasets(queryset, chunk_size=1000):
+    """Iterate the datasets of 'queryset' with the set of names of their
+tags, without caching them in the queryset; their countries and keydatasets
+are loaded once and shared, the tag names are read 'chunk_size' datasets
+at a time (prefetched tags would cost a queryset for each dataset)."""
+    countries = Country.objects.filter(
+        pk__in=queryset.values('country')).prefetch_related(
+            'thinkhazard_appl').in_bulk()
+    keydatasets = KeyDataset.objects.filter(
+        pk__in=queryset.values('keydataset')).select_related(
+            'category').prefetch_related('applicability').in_bulk()
+    datasets = queryset.iterator()
+    while True:
+        chunk = list(islice(datasets, chunk_size))
+        if not chunk:
+            return
+        tags = defaultdict(set)
+        for dataset_id, name in Dataset.tag.through.objects.filter(
+                dataset__in=chunk).values_list('dataset', 'keytag__name'):
+            tags[dataset_id].add(name)
+        for dataset in chunk:
+            dataset.country = countries[dataset.country_id]
+            dataset.keydataset = keydatasets[dataset.keydataset_id]
+            yield dataset, tags[dataset.id]
+
+
+class ScoreRecord(object):
+    """Best score of a key dataset in the score tree, with what the country
+details report of its dataset, so the tree doesn't keep the datasets."""
+    __slots__ = ('code', 'description', 'value', 'answers')
+
+    def __init__(self, code, description, value, answers):
+        self.code = code
+        self.description = description
+        self.value = value
+        self.answers = answers
+
+    @classmethod
+    def from_dataset(cls, dataset, value):
+        keydataset = dataset.keydataset
+        return cls(keydataset.code, keydataset.description, value,
+                   tuple(getattr(dataset, field) for field in SCORE_ANSWERS))
+
+
 class Score(object):
     @classmethod
     def score_fmt(cls, score):
         return "%.1f" % (score * 100.0)
 
     @classmethod
-    def dataset(cls, request, dataset, th_applicability):
+    def dataset(cls, request, dataset, th_applicability, tags):
         score = 0.0
 
         if dataset.is_existing:
@@ -870,8 +1081,7 @@ class Score(object):
         for kd_appl in dataset.keydataset.applicability.all():
             appl.add(kd_appl.name)
 
-        for ds_appl in dataset.tag.all():
-            appl.add(ds_appl.name)
+        appl |= tags
 
         score *= len(appl & th_applicability) / len(th_applicability)
 
@@ -881,32 +1091,28 @@ class Score(object):
     def category(cls, category, country_score_tree):
         category_score = 0
 
+        # the tree has only key datasets of the category
         category_score_tree = country_score_tree[category.code]
 
-        for keydataset in KeyDataset.objects.filter(category=category):
-            if keydataset.code not in category_score_tree['score']:
-                continue
-            keydataset_score = category_score_tree['score'][keydataset.code][
-                'value']
-
-            if category_score < keydataset_score:
-                category_score = keydataset_score
+        for record in category_score_tree['score'].values():
+            if category_score < record.value:
+                category_score = record.value
 
         return category_score
 
     @classmethod
-    def country(cls, country_score_tree, country):
+    def country(cls, country_score_tree, country, categories=None):
+        """Score of 'country', 'categories' are all the key categories when
+already loaded by the caller."""
+        if categories is None:
+            categories = KeyCategory.objects.all().order_by('id')
+        categories = list(categories)
 
-        th_applicability = set()
-        for appl in country.thinkhazard_appl.all():
-            th_applicability.add(appl.name)
-
-        category_weights_sum = KeyCategory.objects.aggregate(
-            Sum('weight'))
-        category_weights_sum = float(category_weights_sum['weight__sum'])
+        category_weights_sum = float(sum(category.weight
+                                         for category in categories))
 
         country_score = 0
-        for category in KeyCategory.objects.all().order_by('id'):
+        for category in categories:
             if category.code not in country_score_tree:
                 continue
             category_score = cls.category(category, country_score_tree)
@@ -919,7 +1125,7 @@ class Score(object):
         return country_score
 
     @classmethod
-    def country_loadtree(cls, request, country_score_tree, dataset,
+    def country_loadtree(cls, request, country_score_tree, dataset, tags,
                          th_applicability):
         category_id = dataset.keydataset.category.code
         keydataset_id = dataset.keydataset.code
@@ -930,20 +1136,26 @@ class Score(object):
         category_score_tree = country_score_tree[category_id]
         category_score_tree['counter'] += 1
         if keydataset_id not in category_score_tree:
-            category_score_tree['score'][keydataset_id] = {
-                "dataset": None, 'value': -1}
-        keydataset_score_tree = category_score_tree['score'][keydataset_id]
-        score = cls.dataset(request, dataset, th_applicability)
+            category_score_tree['score'][keydataset_id] = None
+        record = category_score_tree['score'][keydataset_id]
+        score = cls.dataset(request, dataset, th_applicability, tags)
 
-        if keydataset_score_tree['value'] < score:
-            keydataset_score_tree['value'] = score
-            keydataset_score_tree['dataset'] = dataset
+        if record is None or record.value < score:
+            category_score_tree['score'][keydataset_id] = \
+                ScoreRecord.from_dataset(dataset, score)
+
+    @classmethod
+    def tree_count(cls, country_score_tree):
+        """Number of datasets loaded in 'country_score_tree'."""
+        return sum(category_score_tree['counter']
+                   for category_score_tree in country_score_tree.values())
 
     @classmethod
     def dataset_loadtree(cls, request, queryset):
         # preloaded tree with data from datasets to avoid bad performances
         world_score_tree = OrderedDict()
-        for dataset in queryset:
+        # not cached by the queryset, the tree keeps only ScoreRecord
+        for dataset, tags in score_datasets(queryset):
             country_id = dataset.country.iso2
             th_applicability = set()
             for appl in dataset.country.thinkhazard_appl.all():
@@ -955,14 +1167,15 @@ class Score(object):
                 world_score_tree[country_id] = OrderedDict()
             country_score_tree = world_score_tree[country_id]
 
-            cls.country_loadtree(request, country_score_tree, dataset,
+            cls.country_loadtree(request, country_score_tree, dataset, tags,
                                  th_applicability)
 
         return world_score_tree
 
     @classmethod
-    def all_countries(cls, request):
-        queryset = Dataset.objects.all()
+    def filter_datasets(cls, request, queryset):
+        """Datasets of 'queryset' matching the applicability and category
+filters of 'request'."""
         applicability = request.query_params.getlist('applicability')
         category = request.query_params.getlist('category')
         if applicability:
@@ -979,21 +1192,32 @@ class Score(object):
             for v in category:
                 q = q | Q(keydataset__category__name__iexact=v)
             queryset = queryset.filter(q).distinct()
+        return queryset
+
+    @classmethod
+    def all_countries(cls, request, countries=None):
+        """World scores, only of 'countries' (iso2) if given, see
+'ordd_api.parallel_scoring'."""
+        queryset = Dataset.objects.all()
+        if countries is not None:
+            queryset = queryset.filter(country__iso2__in=countries)
+        queryset = cls.filter_datasets(request, queryset)
 
         # check-point to investigate correctness of query filtering
         # print("Number of item: %d" % queryset.count())
 
         world_score_tree = cls.dataset_loadtree(request, queryset)
-        datasets_count = queryset.count()
+        datasets_count = sum(map(cls.tree_count, world_score_tree.values()))
         fullscores_queryset = queryset.filter(
             **fullscore_filterargs)
         world_fullscore_tree = cls.dataset_loadtree(
             request, fullscores_queryset)
-        fullscores_count = fullscores_queryset.count()
+        fullscores_count = sum(map(cls.tree_count,
+                                   world_fullscore_tree.values()))
 
         countries_count = len(world_score_tree)
 
-        categories = KeyCategory.objects.all().order_by('id')
+        categories = list(KeyCategory.objects.all().order_by('id'))
         categories_counters = []
         cat_cou = {}
         for cat in categories:
@@ -1026,7 +1250,8 @@ class Score(object):
             if country.iso2 not in world_score_tree:
                 continue
             else:
-                score = cls.country(world_score_tree[country.iso2], country)
+                score = cls.country(world_score_tree[country.iso2], country,
+                                    categories)
 
             ret_score.append({"country": country.iso2,
                               "score": cls.score_fmt(score)})
@@ -1056,58 +1281,47 @@ class Score(object):
             raise Http404()
         queryset = Dataset.objects.filter(
             country__iso2=country_id).order_by('keydataset__pk')
-        kqueryset = KeyDataset.objects.all().order_by('pk')
 
         applicability = request.query_params.getlist('applicability')
         category = request.query_params.getlist('category')
         if applicability:
             q = Q()
-            kq = Q()
             for v in applicability:
                 # FIXME currently in tag we may have extra applicabilities
                 # when category (tag group) is 'hazard'
                 q = q | (Q(keydataset__applicability__name__iexact=v) |
                          Q(tag__name__iexact=v))
-                kq = kq | Q(applicability__name__iexact=v)
 
             queryset = queryset.filter(q).distinct()
-            kqueryset = kqueryset.filter(kq).distinct()
 
         if category:
             q = Q()
-            kq = Q()
             for v in category:
                 q = q | Q(keydataset__category__name__iexact=v)
-                kq = kq | Q(category__name__iexact=v)
 
             queryset = queryset.filter(q).distinct()
-            kqueryset = kqueryset.filter(kq).distinct()
 
         th_applicability = set()
         for appl in country.thinkhazard_appl.all():
             th_applicability.add(appl.name)
 
         country_score_tree = OrderedDict()
-        for dataset in queryset:
-            cls.country_loadtree(request, country_score_tree, dataset,
+        dsname_set = set()
+        for dataset, tags in score_datasets(queryset):
+            cls.country_loadtree(request, country_score_tree, dataset, tags,
                                  th_applicability)
+            dsname_set.add(dataset.keydataset.dataset_id)
         country_fullscore_tree = OrderedDict()
         fullscore_queryset = queryset.filter(
                 **fullscore_filterargs)
-        for dataset in fullscore_queryset:
+        for dataset, tags in score_datasets(fullscore_queryset):
             cls.country_loadtree(request, country_fullscore_tree, dataset,
-                                 th_applicability)
+                                 tags, th_applicability)
 
-        datasets_count = queryset.count()
-        fullscores_count = fullscore_queryset.count()
+        datasets_count = cls.tree_count(country_score_tree)
+        fullscores_count = cls.tree_count(country_fullscore_tree)
         country_score = cls.country(country_score_tree, country)
 
-        interesting_fields = [
-            'is_existing', 'is_digital_form', 'is_avail_online',
-            'is_avail_online_meta', 'is_bulk_avail', 'is_machine_read',
-            'is_pub_available', 'is_avail_for_free', 'is_open_licence',
-            'is_prov_timely']
-
         categories = KeyCategory.objects.all().order_by('id')
         categories_counters = []
         cat_cou = {}
@@ -1137,19 +1351,15 @@ class Score(object):
         ret_score = ret['scores']
         ret_missing_datasets = ret['missing_datasets']
 
-        for int_field in interesting_fields:
+        for int_field in SCORE_ANSWERS:
             ret_score[0].append(Dataset._meta.get_field(
                 int_field).verbose_name)
 
         for _, category_score_tree in country_score_tree.items():
-            for _, keydataset_score_tree in category_score_tree['score'
-                                                                ].items():
-                dataset = keydataset_score_tree['dataset']
-                value = cls.score_fmt(keydataset_score_tree['value'])
-                row = [dataset.keydataset.code, dataset.keydataset.description,
-                       value]
-                for int_field in interesting_fields:
-                    row.append(getattr(dataset, int_field))
+            for _, record in category_score_tree['score'].items():
+                row = [record.code, record.description,
+                       cls.score_fmt(record.value)]
+                row.extend(record.answers)
 
                 ret_score.append(row)
 
@@ -1176,26 +1386,21 @@ class Score(object):
                                     'fullcount': fullcount,
                                     'notable': notable})
 
-        dsname_set = {x[0] for x in queryset.values_list(
-            'keydataset__dataset').distinct()}
-
-        if applicability or category:
-            kdn = KeyDatasetName.objects.filter(
-                keydatasets__in=kqueryset).distinct()
-        else:
-            kdn = KeyDatasetName.objects.all()
-
-        for dsname in kdn.exclude(
-                pk__in=dsname_set).order_by('category', 'name'):
-            ret_missing_datasets.append(
-                {"id": dsname.pk, "name": dsname.name,
-                 "category": dsname.category})
+        for dsname in taxonomy.get().dataset_names(
+                {v.lower() for v in applicability},
+                {v.lower() for v in category}):
+            if dsname['id'] not in dsname_set:
+                ret_missing_datasets.append(dict(dsname))
 
         return ret
 
     @classmethod
-    def all_countries_categories(cls, request):
+    def all_countries_categories(cls, request, countries=None):
+        """World scores by category, only of 'countries' (iso2) if given,
+see 'ordd_api.parallel_scoring'."""
         queryset = Dataset.objects.all()
+        if countries is not None:
+            queryset = queryset.filter(country__iso2__in=countries)
         applicability = request.query_params.getlist('applicability')
         if applicability:
             q = Q()
@@ -1206,7 +1411,7 @@ class Score(object):
                          Q(tag__name__iexact=v))
             queryset = queryset.filter(q).distinct()
 
-        categories = KeyCategory.objects.all().order_by('id')
+        categories = list(KeyCategory.objects.all().order_by('id'))
 
         world_score_tree = cls.dataset_loadtree(request, queryset)
 
@@ -1221,7 +1426,7 @@ class Score(object):
             else:
                 country_score_tree = world_score_tree[country.iso2]
                 country_score = cls.country(
-                    world_score_tree[country.iso2], country)
+                    world_score_tree[country.iso2], country, categories)
 
                 row = [country.iso2]
                 row.append(cls.score_fmt(country_score))
@@ -1237,14 +1442,94 @@ class Score(object):
 
         return ret
 
+    @classmethod
+    def score_stats(cls, scores):
+        """Mean, median, min and max of 'scores', None if empty."""
+        if not scores:
+            return None
+        return OrderedDict([('mean', cls.score_fmt(statistics.mean(scores))),
+                            ('median', cls.score_fmt(
+                                statistics.median(scores))),
+                            ('min', cls.score_fmt(min(scores))),
+                            ('max', cls.score_fmt(max(scores)))])
+
+    @classmethod
+    def all_regions(cls, request):
+        """Scores of the regions, statistics of the scores of their countries
+with datasets, overall and by category, in a single pass on the world
+score tree."""
+        queryset = cls.filter_datasets(request, Dataset.objects.all())
+        world_score_tree = cls.dataset_loadtree(request, queryset)
+        categories = list(KeyCategory.objects.all().order_by('id'))
+
+        regions = OrderedDict()
+        for country in Country.objects.select_related('region').order_by(
+                'region__name', 'name'):
+            if country.iso2 not in world_score_tree:
+                continue
+            country_score_tree = world_score_tree[country.iso2]
+            if country.region.name not in regions:
+                regions[country.region.name] = (
+                    [], {category.code: [] for category in categories})
+            scores, categories_scores = regions[country.region.name]
+
+            scores.append(cls.country(country_score_tree, country,
+                                      categories))
+            for category in categories:
+                if category.code in country_score_tree:
+                    categories_scores[category.code].append(
+                        cls.category(category, country_score_tree))
+
+        ret = {'regions': []}
+        for name, (scores, categories_scores) in regions.items():
+            ret['regions'].append({
+                'region': name,
+                'countries_count': len(scores),
+                'score': cls.score_stats(scores),
+                'categories': [
+                    {'category': category.name,
+                     'countries_count': len(categories_scores[
+                         category.code]),
+                     'score': cls.score_stats(categories_scores[
+                         category.code])}
+                    for category in categories]})
+        return ret
+
+
+def stored_scoring_response(request, payload, computed):
+    """Response of a scoring rendered when computed at 'computed', served
+as stored when json is requested."""
+    if isinstance(request.accepted_renderer, JSONRenderer):
+        response = HttpResponse(
+            payload, content_type=request.accepted_renderer.media_type)
+    else:
+        response = Response(json.loads(payload.decode('utf-8')))
+    response['Last-Modified'] = http_date(computed.timestamp())
+    return response
+
+
+def world_scoring(request, name):
+    """Response of the world scoring 'name' (a Score method); with
+ORDD_SCORING_BACKGROUND the unfiltered one is the last computed, see
+'ordd_api.recompute'."""
+    filters = scoring_filters(request.query_params)
+    compute = partial(getattr(Score, name), request)
+    if any(filters) or not background_enabled():
+        return Response(cached_score(name, [], filters, compute))
+
+    stored = world_scores(name)
+    if stored is None:
+        stored = store_world_scores(
+            name, cached_score(name, [], filters, compute))
+    return stored_scoring_response(request, *stored)
+
 
 class ScoringWorldGet(APIView):
     """This view return the list of country with dataset instances and
  their scores"""
 
     def get(self, request):
-        ret = Score.all_countries(request)
-        return Response(ret)
+        return world_scoring(request, 'all_countries')
 
 
 class ScoringCountryDetailsGet(APIView):
@@ -1252,13 +1537,29 @@ class ScoringCountryDetailsGet(APIView):
 country with related scores"""
 
     def get(self, request, country_id):
-        ret = Score.country_details(request, country_id)
-        return Response(ret)
+        filters = scoring_filters(request.query_params)
+        if any(filters):
+            ret = cached_score('country_details', [country_id], filters,
+                               lambda: Score.country_details(request,
+                                                             country_id))
+            return Response(ret)
+
+        # unfiltered details are materialized per country
+        payload, computed = materialized_country_details(
+            country_id, lambda: Score.country_details(request, country_id))
+        return stored_scoring_response(request, payload, computed)
+
+
+class ScoringRegionsGet(APIView):
+    """This view return the list of regions with the statistics of the
+scores of their countries, overall and for each category"""
+
+    def get(self, request):
+        return world_scoring(request, 'all_regions')
 
 
 class ScoringWorldCategoriesGet(APIView):
     """This view return the list of countries with score for each category"""
 
     def get(self, request):
-        ret = Score.all_countries_categories(request)
-        return Response(ret)
+        return world_scoring(request, 'all_countries_categories')